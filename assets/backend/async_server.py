@@ -0,0 +1,498 @@
+# async_server.py - ASGI variant of server.py
+#
+# Serves the same routes and JSON contracts as server.py, but Gemini and
+# Vision calls are awaited instead of blocking a worker thread, so one
+# worker can hold many slow upstream calls at once. CPU-bound work
+# (yield prediction, pandas filtering) runs in the default thread pool.
+#
+# Run with any ASGI server, e.g.:
+#   hypercorn async_server:app --bind 0.0.0.0:5000
+import json
+import asyncio
+import logging
+from quart import Quart, Response, request, jsonify
+from quart_cors import cors
+from subsystems import (advisor, disease_info, predictor, nutrition, vision_async_client, disease_classifier, warm_up,
+                        health_status, predict_one_async, image_preprocessor, detect_cache, detect_labels_async,
+                        WARMUP_SUBSYSTEMS, DETECT_ENGINE)
+from image_preprocessing import UploadTooLarge, MAX_REQUEST_BYTES
+import single_flight
+import structured_output
+import upstream
+import metrics
+import meal_plan_engine
+from disease_classifier import DEFAULT_TOP_K
+from yield_sweep import parse_sweep, sweep_payload, SWEEP_FORMATS
+
+app = cors(Quart(__name__))  # Enable CORS for all routes
+# Quart's own default (16 MB) would refuse uploads the /detect limit allows
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+metrics.instrument_quart(app)
+
+# Upper bound on records accepted by /predict/batch in a single request
+MAX_BATCH_RECORDS = 10000
+
+# Upper bound on plans generated by /generate-meal-plan/batch in a single request
+MAX_BATCH_PLANS = 1000
+
+# Upper bound on distinct recipes generated by /suggest-recipes/batch in a single request
+MAX_BATCH_RECIPES = 100
+
+# Same as server.py, but warm the async Vision client instead of the sync one
+ASYNC_WARMUP_SUBSYSTEMS = ','.join('vision_async' if name.strip() == 'vision' else name
+                                   for name in WARMUP_SUBSYSTEMS.split(','))
+
+
+async def _ready(subsystem):
+    """
+    Get a subsystem without blocking the event loop while it initializes
+    """
+    if subsystem.ready:
+        return subsystem.get()
+    return await asyncio.to_thread(subsystem.get)
+
+
+@app.before_serving
+async def start_warmup():
+    warm_up(ASYNC_WARMUP_SUBSYSTEMS)
+
+
+@app.errorhandler(413)
+async def request_too_large(e):
+    return jsonify({'error': f"Request exceeds {MAX_REQUEST_BYTES} bytes"}), 413
+
+
+@app.route('/recommendations', methods=['POST'])
+async def get_recommendations():
+    data = await request.get_json()
+
+    if not data or 'location' not in data or 'crop_type' not in data:
+        return jsonify({'error': 'Missing required fields: location and crop_type'}), 400
+
+    try:
+        recommendations = await (await _ready(advisor)).get_climate_smart_recommendations_async(
+            location=data['location'],
+            crop_type=data['crop_type'],
+            climate_challenge=data.get('climate_challenge')
+        )
+        return jsonify(recommendations)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _stream_response(events):
+    """
+    Send section events as NDJSON, or as server-sent events with ?format=sse
+
+    A failure partway through ends the stream with an error event (an SSE
+    "error" event), so clients can tell it from a finished stream.
+    """
+    sse = request.args.get('format') == 'sse'
+
+    async def body():
+        try:
+            async for event in events:
+                yield f"data: {json.dumps(event)}\n\n" if sse else json.dumps(event) + "\n"
+        except Exception as e:
+            app.logger.error(f"Stream failed: {str(e)}")
+            event = {'error': str(e), 'done': True}
+            yield f"event: error\ndata: {json.dumps(event)}\n\n" if sse else json.dumps(event) + "\n"
+
+    return Response(body(), mimetype='text/event-stream' if sse else 'application/x-ndjson')
+
+@app.route('/recommendations/stream', methods=['POST'])
+async def stream_recommendations():
+    data = await request.get_json()
+
+    if not data or 'location' not in data or 'crop_type' not in data:
+        return jsonify({'error': 'Missing required fields: location and crop_type'}), 400
+
+    try:
+        events = (await _ready(advisor)).stream_climate_smart_recommendations_async(
+            location=data['location'],
+            crop_type=data['crop_type'],
+            climate_challenge=data.get('climate_challenge')
+        )
+        return _stream_response(events)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/adaptation_strategies', methods=['POST'])
+async def get_adaptation_strategies():
+    data = await request.get_json()
+
+    if not data or 'location' not in data or 'climate_challenge' not in data:
+        return jsonify({'error': 'Missing required fields: location and climate_challenge'}), 400
+
+    try:
+        strategies = await (await _ready(advisor)).get_specific_adaptation_strategy_async(
+            location=data['location'],
+            climate_challenge=data['climate_challenge']
+        )
+        return jsonify(strategies)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/farming_calendar', methods=['POST'])
+async def get_farming_calendar():
+    data = await request.get_json()
+
+    if not data or 'location' not in data or 'crop_type' not in data:
+        return jsonify({'error': 'Missing required fields: location and crop_type'}), 400
+
+    try:
+        calendar = await (await _ready(advisor)).get_sustainable_farming_calendar_async(
+            location=data['location'],
+            crop_type=data['crop_type']
+        )
+        return jsonify(calendar)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/farming_calendar/stream', methods=['POST'])
+async def stream_farming_calendar():
+    data = await request.get_json()
+
+    if not data or 'location' not in data or 'crop_type' not in data:
+        return jsonify({'error': 'Missing required fields: location and crop_type'}), 400
+
+    try:
+        events = (await _ready(advisor)).stream_sustainable_farming_calendar_async(
+            location=data['location'],
+            crop_type=data['crop_type']
+        )
+        return _stream_response(events)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/recommendations/by-coordinates', methods=['POST'])
+async def get_recommendations_by_coordinates():
+    data = await request.get_json()
+
+    if not data or 'latitude' not in data or 'longitude' not in data or 'crop_type' not in data:
+        return jsonify({'error': 'Missing required fields: latitude, longitude, and crop_type'}), 400
+
+    try:
+        recommendations = await (await _ready(advisor)).get_climate_smart_recommendations_by_coordinates_async(
+            latitude=data['latitude'],
+            longitude=data['longitude'],
+            crop_type=data['crop_type'],
+            climate_challenge=data.get('climate_challenge')
+        )
+        return jsonify(recommendations)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/disease_info', methods=['POST'])
+async def get_plant_disease_info():
+    data = await request.get_json()
+
+    if not data or 'disease_name' not in data:
+        return jsonify({'error': 'Missing required field: disease_name'}), 400
+
+    try:
+        result = await (await _ready(disease_info)).get_disease_information_async(
+            disease_name=data['disease_name']
+        )
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/recommend-foods', methods=['POST'])
+async def api_recommend_foods():
+    try:
+        data = await request.get_json()
+        planner = await _ready(nutrition)
+        filtered = await asyncio.to_thread(
+            planner.food_db.catalog.recommend_foods,
+            dietary_preference=data.get('dietary_preference'),
+            min_sustainability_score=data.get('min_sustainability_score', 0),
+        )
+        return jsonify({'success': True, 'data': filtered.to_dict('records')})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/generate-meal-plan', methods=['POST'])
+async def api_generate_meal_plan():
+    try:
+        data = await request.get_json()
+        planner = await _ready(nutrition)
+        meal_plan = await asyncio.to_thread(
+            meal_plan_engine.plan_meals,
+            planner.food_db.catalog,
+            **meal_plan_engine.plan_options(data)
+        )
+        return jsonify({'success': True, 'data': meal_plan})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/generate-meal-plan/batch', methods=['POST'])
+async def api_generate_meal_plan_batch():
+    try:
+        data = await request.get_json()
+        plans = data['requests']
+        if not isinstance(plans, list):
+            return jsonify({'success': False, 'error': 'requests must be a list'}), 400
+        if len(plans) > MAX_BATCH_PLANS:
+            return jsonify({'success': False, 'error': f'Too many requests: {len(plans)} (max {MAX_BATCH_PLANS})'}), 400
+        planner = await _ready(nutrition)
+        results = await asyncio.to_thread(
+            meal_plan_engine.plan_meals_batch, planner.food_db.catalog, plans, seed=data.get('seed')
+        )
+        return jsonify({'success': True, 'data': results})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/suggest-recipe', methods=['POST'])
+async def api_suggest_recipe():
+    try:
+        data = await request.get_json()
+        planner = await _ready(nutrition)
+        recipe = await planner.suggest_recipes_async(
+            data['ingredient'],
+            data['meal_type'],
+        )
+        return jsonify({'success': True, 'data': recipe})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/suggest-recipes/batch', methods=['POST'])
+async def api_suggest_recipes_batch():
+    try:
+        data = await request.get_json()
+        planner = await _ready(nutrition)
+        pairs = planner.meal_plan_pairs(data['meal_plan'])
+        if len(pairs) > MAX_BATCH_RECIPES:
+            return jsonify({'success': False, 'error': f'Too many distinct meals: {len(pairs)} (max {MAX_BATCH_RECIPES})'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    async def events():
+        async for event in planner.suggest_recipes_batch_async(pairs):
+            yield event
+        yield {'done': True, 'recipes': len(pairs)}
+
+    return _stream_response(events())
+
+@app.route('/predict', methods=['POST'])
+async def predict():
+    try:
+        data = await request.get_json()
+
+        required_fields = [
+            'Area', 'Item', 'Year',
+            'average_rain_fall_mm_per_year',
+            'pesticides_tonnes',
+            'avg_temp'
+        ]
+
+        for field in required_fields:
+            if field not in data:
+                return jsonify({
+                    'error': f'Missing required field: {field}',
+                    'status': 'error'
+                }), 400
+
+        try:
+            input_data = {
+                'Area': str(data['Area']),
+                'Item': str(data['Item']),
+                'Year': int(data['Year']),
+                'average_rain_fall_mm_per_year': float(data['average_rain_fall_mm_per_year']),
+                'pesticides_tonnes': float(data['pesticides_tonnes']),
+                'avg_temp': float(data['avg_temp'])
+            }
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': f'Invalid input data: {e}', 'status': 'error'}), 400
+
+        yield_prediction, model_version = await predict_one_async(input_data)
+
+        return jsonify({
+            'yield': yield_prediction,
+            'model_version': model_version,
+            'status': 'success'
+        })
+
+    except ValueError as e:
+        logging.error(f"ValueError: {e}")
+        return jsonify({'error': str(e), 'status': 'error'}), 400
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return jsonify({'error': 'Internal server error', 'status': 'error'}), 500
+
+@app.route('/predict/batch', methods=['POST'])
+async def predict_batch():
+    try:
+        data = await request.get_json()
+
+        if not data or 'records' not in data:
+            return jsonify({'error': 'Missing required field: records', 'status': 'error'}), 400
+
+        records = data['records']
+        if not isinstance(records, (list, dict)):
+            return jsonify({'error': 'records must be a list or a columnar object', 'status': 'error'}), 400
+
+        count = len(records) if isinstance(records, list) else max((len(v) for v in records.values()), default=0)
+        if count > MAX_BATCH_RECORDS:
+            return jsonify({
+                'error': f'Too many records: {count} (max {MAX_BATCH_RECORDS})',
+                'status': 'error'
+            }), 400
+
+        options = {}
+        if 'chunk_size' in data:
+            options['chunk_size'] = int(data['chunk_size'])
+        results, model_version = await asyncio.to_thread(
+            (await _ready(predictor)).predict_yield_batch, records, with_version=True, **options)
+
+        return jsonify({
+            'results': results,
+            'count': len(results),
+            'failed': sum(1 for r in results if 'error' in r),
+            'model_version': model_version,
+            'status': 'success'
+        })
+
+    except (ValueError, TypeError) as e:
+        logging.error(f"Batch input error: {e}")
+        return jsonify({'error': str(e), 'status': 'error'}), 400
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return jsonify({'error': 'Internal server error', 'status': 'error'}), 500
+
+@app.route('/predict/sweep', methods=['POST'])
+async def predict_sweep():
+    try:
+        data = await request.get_json()
+        if not data:
+            return jsonify({'error': 'Missing request body', 'status': 'error'}), 400
+
+        output_format = data.get('format', 'json')
+        if output_format not in SWEEP_FORMATS:
+            return jsonify({'error': f'Invalid format. Choose one of: {", ".join(SWEEP_FORMATS)}', 'status': 'error'}), 400
+
+        axes = parse_sweep(data)
+        grid = await asyncio.to_thread((await _ready(predictor)).predict_yield_grid, data['Area'], data['Item'], axes)
+        payload, mimetype = await asyncio.to_thread(sweep_payload, grid, axes, output_format)
+        if output_format == 'json':
+            return jsonify(payload)
+        return Response(payload, mimetype=mimetype)
+
+    except ValueError as e:
+        logging.error(f"Sweep input error: {e}")
+        return jsonify({'error': str(e), 'status': 'error'}), 400
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return jsonify({'error': 'Internal server error', 'status': 'error'}), 500
+
+@app.route('/model/reload', methods=['POST'])
+async def reload_model():
+    """
+    Load a yield-model version in the background and swap it in once warmed up
+
+    Optional body {"version": "..."}; defaults to the version CURRENT points
+    at. Poll /health (model.reload) for the outcome.
+    """
+    data = await request.get_json(silent=True) or {}
+    try:
+        # Only published versions; the id becomes a path under the model directory
+        status = (await _ready(predictor)).reload(data.get('version'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'reload': status, 'model_version': predictor.get().version, 'status': 'accepted'}), 202
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    return jsonify(health_status())
+
+@app.route('/cache/stats', methods=['GET'])
+async def cache_stats():
+    caches = {}
+    if advisor.ready:
+        caches['advisor'] = advisor.get().cache.stats()
+        caches['region_cells'] = advisor.get().regions.stats()
+        caches['advisor_pregenerated'] = advisor.get().pregenerated.stats()
+    if predictor.ready and predictor.get().cache is not None:
+        caches['prediction'] = predictor.get().cache.stats()
+    if nutrition.ready:
+        caches['recipes'] = nutrition.get().recipe_cache.stats()
+    return jsonify(caches)
+
+@app.route('/coalescing/stats', methods=['GET'])
+async def coalescing_stats():
+    return jsonify(single_flight.all_stats())
+
+@app.route('/parsing/stats', methods=['GET'])
+async def parsing_stats():
+    return jsonify(structured_output.all_stats())
+
+@app.route('/upstream/stats', methods=['GET'])
+async def upstream_stats():
+    return jsonify(upstream.all_stats())
+
+@app.route('/metrics', methods=['GET'])
+async def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/detect/stats', methods=['GET'])
+async def detect_stats():
+    """
+    Upload preprocessing totals (bytes saved, duplicates, time per stage) and label cache hits
+    """
+    return jsonify({'preprocessing': image_preprocessor.stats(), 'labels': detect_cache.stats()})
+
+@app.route('/detect', methods=['POST'])
+async def detect():
+    files = await request.files
+    if 'file' not in files:
+        return jsonify({'error': 'No file uploaded'}), 400
+
+    try:
+        file = files['file']
+        # Hashing, decoding and re-encoding are CPU work; keep them off the event loop
+        image = await asyncio.to_thread(image_preprocessor.prepare, file.stream)
+
+        app.logger.info(f"File received: {file.filename}, size: {image.original_bytes} bytes, "
+                        f"sending {image.sent_bytes} bytes")
+
+        if request.args.get('engine', DETECT_ENGINE) == 'local':
+            try:
+                top_k = int(request.args.get('top_k', DEFAULT_TOP_K))
+
+                async def classify():
+                    return await (await _ready(disease_classifier)).classify_async(image.content, top_k=top_k)
+
+                labels = await detect_labels_async(image, 'local', top_k, classify)
+                return jsonify({'labels': labels, 'engine': 'local'})
+            except Exception as e:
+                app.logger.warning(f"Local classifier failed, falling back to Vision API: {str(e)}")
+
+        async def label_detection():
+            from google.cloud import vision
+            client = await _ready(vision_async_client)
+            with metrics.stage('upstream'):
+                response = await client.batch_annotate_images(requests=[
+                    vision.AnnotateImageRequest(
+                        image=vision.Image(content=image.content),
+                        features=[vision.Feature(type_=vision.Feature.Type.LABEL_DETECTION)]
+                    )
+                ])
+            labels = response.responses[0].label_annotations
+            return [{'description': label.description, 'score': label.score} for label in labels]
+
+        try:
+            results = await detect_labels_async(image, 'vision', None, label_detection)
+            return jsonify({'labels': results})
+        except Exception as e:
+            app.logger.error(f"Vision API error: {str(e)}")
+            return jsonify({'error': f"Vision API error: {str(e)}"}), 500
+
+    except UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except Exception as e:
+        app.logger.error(f"File processing error: {str(e)}")
+        return jsonify({'error': f"File processing error: {str(e)}"}), 500
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,709 @@
+# benchmarks.py - Micro-benchmarks for the backend's hot paths
+#
+# Run from the repository root, e.g.:
+#   python assets/backend/benchmarks.py yield-engine
+import os
+import sys
+import json
+import time
+import subprocess
+import argparse
+import itertools
+import statistics
+import numpy as np
+
+MODEL_PATH = 'assets/models/crop_yield_model'
+
+
+def _time_calls(fn, repeats, warmup=10):
+    """
+    Call fn repeats times and return per-call latencies in microseconds
+    """
+    for _ in range(warmup):
+        fn()
+
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return latencies
+
+
+def _summary(name, latencies):
+    ordered = sorted(latencies)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f"{name:<32} p50={statistics.median(ordered):10.1f}us  p99={p99:10.1f}us  n={len(ordered)}")
+
+
+def bench_yield_engine(args):
+    """
+    Single-row forward pass latency: NumPy export vs Keras model.predict
+    """
+    import joblib
+    from numpy_yield_model import NumpyYieldModel, NUMPY_MODEL_FILE
+
+    scaler = joblib.load(os.path.join(args.model_path, 'scaler.joblib'))
+    row = np.asarray(scaler.mean_, dtype=np.float32).reshape(1, -1)
+
+    numpy_model = NumpyYieldModel.load(os.path.join(args.model_path, NUMPY_MODEL_FILE))
+    _summary('numpy forward (1 row)', _time_calls(lambda: numpy_model.predict(row), args.repeats))
+
+    if args.skip_keras:
+        return
+
+    import tensorflow as tf
+    keras_model = tf.keras.models.load_model(os.path.join(args.model_path, 'model.keras'))
+    scaled = scaler.transform(row)
+    _summary('keras predict (1 row)', _time_calls(
+        lambda: keras_model.predict(scaled, verbose=0), max(1, args.repeats // 10)))
+
+
+_STARTUP_PROBE = '''
+import json, time
+start = time.perf_counter()
+import server, subsystems
+client = server.app.test_client()
+response = client.get('/health')
+first_response = time.perf_counter() - start
+ready = None
+if {wait_ready}:
+    while True:
+        health = client.get('/health').get_json()['subsystems']
+        warmed = [name.strip() for name in subsystems.WARMUP_SUBSYSTEMS.split(',') if name.strip() in health]
+        states = [health[name]['state'] for name in warmed]
+        if all(state in ('ready', 'failed') for state in states):
+            ready = time.perf_counter() - start
+            break
+        time.sleep(0.05)
+print(json.dumps({{'status_code': response.status_code, 'first_response': first_response, 'all_settled': ready}}))
+'''
+
+
+def bench_startup(args):
+    """
+    Time from process start to the first /health response, in a fresh interpreter
+    """
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=backend_dir + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    if args.no_warmup:
+        env['WARMUP_SUBSYSTEMS'] = ''
+
+    code = _STARTUP_PROBE.format(wait_ready=bool(args.wait_ready) and not args.no_warmup)
+    runs = []
+    for _ in range(args.startup_runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+        wall = time.perf_counter() - start
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        result['process_wall'] = wall
+        runs.append(result)
+        print(f"first /health: {result['first_response'] * 1000:8.1f}ms  "
+              f"process: {wall * 1000:8.1f}ms  status={result['status_code']}"
+              + (f"  all subsystems settled: {result['all_settled']:.2f}s" if result['all_settled'] else ''))
+
+    print(f"median time-to-first-response: {statistics.median(r['first_response'] for r in runs) * 1000:.1f}ms")
+
+
+class _StubAdvisor:
+    """
+    Local stand-in for ClimateSmartFarmingAdvisor with a fixed upstream latency
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def _result(self, location, crop_type):
+        return {'region': location, 'crop': crop_type, 'adaptation_strategies': []}
+
+    def get_climate_smart_recommendations(self, location, crop_type, climate_challenge=None):
+        time.sleep(self.latency)
+        return self._result(location, crop_type)
+
+    async def get_climate_smart_recommendations_async(self, location, crop_type, climate_challenge=None):
+        import asyncio
+        await asyncio.sleep(self.latency)
+        return self._result(location, crop_type)
+
+
+def bench_async_load(args):
+    """
+    Requests/second at fixed concurrency against stubbed upstreams:
+    the Flask app on a fixed-size thread pool vs the ASGI app on one event loop
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Keep real backends from loading; the stub is installed below
+    os.environ['WARMUP_SUBSYSTEMS'] = ''
+    import subsystems
+    subsystems.advisor.replace(_StubAdvisor(args.stub_latency))
+
+    payloads = [{'location': f'Region {i % 50}', 'crop_type': 'Maize'} for i in range(args.requests)]
+
+    import server
+    flask_client = server.app.test_client()
+
+    def flask_call(payload):
+        return flask_client.post('/recommendations', json=payload).status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        statuses = list(pool.map(flask_call, payloads))
+    elapsed = time.perf_counter() - start
+    print(f"flask  threads={args.threads:<4} concurrency={args.concurrency:<4} "
+          f"{len(payloads) / elapsed:8.1f} req/s  errors={sum(s != 200 for s in statuses)}")
+
+    import async_server
+    quart_client = async_server.app.test_client()
+
+    async def run_async():
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def call(payload):
+            async with semaphore:
+                response = await quart_client.post('/recommendations', json=payload)
+                return response.status_code
+
+        return await asyncio.gather(*(call(p) for p in payloads))
+
+    start = time.perf_counter()
+    statuses = asyncio.run(run_async())
+    elapsed = time.perf_counter() - start
+    print(f"asgi   threads=1    concurrency={args.concurrency:<4} "
+          f"{len(payloads) / elapsed:8.1f} req/s  errors={sum(s != 200 for s in statuses)}")
+
+
+def _synthetic_foods(size, seed=0):
+    """
+    Food database with the same columns as the Google Sheet
+    """
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    words = ['rice', 'lentil', 'peanut', 'tofu', 'salmon', 'wheat', 'oat', 'bean', 'milk', 'egg',
+             'kale', 'quinoa', 'shrimp', 'almond', 'soy', 'maize', 'cassava', 'yam', 'chickpea', 'barley']
+    tag_sets = ['Vegan, Vegetarian, Gluten-Free', 'Vegetarian', 'Pescatarian', 'Vegan', 'Gluten-Free',
+                'Vegetarian, Gluten-Free', 'None']
+    picks = rng.integers(0, len(words), size=(size, 3))
+    return pd.DataFrame({
+        'Food Name': [f"{words[a].title()} {words[b]} {words[c]} bowl {i}" for i, (a, b, c) in enumerate(picks)],
+        'Dietary Tags': [tag_sets[t] for t in rng.integers(0, len(tag_sets), size)],
+        'Sustainability Score': rng.integers(0, 101, size),
+        'Calories': rng.integers(50, 1200, size),
+    })
+
+
+def bench_food_catalog(args):
+    """
+    Meal-plan filtering: pandas path vs the precomputed FoodCatalog
+    """
+    from food_catalog import FoodCatalog, recommend_foods, filter_allergies, filter_nutrition
+
+    df = _synthetic_foods(args.catalog_size)
+
+    start = time.perf_counter()
+    catalog = FoodCatalog(df)
+    print(f"catalog build ({args.catalog_size} items): {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    queries = [
+        ('Vegan', ['peanut', 'soy'], 600, 50),
+        ('Gluten-Free', [], None, 80),
+        (None, ['shrimp'], 400, 0),
+    ]
+    repeats = max(1, args.repeats // 100)
+
+    for dietary, allergies, max_calories, min_score in queries:
+        def pandas_path():
+            filtered = recommend_foods(df, dietary, min_score)
+            filtered = filter_allergies(filtered, allergies)
+            filtered = filter_nutrition(filtered, max_calories=max_calories)
+            return filtered["Food Name"].tolist()
+
+        def catalog_path():
+            return catalog.food_names(catalog.filter_rows(dietary, allergies, max_calories, min_score))
+
+        # Same foods must come back from both paths
+        assert sorted(pandas_path()) == sorted(catalog_path())
+
+        label = f"{dietary}/{','.join(allergies) or '-'}/{max_calories}/{min_score}"
+        _summary(f"pandas  {label}", _time_calls(pandas_path, repeats, warmup=2))
+        _summary(f"catalog {label}", _time_calls(catalog_path, repeats, warmup=2))
+
+
+def bench_meal_plan(args):
+    """
+    Weekly plans: per-meal random.choice vs the vectorized plan engine
+    """
+    import random
+    from food_catalog import FoodCatalog
+    from meal_plan_engine import plan_meals, plan_meals_batch
+
+    catalog = FoodCatalog(_synthetic_foods(args.catalog_size))
+    options = {'dietary_preference': 'Vegan', 'allergies': ['peanut'], 'duration': 'weekly'}
+    repeats = max(1, args.repeats // 10)
+
+    def choice_path():
+        names = catalog.food_names(catalog.filter_rows('Vegan', ['peanut']))
+        return {f"Day {day}:": {meal: random.choice(names) for meal in ("Breakfast", "Lunch", "Dinner")}
+                for day in range(1, 8)}
+
+    _summary("random.choice weekly", _time_calls(choice_path, repeats, warmup=2))
+    _summary("engine weekly", _time_calls(lambda: plan_meals(catalog, **options, seed=1), repeats, warmup=2))
+
+    constrained = dict(options, daily_calorie_budget=1500, max_repeats=1, objective='sustainability')
+    plan = plan_meals(catalog, **constrained, seed=1)
+    assert plan == plan_meals(catalog, **constrained, seed=1)
+    _summary("engine weekly, budget+repeats+sustainability",
+             _time_calls(lambda: plan_meals(catalog, **constrained, seed=1), repeats, warmup=2))
+
+    users = [dict(options, daily_calorie_budget=1500 + 10 * i, max_repeats=2) for i in range(args.requests)]
+    start = time.perf_counter()
+    results = plan_meals_batch(catalog, users, seed=7)
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for r in results if not r['success'])
+    print(f"batch of {len(users)} constrained weekly plans: {elapsed * 1000:.1f}ms "
+          f"({len(users) / elapsed:.0f} plans/s, {failed} infeasible)")
+
+
+def _synthetic_photos(count, size=(1024, 768), seed=0):
+    """
+    JPEG-encoded camera-sized images for the disease classifier
+    """
+    import io
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    photos = []
+    for _ in range(count):
+        # Smooth random colour field upscaled from a coarse grid, so JPEG sizes are realistic
+        coarse = rng.integers(0, 256, size=(12, 16, 3), dtype=np.uint8)
+        image = Image.fromarray(coarse).resize(size, Image.BICUBIC)
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=90)
+        photos.append(buffer.getvalue())
+    return photos
+
+
+def bench_detect(args):
+    """
+    Local TFLite disease classifier throughput: one image per invocation vs micro-batched
+    """
+    from disease_classifier import DiseaseClassifier
+
+    photos = _synthetic_photos(args.images)
+    print(f"{len(photos)} photos, mean {sum(map(len, photos)) / len(photos) / 1024:.0f}KB")
+
+    unbatched = DiseaseClassifier(max_batch_size=1, decode_workers=1)
+    unbatched.classify(photos[0])
+    start = time.perf_counter()
+    for photo in photos:
+        unbatched.classify(photo)
+    elapsed = time.perf_counter() - start
+    print(f"sequential, batch 1      : {len(photos) / elapsed:7.1f} images/s")
+
+    for batch_size in (1, 8, 16):
+        classifier = DiseaseClassifier(max_batch_size=batch_size)
+        classifier.classify(photos[0])
+        start = time.perf_counter()
+        futures = [classifier.submit(photo) for photo in photos]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - start
+        stats = classifier.stats()
+        print(f"concurrent, max batch {batch_size:2d}: {len(photos) / elapsed:7.1f} images/s "
+              f"(mean batch {stats['mean_batch']})")
+
+
+def bench_predict_batching(args):
+    """
+    Concurrent /predict calls: one predict_yield per request vs the micro-batcher
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from crop_predictor import CropYieldPredictor
+    from micro_batcher import MicroBatcher
+
+    backends = ['numpy'] if args.skip_keras else ['numpy', 'keras']
+    for backend in backends:
+        model = CropYieldPredictor(model_path=args.model_path, backend=backend)
+        areas, items = model.area_encoder.classes_, model.item_encoder.classes_
+        rng = np.random.default_rng(0)
+        records = [{
+            'Area': str(areas[rng.integers(len(areas))]),
+            'Item': str(items[rng.integers(len(items))]),
+            'Year': int(rng.integers(1990, 2014)),
+            'average_rain_fall_mm_per_year': float(rng.uniform(50, 3000)),
+            'pesticides_tonnes': float(rng.uniform(0, 1e5)),
+            'avg_temp': float(rng.uniform(5, 30)),
+        } for _ in range(args.requests if backend == 'numpy' else min(args.requests, 200))]
+
+        def run(records):
+            return [r['yield'] if 'yield' in r else ValueError(r['error'])
+                    for r in model.predict_yield_batch(records)]
+
+        batcher = MicroBatcher('bench', run, args.batch_size, args.max_wait_ms)
+        for label, call in (('per-request', model.predict_yield), ('batched', batcher.call)):
+            def timed(record):
+                start = time.perf_counter()
+                call(record)
+                return (time.perf_counter() - start) * 1e6
+
+            call(records[0])
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.threads) as pool:
+                latencies = list(pool.map(timed, records))
+            elapsed = time.perf_counter() - start
+            _summary(f"{backend} {label} ({args.threads} clients)", latencies)
+            print(f"  throughput {len(records) / elapsed:.0f} req/s")
+        print(f"  batcher: {batcher.stats()}")
+
+
+def bench_features(args):
+    """
+    Per-call preprocessing: DataFrame + LabelEncoder + StandardScaler vs FeaturePipeline
+    """
+    import joblib
+    import pandas as pd
+    from crop_predictor import FEATURES
+    from feature_pipeline import FeaturePipeline
+
+    scaler = joblib.load(os.path.join(args.model_path, 'scaler.joblib'))
+    encoders = joblib.load(os.path.join(args.model_path, 'encoders.joblib'))
+    area_encoder, item_encoder = encoders['area_encoder'], encoders['item_encoder']
+    pipeline = FeaturePipeline(area_encoder, item_encoder, scaler)
+
+    rng = np.random.default_rng(0)
+    records = [{
+        'Area': str(area_encoder.classes_[rng.integers(len(area_encoder.classes_))]),
+        'Item': str(item_encoder.classes_[rng.integers(len(item_encoder.classes_))]),
+        'Year': int(rng.integers(1990, 2014)),
+        'average_rain_fall_mm_per_year': float(rng.uniform(50, 3000)),
+        'pesticides_tonnes': float(rng.uniform(0, 1e5)),
+        'avg_temp': float(rng.uniform(5, 30)),
+    } for _ in range(1000)]
+
+    def pandas_path(rows):
+        input_df = pd.DataFrame(rows)
+        input_df['Area_encoded'] = area_encoder.transform(input_df['Area'])
+        input_df['Item_encoded'] = item_encoder.transform(input_df['Item'])
+        return scaler.transform(input_df[FEATURES])
+
+    # Same model inputs, up to float32 rounding
+    expected = pandas_path(records)
+    actual = pipeline.transform(records)
+    error = float(np.max(np.abs(actual - expected)))
+    print(f"max abs difference vs pandas path: {error:.2e}")
+    assert error < 1e-4
+
+    _summary('pandas/sklearn (1 row)', _time_calls(lambda: pandas_path(records[:1]), args.repeats))
+    _summary('pipeline (1 row)', _time_calls(lambda: pipeline.transform(records[:1]), args.repeats))
+    repeats = max(1, args.repeats // 10)
+    _summary('pandas/sklearn (1000 rows)', _time_calls(lambda: pandas_path(records), repeats))
+    _summary('pipeline (1000 rows)', _time_calls(lambda: pipeline.transform(records), repeats))
+
+
+def bench_sweep(args):
+    """
+    Scenario grid: one predict_yield per point vs predict_yield_grid
+    """
+    from crop_predictor import CropYieldPredictor
+    from yield_sweep import parse_sweep
+
+    model = CropYieldPredictor(model_path=args.model_path, backend='numpy')
+    request = {
+        'Area': 'India', 'Item': 'Maize',
+        'Year': {'start': 1990, 'stop': 2013, 'step': 1},
+        'average_rain_fall_mm_per_year': {'start': 0, 'stop': 3000, 'num': 100},
+        'pesticides_tonnes': [0, 1000, 10000, 100000],
+        'avg_temp': {'start': 0, 'stop': 35, 'num': 100},
+    }
+    axes = parse_sweep(request)
+
+    start = time.perf_counter()
+    grid = model.predict_yield_grid(request['Area'], request['Item'], axes)
+    elapsed = time.perf_counter() - start
+    print(f"grid {grid.shape} = {grid.size} points: {elapsed * 1000:.0f}ms ({grid.size / elapsed:,.0f} points/s)")
+
+    # Spot-check the grid against single predictions and time the per-point path
+    rng = np.random.default_rng(0)
+    points = [tuple(int(rng.integers(n)) for n in grid.shape) for _ in range(200)]
+    start = time.perf_counter()
+    for point in points:
+        record = {'Area': 'India', 'Item': 'Maize'}
+        record.update({field: float(axes[field][i]) for field, i in zip(axes, point)})
+        assert abs(model.predict_yield(record) - grid[point]) <= 1e-3 * max(1.0, abs(grid[point]))
+    per_point = (time.perf_counter() - start) / len(points)
+    print(f"predict_yield per point: {per_point * 1e6:.0f}us -> {grid.size * per_point:.1f}s for the same grid")
+
+
+def bench_prediction_cache(args):
+    """
+    Repeated mobile-style /predict inputs with and without the quantized prediction cache
+    """
+    from crop_predictor import CropYieldPredictor
+
+    rng = np.random.default_rng(0)
+    # A few farms re-sending readings that jitter in the third decimal
+    farms = [('India', 'Maize', 2005, 1083.0, 1200.5, 26.1), ('India', 'Rice, paddy', 2010, 1083.0, 900.0, 27.4),
+             ('Brazil', 'Soybeans', 2008, 1761.0, 350000.0, 24.0)]
+    records = []
+    for _ in range(args.repeats):
+        area, item, year, rain, pesticides, temp = farms[rng.integers(len(farms))]
+        records.append({'Area': area, 'Item': item, 'Year': year,
+                        'average_rain_fall_mm_per_year': rain + rng.uniform(-0.004, 0.004),
+                        'pesticides_tonnes': pesticides, 'avg_temp': temp + rng.uniform(-0.004, 0.004)})
+
+    for backend in (['numpy'] if args.skip_keras else ['numpy', 'keras']):
+        for entries in (0, 10000):
+            model = CropYieldPredictor(model_path=args.model_path, backend=backend, cache_entries=entries)
+            sample = records if backend == 'numpy' else records[:100]
+            it = iter(sample * 2)
+            _summary(f"{backend} cache={'on' if entries else 'off'}",
+                     _time_calls(lambda: model.predict_yield(next(it)), len(sample) - 1, warmup=1))
+            if model.cache is not None:
+                print(f"  {model.cache.stats()}")
+
+
+def bench_structured_output(args):
+    """
+    Parse time and recovery rate for model responses: old find/rfind + json.loads vs StructuredOutputParser
+    """
+    from climate_smart_advisor import RECOMMENDATIONS_SCHEMA
+    from structured_output import StructuredOutputParser
+
+    strategy = {'name': 'Drip irrigation', 'description': 'Deliver water to the root zone ' * 4,
+                'benefits': ['Saves water', 'Higher yield'], 'implementation_difficulty': 'Medium',
+                'effectiveness': 'High'}
+    doc = json.dumps({'region': 'Kenya', 'crop': 'Maize', 'climate_conditions': ['Erratic rainfall', 'Heat'],
+                      'adaptation_strategies': [strategy] * 6, 'mitigation_strategies': [strategy] * 6,
+                      'sustainable_practices': [strategy] * 3, 'water_management': ['Mulching'],
+                      'soil_conservation': ['Terracing'], 'additional_resources': []}, indent=2)
+
+    def legacy(content):
+        start, end = content.find('{'), content.rfind('}') + 1
+        if start < 0 or end <= 0:
+            raise ValueError("No JSON object found in response")
+        return json.loads(content[start:end])
+
+    rng = np.random.default_rng(0)
+    # Streams cut off somewhere in the last third, as when a generation hits its token limit
+    truncated = [f"```json\n{doc[:int(len(doc) * rng.uniform(0.67, 0.99))]}" for _ in range(200)]
+    variants = {
+        'json mode': [doc],
+        'fenced + prose': [f"Here are the recommendations:\n```json\n{doc}\n```\nLet me know if you need more."],
+        'trailing commas': [doc.replace('"High"\n', '"High",\n')],
+        'truncated': truncated,
+    }
+
+    parser = StructuredOutputParser('benchmark', RECOMMENDATIONS_SCHEMA)
+    for label, texts in variants.items():
+        for name, parse in (('legacy', legacy), ('parser', parser.parse)):
+            recovered = 0
+            for text in texts:
+                try:
+                    parse(text)
+                    recovered += 1
+                except ValueError:
+                    pass
+            it = iter(texts * (args.repeats // len(texts) + 2))
+
+            def call():
+                try:
+                    parse(next(it))
+                except ValueError:
+                    pass
+
+            _summary(f"{name} {label}", _time_calls(call, min(args.repeats, 200), warmup=1))
+            print(f"  recovered {recovered}/{len(texts)}")
+    print(f"  {parser.stats()}")
+
+
+def bench_knowledge_base(args):
+    """
+    Disease lookups answered from the pre-built knowledge base vs a stubbed live model call
+    """
+    import tempfile
+    from knowledge_base import KnowledgeBase, build, read_names, DEFAULT_NAME_FILES
+
+    names = read_names(DEFAULT_NAME_FILES['diseases'])
+
+    def fetch(name):
+        time.sleep(args.stub_latency)
+        return {'description': f"{name} is a common disease.", 'causes': ['Fungus'] * 3,
+                'symptoms': ['Spots'] * 4, 'treatment': ['Fungicide'] * 4, 'prevention': ['Rotation'] * 4}, True
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        build('diseases', names, fetch, directory, workers=4)
+        print(f"built {len(names)} entries in {time.perf_counter() - start:.2f}s "
+              f"({args.stub_latency:.2f}s stubbed model latency, 4 workers)")
+
+        start = time.perf_counter()
+        knowledge_base = KnowledgeBase('diseases', directory).load()
+        print(f"loaded in {(time.perf_counter() - start) * 1e3:.1f}ms")
+
+        it = itertools.cycle(names)
+        _summary('knowledge base hit', _time_calls(lambda: knowledge_base.get(next(it)), args.repeats))
+        _summary('live call (stub)', _time_calls(lambda: fetch('Unknown Blight'), 5, warmup=0))
+        print(f"  {knowledge_base.stats()}")
+
+
+def bench_metrics(args):
+    """
+    Per-request cost of latency instrumentation: a trivial Flask route with and without it, and one stage timer
+    """
+    from flask import Flask, jsonify
+    import metrics
+
+    def make_app(instrumented):
+        app = Flask(f'bench_{instrumented}')
+
+        @app.route('/ping/<name>')
+        def ping(name):
+            with metrics.stage('work'):
+                return jsonify({'name': name})
+
+        return metrics.instrument_flask(app) if instrumented else app
+
+    enabled = metrics.ENABLED
+    try:
+        metrics.ENABLED = True
+        for label, app in (('uninstrumented', make_app(False)), ('instrumented', make_app(True))):
+            client = app.test_client()
+            _summary(f'flask request ({label})', _time_calls(lambda: client.get('/ping/x'), args.repeats))
+
+        _summary('stage timer (sampled)', _time_calls(lambda: metrics.stage('work').__enter__().__exit__(), args.repeats))
+        metrics.ENABLED = False
+        _summary('stage timer (disabled)', _time_calls(lambda: metrics.stage('work').__enter__().__exit__(), args.repeats))
+    finally:
+        metrics.ENABLED = enabled
+
+    start = time.perf_counter()
+    body = metrics.render()
+    print(f"rendered {len(body.splitlines())} lines in {(time.perf_counter() - start) * 1e3:.2f}ms")
+
+
+def bench_region_grid(args):
+    """
+    Coordinate-to-region lookups for jittered GPS fixes around synthetic farms in Peninsular Malaysia
+    """
+    from region_grid import RegionGrid
+
+    rng = np.random.default_rng(0)
+    farms = np.column_stack([rng.uniform(1.5, 6.5, 500), rng.uniform(100.3, 103.5, 500)])
+    # ~50 m of GPS noise per fix
+    fixes = np.repeat(farms, 20, axis=0) + rng.normal(0, 0.0005, (len(farms) * 20, 2))
+
+    grid = RegionGrid()
+    start = time.perf_counter()
+    regions = [grid.locate(lat, lon) for lat, lon in fixes]
+    elapsed = time.perf_counter() - start
+    print(f"{len(fixes)} fixes -> {len({r.cell for r in regions})} cells -> {len({r.name for r in regions})} regions "
+          f"in {elapsed * 1e3:.1f}ms (cold)")
+    print(f"  without snapping every fix is its own cache key ({len({tuple(f) for f in fixes})} keys)")
+
+    it = itertools.cycle(fixes.tolist())
+    _summary('locate (warm)', _time_calls(lambda: grid.locate(*next(it)), args.repeats))
+    print(f"  {grid.stats()}")
+
+
+def bench_upstream(args):
+    """
+    Tail latency of a stubbed model (5% of calls 20x slower) through UpstreamClient, with and without hedging
+    """
+    import random
+    from upstream import UpstreamClient
+
+    class Response:
+        text = '{}'
+
+    class HeavyTailModel:
+        def generate_content(self, prompt, **kwargs):
+            time.sleep(args.stub_latency * (20 if random.random() < 0.05 else 1))
+            return Response()
+
+    random.seed(0)
+    repeats = max(args.repeats // 10, 50)
+    for hedge_after in (None, args.stub_latency * 3):
+        client = UpstreamClient(f'bench_hedge_{hedge_after}', model=HeavyTailModel(), hedge_after=hedge_after)
+        label = f'hedge after {hedge_after * 1e3:.0f}ms' if hedge_after else 'no hedging'
+        _summary(label, _time_calls(lambda: client.generate('prompt'), repeats, warmup=0))
+        stats = client.stats()
+        print(f"  {stats['attempts']} attempts for {stats['calls']} calls, {stats['hedge_wins']} won by the hedge")
+
+
+def bench_detect_upload(args):
+    """
+    /detect upload preprocessing on phone-sized photos: full decode vs draft-mode decode, bytes sent, duplicates
+    """
+    import io
+    from PIL import Image
+    from image_preprocessing import ImagePreprocessor
+
+    photos = _synthetic_photos(args.images, size=(4032, 3024))
+    preprocessor = ImagePreprocessor(max_prepared=0)
+
+    def full_decode(photo):
+        image = Image.open(io.BytesIO(photo))
+        image.thumbnail((preprocessor.max_dimension, preprocessor.max_dimension), Image.BILINEAR, reducing_gap=2.0)
+        out = io.BytesIO()
+        image.save(out, format='JPEG', quality=preprocessor.quality)
+
+    cycle = iter(photos * (args.repeats // len(photos) + 2))
+    repeats = min(args.repeats, len(photos))
+    _summary('full decode + resize', _time_calls(lambda: full_decode(next(cycle)), repeats, warmup=2))
+    _summary('draft decode + resize', _time_calls(lambda: preprocessor.prepare(io.BytesIO(next(cycle))),
+                                                  repeats, warmup=0))
+    stats = preprocessor.stats()
+    print(f"  {stats['bytes_in'] / stats['images'] / 1024:.0f} KiB uploaded -> "
+          f"{stats['bytes_out'] / stats['images'] / 1024:.0f} KiB sent per image; stage seconds {stats['stage_seconds']}")
+
+    deduplicating = ImagePreprocessor()
+    deduplicating.prepare(io.BytesIO(photos[0]))
+    _summary('duplicate upload', _time_calls(lambda: deduplicating.prepare(io.BytesIO(photos[0])), repeats))
+
+
+BENCHMARKS = {
+    'detect-upload': bench_detect_upload,
+    'upstream': bench_upstream,
+    'region-grid': bench_region_grid,
+    'metrics': bench_metrics,
+    'knowledge-base': bench_knowledge_base,
+    'structured-output': bench_structured_output,
+    'prediction-cache': bench_prediction_cache,
+    'sweep': bench_sweep,
+    'features': bench_features,
+    'predict-batching': bench_predict_batching,
+    'detect': bench_detect,
+    'food-catalog': bench_food_catalog,
+    'meal-plan': bench_meal_plan,
+    'async-load': bench_async_load,
+    'startup': bench_startup,
+    'yield-engine': bench_yield_engine,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend micro-benchmarks")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--model-path', default=MODEL_PATH)
+    parser.add_argument('--repeats', type=int, default=1000)
+    parser.add_argument('--skip-keras', action='store_true', help="don't load TensorFlow for comparison")
+    parser.add_argument('--images', type=int, default=200, help="synthetic photos for the detect benchmark")
+    parser.add_argument('--catalog-size', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16, help="Flask worker threads for async-load")
+    parser.add_argument('--stub-latency', type=float, default=0.2, help="seconds per stubbed upstream call")
+    parser.add_argument('--batch-size', type=int, default=64, help="micro-batch size for predict-batching")
+    parser.add_argument('--max-wait-ms', type=float, default=2.0, help="micro-batch wait window for predict-batching")
+    parser.add_argument('--startup-runs', type=int, default=5)
+    parser.add_argument('--no-warmup', action='store_true', help="disable the background warm-up thread")
+    parser.add_argument('--wait-ready', action='store_true', help="also time until every subsystem settles")
+    args = parser.parse_args()
+
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
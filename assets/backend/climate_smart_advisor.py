@@ -2,6 +2,56 @@ import google.generativeai as genai
 import os
 from typing import List, Dict, Any
 import json
+import metrics
+from single_flight import SingleFlight
+from upstream import UpstreamClient
+from response_cache import ResponseCache
+from region_grid import RegionGrid
+from pregenerated import PregeneratedStore, prompt_checksums
+from json_stream import IncrementalSectionParser, sections_from_object
+from structured_output import StructuredOutputParser, JSON_GENERATION_CONFIG, CLEAN_OUTCOMES
+
+_STRATEGY_LIST = {"type": "array", "items": {"type": "object", "required": ["name"]}}
+
+# Shapes the prompts below ask for; only what the app relies on is required
+RECOMMENDATIONS_SCHEMA = {
+    "type": "object",
+    "required": ["adaptation_strategies", "mitigation_strategies"],
+    "properties": {
+        "climate_conditions": {"type": "array"},
+        "adaptation_strategies": _STRATEGY_LIST,
+        "mitigation_strategies": _STRATEGY_LIST,
+        "sustainable_practices": _STRATEGY_LIST,
+        "water_management": {"type": "array"},
+        "soil_conservation": {"type": "array"},
+        "additional_resources": {"type": "array"},
+    },
+}
+
+ADAPTATION_STRATEGY_SCHEMA = {
+    "type": "object",
+    "required": ["adaptation_strategies"],
+    "properties": {
+        "adaptation_strategies": _STRATEGY_LIST,
+        "case_studies": {"type": "array"},
+    },
+}
+
+FARMING_CALENDAR_SCHEMA = {
+    "type": "object",
+    "required": ["seasonal_calendar"],
+    "properties": {
+        "seasonal_calendar": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["season"],
+                "properties": {"farming_activities": {"type": "array", "items": {"type": "object"}}},
+            },
+        },
+        "annual_considerations": {"type": "array"},
+    },
+}
 
 # Configure the Gemini API with your API key
 # Replace with your actual API key
@@ -11,12 +61,126 @@ def configure_genai():
 class ClimateSmartFarmingAdvisor:
     """Class to provide climate-smart farming recommendations using Gemini API."""
     
-    def __init__(self):
-        """Initialize the advisor."""
+    def __init__(self, cache: ResponseCache = None, regions: RegionGrid = None,
+                 pregenerated: PregeneratedStore = None):
+        """
+        Initialize the advisor.
+
+        Args:
+            cache: Optional response cache; defaults to a two-tier cache in the
+                   "advisor" namespace configured from the environment
+            regions: Optional grid resolving coordinates to regions; defaults to
+                     one over the bundled gazetteer
+            pregenerated: Optional store of answers generated ahead of time by
+                          pregenerated.py; defaults to the configured store
+        """
         configure_genai()
-        # Initialize the Gemini model
-        self.model = genai.GenerativeModel('gemini-1.5-pro')
-    
+        # Shared Gemini handle behind a deadline, concurrency limit and retries
+        self.upstream = UpstreamClient('advisor', 'gemini-1.5-pro', JSON_GENERATION_CONFIG)
+        # Identical prompts in flight at the same time share one upstream call
+        self.inflight = SingleFlight('advisor')
+        self.cache = cache if cache is not None else ResponseCache('advisor')
+        self.regions = regions if regions is not None else RegionGrid()
+        self.pregenerated = (pregenerated if pregenerated is not None
+                             else PregeneratedStore(prompt_checksums=prompt_checksums(self)))
+        self.recommendations_parser = StructuredOutputParser('recommendations', RECOMMENDATIONS_SCHEMA)
+        self.adaptation_strategy_parser = StructuredOutputParser('adaptation_strategy', ADAPTATION_STRATEGY_SCHEMA)
+        self.farming_calendar_parser = StructuredOutputParser('farming_calendar', FARMING_CALENDAR_SCHEMA)
+
+    def _cached(self, cache_key: str):
+        """Answer from the response cache, else from the pre-generated store, else None."""
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            cached = self.pregenerated.get(cache_key)
+        return cached
+
+    def _store(self, cache_key: str, value: Dict[str, Any], outcome: str):
+        """Cache a parsed answer, unless the response was truncated or needed repair."""
+        if outcome in CLEAN_OUTCOMES:
+            self.cache.set(cache_key, value)
+
+    def _generate(self, prompt: str):
+        """Call the model, sharing the upstream call with identical in-flight prompts."""
+        with metrics.stage('upstream'):
+            return self.inflight.do(prompt, lambda: self.upstream.generate(prompt))
+
+    async def _generate_async(self, prompt: str):
+        """Non-blocking model call for the async server, coalesced like _generate."""
+        with metrics.stage('upstream'):
+            return await self.inflight.do_async(prompt, lambda: self.upstream.generate_async(prompt))
+
+    def _stream_sections(self, cache_key: str, prompt: str, output_parser: StructuredOutputParser,
+                         error: Dict[str, Any]):
+        """Yield section events from a streamed generation; cache the assembled object."""
+        cached = self._cached(cache_key)
+        if cached is not None:
+            yield from sections_from_object(cached)
+            yield {"done": True}
+            return
+
+        parser = IncrementalSectionParser()
+        chunks = []
+        parse_error = None
+        for chunk in self.upstream.stream(prompt):
+            chunks.append(chunk.text)
+            if parse_error is None:
+                try:
+                    yield from parser.feed(chunk.text)
+                except json.JSONDecodeError as e:
+                    print(f"Error parsing JSON: {e}")
+                    parse_error = e
+
+        yield from self._finish_stream(cache_key, parser, output_parser, parse_error, chunks, error)
+
+    async def _stream_sections_async(self, cache_key: str, prompt: str, output_parser: StructuredOutputParser,
+                                     error: Dict[str, Any]):
+        """Async variant of _stream_sections."""
+        cached = self._cached(cache_key)
+        if cached is not None:
+            for event in sections_from_object(cached):
+                yield event
+            yield {"done": True}
+            return
+
+        parser = IncrementalSectionParser()
+        chunks = []
+        parse_error = None
+        async for chunk in self.upstream.stream_async(prompt):
+            chunks.append(chunk.text)
+            if parse_error is None:
+                try:
+                    for event in parser.feed(chunk.text):
+                        yield event
+                except json.JSONDecodeError as e:
+                    print(f"Error parsing JSON: {e}")
+                    parse_error = e
+
+        for event in self._finish_stream(cache_key, parser, output_parser, parse_error, chunks, error):
+            yield event
+
+    def _finish_stream(self, cache_key, parser, output_parser, parse_error, chunks, error) -> List[Dict[str, Any]]:
+        """Final events of a stream: done, or the sections recovered by repairing the full text, or the error."""
+        # Validate the whole text even when the stream parsed cleanly, since
+        # the cached object is also served by the non-streaming routes
+        text = "".join(chunks)
+        try:
+            result, outcome = output_parser.parse(text, with_outcome=True)
+        except ValueError as e:
+            print(f"Error parsing JSON: {e}")
+            return [dict(error, text_response=text, done=True)]
+
+        self._store(cache_key, result, outcome)
+        if parse_error is None and parser.finished:
+            return [{"done": True}]
+
+        # The stream broke off or went malformed mid-way; send only the
+        # repaired sections the client hasn't seen yet
+        sent = parser.result
+        events = [event for event in sections_from_object(result)
+                  if event['section'] not in sent
+                  or 'index' in event and event['index'] >= len(sent[event['section']])]
+        return events + [{"done": True}]
+
     def get_climate_smart_recommendations(self, 
                                          location: str, 
                                          crop_type: str,
@@ -32,6 +196,96 @@ class ClimateSmartFarmingAdvisor:
         Returns:
             JSON object containing climate-smart farming recommendations
         """
+        cache_key = self.cache.make_key('recommendations', location, crop_type, climate_challenge)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            return cached
+
+        # Generate response from Gemini
+        response = self._generate(self._recommendations_prompt(location, crop_type, climate_challenge))
+        return self._parse_recommendations(response.text, cache_key, location, crop_type)
+
+    async def get_climate_smart_recommendations_async(self, 
+                                                     location: str, 
+                                                     crop_type: str,
+                                                     climate_challenge: str = None) -> Dict[str, Any]:
+        """Async variant of get_climate_smart_recommendations for the ASGI server."""
+        cache_key = self.cache.make_key('recommendations', location, crop_type, climate_challenge)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            return cached
+
+        response = await self._generate_async(self._recommendations_prompt(location, crop_type, climate_challenge))
+        return self._parse_recommendations(response.text, cache_key, location, crop_type)
+
+    def get_climate_smart_recommendations_by_coordinates(self,
+                                                        latitude: float,
+                                                        longitude: float,
+                                                        crop_type: str,
+                                                        climate_challenge: str = None) -> Dict[str, Any]:
+        """
+        Get climate-smart farming recommendations for the region containing a point.
+
+        The point is snapped to a region cell (see region_grid.RegionGrid), so
+        nearby farms share one generated and cached answer, the same one a
+        request naming that region gets.
+
+        Args:
+            latitude: Latitude in degrees
+            longitude: Longitude in degrees
+            crop_type: The type of crop being grown
+            climate_challenge: Optional specific climate challenge (drought, flooding, etc.)
+
+        Returns:
+            The recommendations, plus the resolved region under "resolved_location"
+        """
+        region = self.regions.locate(latitude, longitude)
+        recommendations = self.get_climate_smart_recommendations(region.name, crop_type, climate_challenge)
+        return self._with_region(recommendations, region)
+
+    async def get_climate_smart_recommendations_by_coordinates_async(self,
+                                                                    latitude: float,
+                                                                    longitude: float,
+                                                                    crop_type: str,
+                                                                    climate_challenge: str = None) -> Dict[str, Any]:
+        """Async variant of get_climate_smart_recommendations_by_coordinates for the ASGI server."""
+        region = self.regions.locate(latitude, longitude)
+        recommendations = await self.get_climate_smart_recommendations_async(region.name, crop_type, climate_challenge)
+        return self._with_region(recommendations, region)
+
+    @staticmethod
+    def _with_region(recommendations: Dict[str, Any], region) -> Dict[str, Any]:
+        # Shallow copy, so the cached entry is left as it is
+        return {**recommendations, "resolved_location": region._asdict()}
+
+    def stream_climate_smart_recommendations(self,
+                                             location: str,
+                                             crop_type: str,
+                                             climate_challenge: str = None):
+        """
+        Stream climate-smart recommendations section by section.
+
+        Yields each completed top-level field or strategy object as soon as the
+        model has generated it (see json_stream.IncrementalSectionParser),
+        followed by a final {"done": true} event.
+        """
+        cache_key = self.cache.make_key('recommendations', location, crop_type, climate_challenge)
+        prompt = self._recommendations_prompt(location, crop_type, climate_challenge)
+        error = {"region": location, "crop": crop_type, "error": "Could not generate structured recommendations"}
+        yield from self._stream_sections(cache_key, prompt, self.recommendations_parser, error)
+
+    async def stream_climate_smart_recommendations_async(self,
+                                                         location: str,
+                                                         crop_type: str,
+                                                         climate_challenge: str = None):
+        """Async variant of stream_climate_smart_recommendations for the ASGI server."""
+        cache_key = self.cache.make_key('recommendations', location, crop_type, climate_challenge)
+        prompt = self._recommendations_prompt(location, crop_type, climate_challenge)
+        error = {"region": location, "crop": crop_type, "error": "Could not generate structured recommendations"}
+        async for event in self._stream_sections_async(cache_key, prompt, self.recommendations_parser, error):
+            yield event
+
+    def _recommendations_prompt(self, location: str, crop_type: str, climate_challenge: str = None) -> str:
         # Construct the prompt for Gemini
         challenge_part = f" facing {climate_challenge}" if climate_challenge else ""
         prompt = f"""
@@ -82,37 +336,28 @@ class ClimateSmartFarmingAdvisor:
         4. Consider small-scale and large-scale farming operations
         5. Provide locally relevant examples
         """
-        
-        # Generate response from Gemini
-        response = self.model.generate_content(prompt)
-        
-        # Extract and parse JSON from response
+        return prompt
+
+    def _parse_recommendations(self, content: str, cache_key: str, location: str, crop_type: str) -> Dict[str, Any]:
+        # Parse (and if needed repair) the JSON response
         try:
-            # Find JSON content in the response
-            content = response.text
-            json_start = content.find('{')
-            json_end = content.rfind('}') + 1
-            
-            if json_start < 0 or json_end <= 0:
-                raise ValueError("No JSON object found in response")
-                
-            json_str = content[json_start:json_end]
-            recommendations = json.loads(json_str)
+            recommendations, outcome = self.recommendations_parser.parse(content, with_outcome=True)
+            self._store(cache_key, recommendations, outcome)
             return recommendations
             
-        except (json.JSONDecodeError, ValueError) as e:
+        except ValueError as e:
             # If JSON parsing fails, return a structured error message
             print(f"Error parsing JSON: {e}")
-            print(f"Raw response: {response.text}")
+            print(f"Raw response: {content}")
             
             # Create a simpler response format as a fallback
             return {
                 "region": location,
                 "crop": crop_type,
                 "error": "Could not generate structured recommendations",
-                "text_response": response.text
+                "text_response": content
             }
-    
+
     def get_specific_adaptation_strategy(self, 
                                        location: str, 
                                        climate_challenge: str) -> Dict[str, Any]:
@@ -126,6 +371,28 @@ class ClimateSmartFarmingAdvisor:
         Returns:
             JSON object containing adaptation strategies
         """
+        cache_key = self.cache.make_key('adaptation_strategy', location, climate_challenge)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            return cached
+
+        # Generate response from Gemini
+        response = self._generate(self._adaptation_strategy_prompt(location, climate_challenge))
+        return self._parse_adaptation_strategy(response.text, cache_key, location, climate_challenge)
+
+    async def get_specific_adaptation_strategy_async(self, 
+                                                   location: str, 
+                                                   climate_challenge: str) -> Dict[str, Any]:
+        """Async variant of get_specific_adaptation_strategy for the ASGI server."""
+        cache_key = self.cache.make_key('adaptation_strategy', location, climate_challenge)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            return cached
+
+        response = await self._generate_async(self._adaptation_strategy_prompt(location, climate_challenge))
+        return self._parse_adaptation_strategy(response.text, cache_key, location, climate_challenge)
+
+    def _adaptation_strategy_prompt(self, location: str, climate_challenge: str) -> str:
         prompt = f"""
         As an agricultural expert, provide detailed climate adaptation strategies for farming in {location} 
         that is facing {climate_challenge}.
@@ -151,37 +418,70 @@ class ClimateSmartFarmingAdvisor:
         
         Focus on practical, proven strategies that local farmers can implement.
         """
-        
-        # Generate response from Gemini
-        response = self.model.generate_content(prompt)
-        
-        # Extract and parse JSON from response
+        return prompt
+
+    def _parse_adaptation_strategy(self, content: str, cache_key: str, location: str, climate_challenge: str) -> Dict[str, Any]:
+        # Parse (and if needed repair) the JSON response
         try:
-            content = response.text
-            json_start = content.find('{')
-            json_end = content.rfind('}') + 1
-            
-            if json_start < 0 or json_end <= 0:
-                raise ValueError("No JSON object found in response")
-                
-            json_str = content[json_start:json_end]
-            strategies = json.loads(json_str)
+            strategies, outcome = self.adaptation_strategy_parser.parse(content, with_outcome=True)
+            self._store(cache_key, strategies, outcome)
             return strategies
             
-        except (json.JSONDecodeError, ValueError) as e:
+        except ValueError as e:
             print(f"Error parsing JSON: {e}")
             
             return {
                 "region": location,
                 "climate_challenge": climate_challenge,
                 "error": "Could not generate structured strategies",
-                "text_response": response.text
+                "text_response": content
             }
 
     def get_sustainable_farming_calendar(self, 
                                         location: str, 
                                         crop_type: str) -> Dict[str, Any]:
-        
+        cache_key = self.cache.make_key('farming_calendar', location, crop_type)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            return cached
+
+        # Generate response from Gemini
+        response = self._generate(self._farming_calendar_prompt(location, crop_type))
+        return self._parse_farming_calendar(response.text, cache_key, location, crop_type)
+
+    async def get_sustainable_farming_calendar_async(self, 
+                                                    location: str, 
+                                                    crop_type: str) -> Dict[str, Any]:
+        """Async variant of get_sustainable_farming_calendar for the ASGI server."""
+        cache_key = self.cache.make_key('farming_calendar', location, crop_type)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            return cached
+
+        response = await self._generate_async(self._farming_calendar_prompt(location, crop_type))
+        return self._parse_farming_calendar(response.text, cache_key, location, crop_type)
+
+    def stream_sustainable_farming_calendar(self, location: str, crop_type: str):
+        """
+        Stream the farming calendar section by section.
+
+        Each seasonal_calendar entry is yielded as soon as it is complete,
+        followed by a final {"done": true} event.
+        """
+        cache_key = self.cache.make_key('farming_calendar', location, crop_type)
+        prompt = self._farming_calendar_prompt(location, crop_type)
+        error = {"region": location, "crop": crop_type, "error": "Could not generate structured calendar"}
+        yield from self._stream_sections(cache_key, prompt, self.farming_calendar_parser, error)
+
+    async def stream_sustainable_farming_calendar_async(self, location: str, crop_type: str):
+        """Async variant of stream_sustainable_farming_calendar for the ASGI server."""
+        cache_key = self.cache.make_key('farming_calendar', location, crop_type)
+        prompt = self._farming_calendar_prompt(location, crop_type)
+        error = {"region": location, "crop": crop_type, "error": "Could not generate structured calendar"}
+        async for event in self._stream_sections_async(cache_key, prompt, self.farming_calendar_parser, error):
+            yield event
+
+    def _farming_calendar_prompt(self, location: str, crop_type: str) -> str:
         prompt = f"""
         Create a detailed climate-smart seasonal farming calendar for growing {crop_type} in {location}.
         
@@ -212,31 +512,23 @@ class ClimateSmartFarmingAdvisor:
         
         Make sure to include region-specific seasonal variations and climate-smart practices.
         """
-        
-        # Generate response from Gemini
-        response = self.model.generate_content(prompt)
-        
-        # Extract and parse JSON from response
+        return prompt
+
+    def _parse_farming_calendar(self, content: str, cache_key: str, location: str, crop_type: str) -> Dict[str, Any]:
+        # Parse (and if needed repair) the JSON response
         try:
-            content = response.text
-            json_start = content.find('{')
-            json_end = content.rfind('}') + 1
-            
-            if json_start < 0 or json_end <= 0:
-                raise ValueError("No JSON object found in response")
-                
-            json_str = content[json_start:json_end]
-            calendar = json.loads(json_str)
+            calendar, outcome = self.farming_calendar_parser.parse(content, with_outcome=True)
+            self._store(cache_key, calendar, outcome)
             return calendar
             
-        except (json.JSONDecodeError, ValueError) as e:
+        except ValueError as e:
             print(f"Error parsing JSON: {e}")
             
             return {
                 "region": location,
                 "crop": crop_type,
                 "error": "Could not generate structured calendar",
-                "text_response": response.text
+                "text_response": content
             }
 
 
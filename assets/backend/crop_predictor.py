@@ -1,7 +1,10 @@
 import os
+import time
+import shutil
+import tempfile
+import threading
 import flask
 from flask import Flask, request, jsonify
-import tensorflow as tf
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import StandardScaler, LabelEncoder
@@ -9,26 +12,153 @@ from sklearn.model_selection import train_test_split
 import joblib
 import logging
 from flask_cors import CORS
+from numpy_yield_model import NumpyYieldModel, export_numpy_model, NUMPY_MODEL_FILE
+from feature_pipeline import FeaturePipeline, NUMERIC_FIELDS
+from prediction_cache import PredictionCache
+import model_registry
+import metrics
 
 app = Flask(__name__)
 CORS(app)
 
+# Raw input fields expected for every prediction record
+REQUIRED_FIELDS = [
+    'Area',
+    'Item',
+    'Year',
+    'average_rain_fall_mm_per_year',
+    'pesticides_tonnes',
+    'avg_temp'
+]
+
+# Model feature columns, in the order the scaler and network expect them
+FEATURES = [
+    'Area_encoded',
+    'Item_encoded',
+    'Year',
+    'average_rain_fall_mm_per_year',
+    'pesticides_tonnes',
+    'avg_temp'
+]
+
+# Default number of rows sent to the model in a single forward pass
+DEFAULT_BATCH_CHUNK_SIZE = 1024
+
+# Grid points evaluated per forward pass by predict_yield_grid
+DEFAULT_GRID_CHUNK_SIZE = 8192
+
+# Inference backends: 'numpy' serves the exported model.npz without TensorFlow,
+# 'keras' serves model.keras, 'auto' prefers numpy when the export exists
+BACKENDS = ('auto', 'numpy', 'keras')
+
+# Batch sizes run through a newly loaded version before it starts serving
+WARMUP_BATCH_SIZES = (1, 64)
+
+class ModelVersion:
+    """
+    One loaded set of crop-yield artifacts, swapped into CropYieldPredictor as a unit.
+
+    Each prediction takes a single reference to the active ModelVersion, so a
+    reload can never pair one version's encoders or scaler with another's
+    network.
+    """
+
+    def __init__(self, version, model, numpy_model, scaler, area_encoder, item_encoder):
+        self.version = version
+        self.model = model
+        self.numpy_model = numpy_model
+        self.scaler = scaler
+        self.area_encoder = area_encoder
+        self.item_encoder = item_encoder
+        # Encoders (and scaler, unless it is folded into the NumPy model) compiled for inference
+        self.pipeline = FeaturePipeline(area_encoder, item_encoder, None if numpy_model is not None else scaler)
+        self.loaded_at = time.time()
+
+    @property
+    def backend(self):
+        return 'numpy' if self.numpy_model is not None else 'keras'
+
+    def infer(self, inputs):
+        """
+        Run the model on a float32 array from self.pipeline
+
+        Returns a 1-D array with one predicted yield per row.
+        """
+        with metrics.stage('inference'):
+            if self.numpy_model is not None:
+                return self.numpy_model.predict(inputs)
+            return self.model.predict(inputs, batch_size=len(inputs), verbose=0)[:, 0]
+
+    def warm_up(self):
+        """
+        Run the model once per WARMUP_BATCH_SIZES so graph tracing happens before it serves requests
+        """
+        row = self.pipeline.scale(np.asarray([self.scaler.mean_], dtype=np.float32))
+        for size in WARMUP_BATCH_SIZES:
+            self.infer(np.repeat(row, size, axis=0))
+
+
 class CropYieldPredictor:
-    def __init__(self, model_path='assets/models/crop_yield_model'):
+    def __init__(self, model_path='assets/models/crop_yield_model', backend='auto', cache_entries=0, cache_decimals=2):
+        """
+        cache_entries > 0 enables an LRU cache of single-record predictions
+        keyed on inputs rounded to cache_decimals places (see PredictionCache);
+        with it, records are scored on those rounded inputs
+
+        model_path is either a flat directory of artifacts or a registry of
+        versions with a CURRENT pointer (see model_registry).
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Invalid backend: {backend}. Choose one of {BACKENDS}")
         self.model_path = model_path
-        self.model = None
-        self.scaler = None
-        self.area_encoder = None
-        self.item_encoder = None
+        self.backend = backend
+        self.cache = PredictionCache(cache_entries, cache_decimals) if cache_entries > 0 else None
+        self._active = None
+        self._reload_lock = threading.Lock()
+        self._reload_status = {'state': 'idle'}
         self.load_model()
 
+    # Read-only views of the active version, for training code and tools
+    @property
+    def model(self):
+        return self._active.model if self._active else None
+
+    @property
+    def numpy_model(self):
+        return self._active.numpy_model if self._active else None
+
+    @property
+    def scaler(self):
+        return self._active.scaler if self._active else None
+
+    @property
+    def area_encoder(self):
+        return self._active.area_encoder if self._active else None
+
+    @property
+    def item_encoder(self):
+        return self._active.item_encoder if self._active else None
+
+    @property
+    def pipeline(self):
+        return self._active.pipeline if self._active else None
+
+    @property
+    def version(self):
+        return self._active.version if self._active else None
+
     def prepare_data(self, data):
         """
         Prepare and preprocess input data for yield prediction
+
+        Fits new encoders and a new scaler, leaving the served version
+        untouched. Returns (X_scaled, y, (area_encoder, item_encoder, scaler)).
         """
+        area_encoder, item_encoder, scaler = LabelEncoder(), LabelEncoder(), StandardScaler()
+
         # Encode categorical variables
-        data['Area_encoded'] = self.area_encoder.fit_transform(data['Area'])
-        data['Item_encoded'] = self.item_encoder.fit_transform(data['Item'])
+        data['Area_encoded'] = area_encoder.fit_transform(data['Area'])
+        data['Item_encoded'] = item_encoder.fit_transform(data['Item'])
         
         # Select features
         features = [
@@ -45,14 +175,16 @@ class CropYieldPredictor:
         y = data['hg/ha_yield']
         
         # Scale numerical features
-        X_scaled = self.scaler.fit_transform(X)
+        X_scaled = scaler.fit_transform(X)
         
-        return X_scaled, y
+        return X_scaled, y, (area_encoder, item_encoder, scaler)
 
     def build_model(self, input_shape):
         """
         Build neural network for yield prediction
         """
+        import tensorflow as tf
+
         model = tf.keras.Sequential([
             tf.keras.layers.Dense(64, activation='relu', input_shape=(input_shape,)),
             tf.keras.layers.BatchNormalization(),
@@ -75,7 +207,7 @@ class CropYieldPredictor:
         """
         Train the crop yield prediction model and save it
         """
-        X, y = self.prepare_data(data)
+        X, y, (area_encoder, item_encoder, fitted_scaler) = self.prepare_data(data)
         
         # Split data
         X_train, X_test, y_train, y_test = train_test_split(
@@ -88,9 +220,9 @@ class CropYieldPredictor:
         X_test = scaler.transform(X_test)
 
         # Build and train model
-        self.model = self.build_model(X.shape[1])
+        model = self.build_model(X.shape[1])
         
-        history = self.model.fit(
+        history = model.fit(
             X_train, y_train,
             validation_split=0.2,
             epochs=100,
@@ -99,101 +231,355 @@ class CropYieldPredictor:
         )
         
         # Evaluate model
-        test_loss, test_mae = self.model.evaluate(X_test, y_test)
+        test_loss, test_mae = model.evaluate(X_test, y_test)
         print(f"Test Loss: {test_loss}, Test MAE: {test_mae}")
         
-        # Save the entire model
+        # Serve and save the entire model
+        self._activate(ModelVersion(None, model, None, fitted_scaler, area_encoder, item_encoder))
         self.save_model()
         
         return history
 
-    def save_model(self):
+    def train_streaming(self, csv_paths, **options):
         """
-        Save the trained model, scaler, and encoders
+        Train from one or more CSV files streamed through tf.data, then save
+
+        Encoders and the scaler are fitted in a single pass over the files
+        and the data is never fully loaded. See streaming_training.train_streaming
+        for the options; returns the per-epoch throughput report.
         """
-        # Ensure directory exists
-        os.makedirs(self.model_path, exist_ok=True)
-        
+        from streaming_training import train_streaming
+        return train_streaming(self, csv_paths, **options)
+
+    def _write_artifacts(self, directory):
+        """
+        Write the active model, scaler, encoders and NumPy export into directory
+        """
+        os.makedirs(directory, exist_ok=True)
+
         # Save TensorFlow model
-        self.model.save(os.path.join(self.model_path, 'model.keras'))
-        
-        # Save preprocessing objects
-        import joblib
-        
+        self.model.save(os.path.join(directory, 'model.keras'))
+
         # Save scaler
-        joblib.dump(self.scaler, os.path.join(self.model_path, 'scaler.joblib'))
-        
+        joblib.dump(self.scaler, os.path.join(directory, 'scaler.joblib'))
+
         # Save label encoders
         joblib.dump({
             'area_encoder': self.area_encoder,
             'item_encoder': self.item_encoder
-        }, os.path.join(self.model_path, 'encoders.joblib'))
+        }, os.path.join(directory, 'encoders.joblib'))
+
+        # Keep the NumPy export in sync with the saved Keras model
+        export_numpy_model(directory)
+
+    def save_model(self):
+        """
+        Save the trained model, scaler, and encoders
+
+        With a versioned model_path the artifacts are published as a new
+        version and CURRENT is moved to it; otherwise the flat files are
+        overwritten.
+        """
+        if model_registry.current_version(self.model_path) is not None:
+            staging = tempfile.mkdtemp(prefix='.staging-', dir=self.model_path)
+            try:
+                self._write_artifacts(staging)
+                manifest = model_registry.publish(self.model_path, staging)
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+        else:
+            self._write_artifacts(self.model_path)
+            manifest = model_registry.build_manifest(self.model_path)
+
+        self._active.version = manifest['version']
+
+        # Cached predictions may come from the previous artifacts
+        if self.cache is not None:
+            self.cache.clear()
         
-        print(f"Model saved to {self.model_path}")
+        print(f"Model version {manifest['version']} saved to {self.model_path}")
+
+    def _load_version(self, version=None):
+        """
+        Load, verify and warm up a model version without serving it yet
 
-    def load_model(self):
+        version defaults to the one CURRENT points at. Raises on missing or
+        corrupt artifacts.
+        """
+        directory, manifest = model_registry.resolve(self.model_path, version)
+        numpy_file = os.path.join(directory, NUMPY_MODEL_FILE)
+        use_numpy = self.backend == 'numpy' or (self.backend == 'auto' and os.path.exists(numpy_file))
+
+        model = numpy_model = None
+        if use_numpy:
+            # Load the exported NumPy model (scaler and BatchNorm folded in)
+            numpy_model = NumpyYieldModel.load(numpy_file)
+        else:
+            # Load TensorFlow model
+            import tensorflow as tf
+            model = tf.keras.models.load_model(os.path.join(directory, 'model.keras'))
+
+        # Load preprocessing objects
+        scaler = joblib.load(os.path.join(directory, 'scaler.joblib'))
+        encoders = joblib.load(os.path.join(directory, 'encoders.joblib'))
+
+        loaded = ModelVersion(manifest['version'], model, numpy_model, scaler,
+                              encoders['area_encoder'], encoders['item_encoder'])
+        loaded.warm_up()
+        return loaded
+
+    def _activate(self, loaded):
+        """
+        Start serving a loaded version; a single reference assignment, so it is atomic for readers
+        """
+        self._active = loaded
+        # Entries are keyed by version, so this only releases the old version's memory
+        if self.cache is not None:
+            self.cache.clear()
+
+    def load_model(self, version=None):
         """
         Load the saved model, scaler, and encoders
         """
         try:
-            # Load TensorFlow model
-            self.model = tf.keras.models.load_model(os.path.join(self.model_path, 'model.keras'))
-            
-            # Load preprocessing objects
-            import joblib
-            
-            # Load scaler
-            self.scaler = joblib.load(os.path.join(self.model_path, 'scaler.joblib'))
-            
-            # Load label encoders
-            encoders = joblib.load(os.path.join(self.model_path, 'encoders.joblib'))
-            self.area_encoder = encoders['area_encoder']
-            self.item_encoder = encoders['item_encoder']
-            
-            print("Model loaded successfully")
+            loaded = self._load_version(version)
+            self._activate(loaded)
+            print(f"Model version {loaded.version} loaded successfully ({loaded.backend} backend)")
             return True
         except Exception as e:
             print(f"Error loading model: {e}")
             return False
 
-    def predict_yield(self, input_data):
+    def reload(self, version=None, background=True):
+        """
+        Hot-swap to another model version while requests keep being served
+
+        The version (default: whatever CURRENT now points at) is loaded,
+        checksum-verified and warmed up off the request path, then swapped
+        in. In-flight requests finish on the version they started with. An
+        explicit version is also made CURRENT once it loads. If a reload is
+        already running, its status is returned instead of starting another.
+
+        Returns the reload status (see reload_status). Raises ValueError,
+        before anything is loaded, for a version that isn't published.
+        """
+        if version is not None:
+            model_registry.check_published(self.model_path, version)
+        with self._reload_lock:
+            if self._reload_status['state'] == 'loading':
+                return dict(self._reload_status)
+            self._reload_status = {'state': 'loading', 'requested': version or 'current', 'started': time.time()}
+
+        def run():
+            started = time.perf_counter()
+            try:
+                loaded = self._load_version(version)
+                if version is not None and model_registry.current_version(self.model_path) is not None:
+                    model_registry.activate(self.model_path, version)
+                previous = self.version
+                self._activate(loaded)
+                status = {'state': 'ready', 'version': loaded.version, 'previous': previous}
+                logging.info(f"Model version {loaded.version} now serving (was {previous})")
+            except Exception as e:
+                status = {'state': 'failed', 'error': str(e)}
+                logging.error(f"Model reload failed, still serving {self.version}: {e}")
+            status['requested'] = version or 'current'
+            status['seconds'] = round(time.perf_counter() - started, 3)
+            with self._reload_lock:
+                self._reload_status = status
+
+        if background:
+            threading.Thread(target=run, name='model-reload', daemon=True).start()
+        else:
+            run()
+        return self.reload_status()
+
+    def reload_status(self):
+        with self._reload_lock:
+            return dict(self._reload_status)
+
+    def model_status(self):
+        """
+        Active version details plus the last reload's outcome, for /health
+        """
+        active = self._active
+        return {
+            'version': active.version if active else None,
+            'backend': active.backend if active else None,
+            'loaded_at': active.loaded_at if active else None,
+            'available_versions': model_registry.list_versions(self.model_path),
+            'reload': self.reload_status()
+        }
+
+    def is_loaded(self):
+        """
+        Whether a model is ready to serve predictions
+        """
+        return self._active is not None
+
+    def predict_yield(self, input_data, with_version=False):
         """
         Predict crop yield for given input data
         
-        input_data should be a DataFrame with same structure as training data
+        input_data is a dict with the REQUIRED_FIELDS values. With
+        with_version, returns (prediction, model version that produced it).
         """
+        active = self._active
         try:
-            # Prepare input data
-            input_df = pd.DataFrame([input_data])
-            
-            # Encode categorical variables
-            input_df['Area_encoded'] = self.area_encoder.transform(input_df['Area'])
-            input_df['Item_encoded'] = self.item_encoder.transform(input_df['Item'])
-            
-            # Select and prepare features
-            features = [
-                'Area_encoded', 
-                'Item_encoded', 
-                'Year', 
-                'average_rain_fall_mm_per_year', 
-                'pesticides_tonnes', 
-                'avg_temp'
-            ]
-            
-            # Prepare input data
-            X_input = input_df[features]
-            input_scaled = self.scaler.transform(X_input)
-            
-            # Predict
-            prediction = self.model.predict(input_scaled)
-            return float(prediction[0][0])
+            key = None
+            prediction = None
+            if self.cache is not None:
+                # Score the rounded inputs, so the cached value is the one for its key
+                input_data = self.cache.quantize(input_data)
+                key = self.cache.make_key(active.pipeline, input_data, active.version)
+                prediction = self.cache.get(key)
+
+            if prediction is None:
+                prediction = float(active.infer(active.pipeline.transform([input_data]))[0])
+                if key is not None:
+                    self.cache.set(key, prediction)
+            return (prediction, active.version) if with_version else prediction
         
         except Exception as e:
             logging.error(f"Prediction error: {e}")
             raise
 
-# Initialize predictor
-predictor = CropYieldPredictor()
+    def _records_from_columns(self, columns):
+        """
+        Convert a columnar mapping ({field: [values...]}) into a list of row dicts
+        """
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("All columns must have the same length")
+
+        count = lengths.pop() if lengths else 0
+        return [
+            {field: values[i] for field, values in columns.items()}
+            for i in range(count)
+        ]
+
+    def _coerce_record(self, record, pipeline):
+        """
+        Validate a single raw record and convert its values to the expected types
+        """
+        if not isinstance(record, dict):
+            raise ValueError("Record must be an object")
+
+        for field in REQUIRED_FIELDS:
+            if field not in record:
+                raise ValueError(f"Missing required field: {field}")
+
+        try:
+            row = {
+                'Area': str(record['Area']),
+                'Item': str(record['Item']),
+                'Year': int(record['Year']),
+                'average_rain_fall_mm_per_year': float(record['average_rain_fall_mm_per_year']),
+                'pesticides_tonnes': float(record['pesticides_tonnes']),
+                'avg_temp': float(record['avg_temp'])
+            }
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid input data: {e}")
+
+        # Raises the same "Unknown Area/Item" errors as the pipeline would later
+        pipeline.area_code(row['Area'])
+        pipeline.item_code(row['Item'])
+
+        return row
+
+    def predict_yield_batch(self, records, chunk_size=DEFAULT_BATCH_CHUNK_SIZE, with_version=False):
+        """
+        Predict crop yield for many records at once
+
+        records can be a list of dicts (one per row) or a columnar dict of
+        equal-length lists. Rows are validated individually, the valid ones are
+        encoded and scaled in one vectorized pass, and the model is called once
+        per chunk of chunk_size rows.
+
+        Returns a list in input order where each entry is either
+        {'yield': float} or {'error': str} for rows that could not be scored.
+        Every row is scored by the same model version; with_version returns
+        (results, version).
+        """
+        active = self._active
+        if isinstance(records, dict):
+            records = self._records_from_columns(records)
+
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer")
+
+        results = [None] * len(records)
+        valid_rows = []
+        valid_index = []
+        valid_keys = []
+
+        # Validate each row on its own so one bad record doesn't fail the batch
+        for i, record in enumerate(records):
+            try:
+                row = self._coerce_record(record, active.pipeline)
+            except ValueError as e:
+                results[i] = {'error': str(e)}
+                continue
+
+            if self.cache is not None:
+                row = self.cache.quantize(row)
+                key = self.cache.make_key(active.pipeline, row, active.version)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    results[i] = {'yield': cached}
+                    continue
+                valid_keys.append(key)
+            valid_rows.append(row)
+            valid_index.append(i)
+
+        if valid_rows:
+            # Encode (and scale) all valid rows in one pass
+            X_input = active.pipeline.transform(valid_rows)
+
+            # One forward pass per chunk
+            for start in range(0, len(valid_rows), chunk_size):
+                predictions = active.infer(X_input[start:start + chunk_size])
+
+                for offset, value in enumerate(predictions):
+                    results[valid_index[start + offset]] = {'yield': float(value)}
+                    if valid_keys:
+                        self.cache.set(valid_keys[start + offset], float(value))
+
+        return (results, active.version) if with_version else results
+
+    def predict_yield_grid(self, area, item, axes, chunk_size=DEFAULT_GRID_CHUNK_SIZE):
+        """
+        Predict crop yield over the cartesian grid of the numeric fields for one Area and Item
+
+        axes maps every NUMERIC_FIELDS name to a 1-D array of values. Grid
+        rows are generated chunk by chunk from flat indices, so only
+        chunk_size points are materialized at a time.
+
+        Returns a float32 array of shape (len(axes[f]) for f in NUMERIC_FIELDS).
+        """
+        active = self._active
+        area_code = active.pipeline.area_code(str(area))
+        item_code = active.pipeline.item_code(str(item))
+        values = [np.asarray(axes[field], dtype=np.float32) for field in NUMERIC_FIELDS]
+        shape = tuple(len(v) for v in values)
+        total = int(np.prod(shape))
+
+        result = np.empty(total, dtype=np.float32)
+        buffer = np.empty((min(chunk_size, total), active.pipeline.width), dtype=np.float32)
+        for start in range(0, total, chunk_size):
+            stop = min(start + chunk_size, total)
+            block = buffer[:stop - start]
+            block[:, 0] = area_code
+            block[:, 1] = item_code
+            for column, (axis_values, axis_index) in enumerate(
+                    zip(values, np.unravel_index(np.arange(start, stop), shape)), start=2):
+                block[:, column] = axis_values[axis_index]
+            result[start:stop] = active.infer(active.pipeline.scale(block))
+
+        return result.reshape(shape)
+
+# Initialized when run standalone so importing this module doesn't load a model
+predictor = None
 
 @app.route('/predict', methods=['POST'])
 def predict():
@@ -231,11 +617,12 @@ def predict():
             return jsonify({'error': f'Invalid input data: {e}', 'status': 'error'}), 400
         
         # Make prediction
-        yield_prediction = predictor.predict_yield(input_data)
+        yield_prediction, model_version = predictor.predict_yield(input_data, with_version=True)
         
         # Return prediction
         return jsonify({
             'yield': yield_prediction,
+            'model_version': model_version,
             'status': 'success'
         })
     
@@ -253,7 +640,8 @@ def health_check():
     """
     return jsonify({
         'status': 'healthy',
-        'model_loaded': predictor.model is not None
+        'model_loaded': predictor.is_loaded(),
+        'model_version': predictor.version
     })
 
 """""
@@ -287,6 +675,9 @@ def main():
 if __name__ == "__main__":
     # Configure logging
     logging.basicConfig(level=logging.INFO)
+
+    # Initialize predictor
+    predictor = CropYieldPredictor()
     
     # Run the Flask app
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,184 @@
+import io
+import os
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+import metrics
+from micro_batcher import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = 'assets/models/disease_detection_model'
+MODEL_FILE = 'model.tflite'
+LABELS_FILE = 'dict.txt'
+
+DEFAULT_TOP_K = 3
+# Batching is off by default: with XNNPACK, an interpreter invocation costs
+# about the same per image at any batch size, and padding batches to a power
+# of two makes larger ones slower than scoring images one by one
+DEFAULT_MAX_BATCH_SIZE = int(os.environ.get('DETECT_BATCH_MAX_SIZE', 1))
+DEFAULT_MAX_WAIT_MS = float(os.environ.get('DETECT_BATCH_MAX_WAIT_MS', 5.0))
+
+
+def _load_interpreter_class():
+    """
+    Prefer the standalone TFLite runtimes; fall back to TensorFlow's copy
+    """
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+def _batch_bucket(size):
+    """
+    Round a batch size up to a power of two so only a few interpreter shapes exist
+    """
+    bucket = 1
+    while bucket < size:
+        bucket *= 2
+    return bucket
+
+
+class DiseaseClassifier:
+    """
+    Local plant-disease classifier backed by the bundled TFLite model.
+
+    Uploads are decoded and resized on a thread pool. Concurrent requests
+    are then grouped by a MicroBatcher, for at most max_wait_ms or
+    max_batch_size images (one by default), and run through one
+    interpreter invocation.
+    Interpreters are created per power-of-two batch size and are only
+    ever touched by the batcher's dispatcher thread.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, decode_workers=4, num_threads=None):
+        self.model_path = os.path.join(model_dir, MODEL_FILE)
+        with open(os.path.join(model_dir, LABELS_FILE)) as f:
+            self.labels = [line.strip() for line in f if line.strip()]
+
+        self.num_threads = num_threads or os.cpu_count()
+
+        self._interpreter_class = _load_interpreter_class()
+        self._interpreters = {}
+        interpreter = self._interpreter(1)
+        input_details = interpreter.get_input_details()[0]
+        output_details = interpreter.get_output_details()[0]
+        _, self.height, self.width, _ = input_details['shape']
+        self._input_dtype = input_details['dtype']
+        self._input_quantization = input_details['quantization']
+        self._output_quantization = output_details['quantization']
+        if output_details['shape'][-1] != len(self.labels):
+            raise ValueError(f"Model has {output_details['shape'][-1]} outputs but {LABELS_FILE} has {len(self.labels)} labels")
+
+        self._decoder = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix='detect-decode')
+        self._batcher = MicroBatcher('detect', self._score_batch, max_batch_size, max_wait_ms)
+        logger.info(f"Disease classifier loaded ({len(self.labels)} labels, {self.width}x{self.height} input)")
+
+    def _interpreter(self, batch_size):
+        interpreter = self._interpreters.get(batch_size)
+        if interpreter is None:
+            interpreter = self._interpreter_class(model_path=self.model_path, num_threads=self.num_threads)
+            if batch_size != 1:
+                index = interpreter.get_input_details()[0]['index']
+                shape = list(interpreter.get_input_details()[0]['shape'])
+                interpreter.resize_tensor_input(index, [batch_size] + shape[1:])
+            interpreter.allocate_tensors()
+            self._interpreters[batch_size] = interpreter
+        return interpreter
+
+    def preprocess(self, content):
+        """
+        Decode image bytes into a model input array (height, width, 3)
+        """
+        from PIL import Image
+
+        with metrics.stage('preprocess'):
+            image = Image.open(io.BytesIO(content))
+            # Let JPEG decode at a reduced scale when the upload is much larger than the model input
+            image.draft('RGB', (self.width, self.height))
+            image = image.convert('RGB').resize((self.width, self.height), Image.BILINEAR)
+            pixels = np.asarray(image)
+
+        if self._input_dtype == np.uint8:
+            return pixels
+        # Float models take [0, 1] inputs; quantized int8 inputs use the model's own scale
+        scale, zero_point = self._input_quantization
+        values = pixels.astype(np.float32) / 255.0
+        if scale:
+            return np.clip(np.round(values / scale + zero_point), -128, 127).astype(self._input_dtype)
+        return values.astype(self._input_dtype)
+
+    def _run_batch(self, inputs):
+        """
+        Score a (n, height, width, 3) array and return (n, labels) probabilities
+        """
+        count = len(inputs)
+        bucket = _batch_bucket(count)
+        if bucket != count:
+            inputs = np.concatenate([inputs, np.zeros((bucket - count,) + inputs.shape[1:], inputs.dtype)])
+
+        interpreter = self._interpreter(bucket)
+        with metrics.stage('inference'):
+            interpreter.set_tensor(interpreter.get_input_details()[0]['index'], inputs)
+            interpreter.invoke()
+            scores = interpreter.get_tensor(interpreter.get_output_details()[0]['index'])[:count]
+
+        scale, zero_point = self._output_quantization
+        if scale:
+            return (scores.astype(np.float32) - zero_point) * scale
+        return scores.astype(np.float32)
+
+    def _score_batch(self, images):
+        return list(self._run_batch(np.stack(images)))
+
+    def _top_k(self, scores, top_k):
+        order = np.argsort(-scores, kind='stable')[:top_k]
+        return [{'description': self.labels[i], 'score': float(scores[i])} for i in order]
+
+    def submit(self, content, top_k=DEFAULT_TOP_K):
+        """
+        Queue image bytes for classification; returns a Future of the top-k labels
+        """
+        result = Future()
+
+        def decoded(pixels_future):
+            try:
+                pixels = pixels_future.result()
+            except Exception as e:
+                result.set_exception(ValueError(f"Could not decode image: {e}"))
+                return
+            self._batcher.submit(pixels).add_done_callback(scored)
+
+        def scored(scores_future):
+            try:
+                result.set_result(self._top_k(scores_future.result(), top_k))
+            except Exception as e:
+                result.set_exception(e)
+
+        # Decode in the caller's context so the preprocess stage is timed against its route
+        self._decoder.submit(contextvars.copy_context().run, self.preprocess, content).add_done_callback(decoded)
+        return result
+
+    def classify(self, content, top_k=DEFAULT_TOP_K):
+        """
+        Classify image bytes and return [{'description': label, 'score': p}, ...]
+        """
+        return self.submit(content, top_k).result()
+
+    async def classify_async(self, content, top_k=DEFAULT_TOP_K):
+        return await asyncio.wrap_future(self.submit(content, top_k))
+
+    def stats(self):
+        return self._batcher.stats()
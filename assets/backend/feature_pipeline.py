@@ -0,0 +1,67 @@
+import numpy as np
+
+# Numeric inputs, in the order they follow the two encoded columns in FEATURES
+NUMERIC_FIELDS = ['Year', 'average_rain_fall_mm_per_year', 'pesticides_tonnes', 'avg_temp']
+
+
+class FeaturePipeline:
+    """
+    Compiled replacement for the per-call DataFrame/LabelEncoder/StandardScaler path.
+
+    Built once from the fitted encoders (and scaler, when the backend needs
+    scaled inputs). Area and Item are encoded with dict lookups, values are
+    written straight into a float32 array in FEATURES order, and scaling is
+    applied in place as x * (1 / scale) + (-mean / scale).
+    """
+
+    def __init__(self, area_encoder, item_encoder, scaler=None):
+        self.area_codes = {str(label): code for code, label in enumerate(area_encoder.classes_)}
+        self.item_codes = {str(label): code for code, label in enumerate(item_encoder.classes_)}
+        self.width = 2 + len(NUMERIC_FIELDS)
+
+        if scaler is not None:
+            scale = np.asarray(scaler.scale_, dtype=np.float64)
+            mean = np.asarray(scaler.mean_, dtype=np.float64)
+            self.multiplier = (1.0 / scale).astype(np.float32)
+            self.offset = (-mean / scale).astype(np.float32)
+        else:
+            self.multiplier = None
+            self.offset = None
+
+    def area_code(self, area):
+        try:
+            return self.area_codes[area]
+        except KeyError:
+            raise ValueError(f"Unknown Area: {area}") from None
+
+    def item_code(self, item):
+        try:
+            return self.item_codes[item]
+        except KeyError:
+            raise ValueError(f"Unknown Item: {item}") from None
+
+    def transform(self, records):
+        """
+        Turn coerced records (see CropYieldPredictor._coerce_record) into a model input array
+
+        Raises ValueError naming the first unknown Area or Item.
+        """
+        out = np.empty((len(records), self.width), dtype=np.float32)
+        for i, record in enumerate(records):
+            out[i, 0] = self.area_code(record['Area'])
+            out[i, 1] = self.item_code(record['Item'])
+            out[i, 2] = record['Year']
+            out[i, 3] = record['average_rain_fall_mm_per_year']
+            out[i, 4] = record['pesticides_tonnes']
+            out[i, 5] = record['avg_temp']
+
+        return self.scale(out)
+
+    def scale(self, out):
+        """
+        Scale an unscaled (n, width) float32 feature array in place and return it
+        """
+        if self.multiplier is not None:
+            out *= self.multiplier
+            out += self.offset
+        return out
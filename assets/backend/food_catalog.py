@@ -0,0 +1,170 @@
+import re
+import threading
+import numpy as np
+import pandas as pd
+
+_TOKEN_RE = re.compile(r'\w+')
+_WORD_RE = re.compile(r'^\w+$')
+
+# Upper bound on memoized per-pattern masks (patterns come from user input)
+MAX_CACHED_MASKS = 1024
+
+
+# Food Recommendation System
+def recommend_foods(df, dietary_preference=None, min_sustainability_score=0):
+    # Filter by dietary preference
+    if dietary_preference:
+        df = df[df["Dietary Tags"].str.contains(dietary_preference, case=False, na=False)]
+
+    # Filter by minimum sustainability score
+    df = df[df["Sustainability Score"] >= min_sustainability_score]
+
+    # Sort by Sustainability Score (higher is better)
+    df = df.sort_values(by="Sustainability Score", ascending=False)
+
+    return df
+
+# Filter allergens
+def filter_allergies(df, allergies):
+    for allergen in allergies:
+        df = df[~df["Food Name"].str.contains(allergen, case=False, na=False)]
+    return df
+
+# Filter nutritional requirements
+def filter_nutrition(df, min_protein=None, max_calories=None, min_vitamins=None):
+    if max_calories:
+        df = df[df["Calories"] <= max_calories]
+    return df
+
+
+class FoodCatalog:
+    """
+    Precomputed indexes over the food database for fast filtering.
+
+    Built once from the food DataFrame, it answers the same queries as
+    recommend_foods, filter_allergies and filter_nutrition:
+
+    - dietary tags: one boolean row mask per distinct "Dietary Tags" string,
+      so a preference is matched against the few distinct tag strings
+      instead of every row
+    - allergens: an inverted index from lowercase word tokens of
+      "Food Name" to rows; single-word allergens are matched against the
+      token vocabulary, anything else falls back to a scan of the names
+    - sustainability: row ids presorted by descending score, so a minimum
+      score is a binary search for a prefix
+    - calories: row ids sorted by calories for max_calories cut-offs
+
+    Matching is case-insensitive substring matching like the pandas path,
+    but patterns are treated literally rather than as regular expressions.
+    """
+
+    def __init__(self, df):
+        self.df = df.reset_index(drop=True)
+        self.size = len(self.df)
+
+        names = self.df["Food Name"].fillna('').astype(str)
+        self.names = names.to_numpy(dtype=object)
+        self._lower_names = names.str.lower().tolist()
+
+        # Distinct tag strings -> rows carrying them
+        tags = self.df["Dietary Tags"].fillna('').astype(str).str.lower()
+        codes, uniques = pd.factorize(tags)
+        self._tag_codes = codes
+        self._tag_values = list(uniques)
+
+        # Token -> row ids, for allergen lookups
+        token_rows = {}
+        for row, name in enumerate(self._lower_names):
+            for token in set(_TOKEN_RE.findall(name)):
+                token_rows.setdefault(token, []).append(row)
+        self._token_rows = {token: np.asarray(rows, dtype=np.int64) for token, rows in token_rows.items()}
+        self._name_missing = self.df["Food Name"].isna().to_numpy()
+
+        # Sustainability order (descending, stable) and the matching scores
+        scores = pd.to_numeric(self.df["Sustainability Score"], errors='coerce').to_numpy(dtype=float)
+        self.scores = scores
+        self._score_order = np.argsort(-np.nan_to_num(scores, nan=-np.inf), kind='stable')
+        # Negated so the descending scores form an ascending array for searchsorted
+        self._neg_sorted_scores = -scores[self._score_order]
+
+        # Calorie index
+        calories = pd.to_numeric(self.df["Calories"], errors='coerce').to_numpy(dtype=float)
+        self.calories = calories
+        self._calorie_order = np.argsort(calories, kind='stable')
+        self._sorted_calories = calories[self._calorie_order]
+
+        self._lock = threading.Lock()
+        self._tag_mask_cache = {}
+        self._allergen_mask_cache = {}
+
+    def _remember(self, cache, key, mask):
+        with self._lock:
+            if len(cache) >= MAX_CACHED_MASKS:
+                cache.clear()
+            cache[key] = mask
+
+    def _tag_mask(self, dietary_preference):
+        key = dietary_preference.lower()
+        mask = self._tag_mask_cache.get(key)
+        if mask is None:
+            matching = np.fromiter((key in value for value in self._tag_values), dtype=bool,
+                                   count=len(self._tag_values))
+            mask = matching[self._tag_codes] if self.size else np.zeros(0, dtype=bool)
+            self._remember(self._tag_mask_cache, key, mask)
+        return mask
+
+    def _allergen_mask(self, allergen):
+        key = allergen.lower()
+        mask = self._allergen_mask_cache.get(key)
+        if mask is None:
+            mask = np.zeros(self.size, dtype=bool)
+            if _WORD_RE.match(key):
+                # A word-only pattern can only occur inside a single token
+                for token, rows in self._token_rows.items():
+                    if key in token:
+                        mask[rows] = True
+            elif key == '':
+                # The empty pattern matches every non-missing name, like str.contains('')
+                mask = ~self._name_missing
+            else:
+                mask = np.fromiter((key in name for name in self._lower_names), dtype=bool, count=self.size)
+            self._remember(self._allergen_mask_cache, key, mask)
+        return mask
+
+    def filter_rows(self, dietary_preference=None, allergies=(), max_calories=None, min_sustainability_score=0):
+        """
+        Row ids matching all filters, ordered by descending Sustainability Score
+        """
+        mask = None
+        if dietary_preference:
+            mask = self._tag_mask(dietary_preference).copy()
+
+        for allergen in allergies or ():
+            allergen_mask = self._allergen_mask(allergen)
+            if mask is None:
+                mask = ~allergen_mask
+            else:
+                mask &= ~allergen_mask
+
+        if max_calories:
+            within = np.zeros(self.size, dtype=bool)
+            count = np.searchsorted(self._sorted_calories, max_calories, side='right')
+            within[self._calorie_order[:count]] = True
+            mask = within if mask is None else mask & within
+
+        # Prefix of the presorted order with score >= minimum
+        count = np.searchsorted(self._neg_sorted_scores, -min_sustainability_score, side='right')
+        rows = self._score_order[:count]
+        if mask is not None:
+            rows = rows[mask[rows]]
+        return rows
+
+    def recommend_foods(self, dietary_preference=None, min_sustainability_score=0):
+        """
+        Indexed equivalent of recommend_foods(df, ...); returns a DataFrame
+        """
+        rows = self.filter_rows(dietary_preference, min_sustainability_score=min_sustainability_score)
+        return self.df.iloc[rows]
+
+    def food_names(self, rows):
+        return self.names[rows].tolist()
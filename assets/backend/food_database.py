@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from food_catalog import FoodCatalog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_DIR = os.environ.get('FOOD_DB_SNAPSHOT_DIR', 'food_snapshot')
+DEFAULT_REFRESH_SECONDS = float(os.environ.get('FOOD_DB_REFRESH_SECONDS', 60 * 60))
+
+# Number of older snapshot versions kept next to the current one
+KEEP_SNAPSHOTS = 2
+
+_CURRENT_FILE = 'CURRENT'
+_MANIFEST_FILE = 'manifest.json'
+
+
+class GoogleSheetSource:
+    """
+    Reads the food database from a Google Sheet (first worksheet)
+    """
+
+    def __init__(self, credentials_file, sheet_url):
+        self.credentials_file = credentials_file
+        self.sheet_url = sheet_url
+
+    def fetch_records(self):
+        import gspread
+        from google.oauth2.service_account import Credentials
+
+        scopes = ["https://www.googleapis.com/auth/spreadsheets"]
+        creds = Credentials.from_service_account_file(self.credentials_file, scopes=scopes)
+        client = gspread.authorize(creds)
+        sheet = client.open_by_url(self.sheet_url).sheet1
+        return sheet.get_all_records()
+
+
+class LocalSheetSource:
+    """
+    Local stand-in for the Google Sheet: a CSV file or a JSON list of records
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def fetch_records(self):
+        if self.path.endswith('.json'):
+            with open(self.path) as f:
+                return json.load(f)
+        return pd.read_csv(self.path, keep_default_na=False).to_dict('records')
+
+
+def records_checksum(records):
+    """
+    Content hash of the fetched records, used to skip rebuilding unchanged data
+    """
+    payload = json.dumps(records, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+def write_snapshot(df, snapshot_dir, checksum):
+    """
+    Write df as one .npy file per column into a new version directory and
+    atomically point CURRENT at it. Returns the version name.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    version = f"v{time.strftime('%Y%m%d%H%M%S')}-{checksum[:8]}"
+    tmp_dir = os.path.join(snapshot_dir, f".tmp-{version}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = []
+    for i, column in enumerate(df.columns):
+        values = df[column]
+        if not pd.api.types.is_numeric_dtype(values):
+            # Sheet numbers with blank cells arrive as mixed int/'' (or string) columns
+            numeric = pd.to_numeric(values.replace('', np.nan), errors='coerce')
+            if numeric.notna().sum() == (values != '').sum():
+                values = numeric
+        if pd.api.types.is_numeric_dtype(values):
+            array = values.to_numpy()
+        else:
+            # Fixed-width unicode keeps the file memory-mappable
+            array = values.astype(str).to_numpy(dtype=str)
+        np.save(os.path.join(tmp_dir, f"col{i}.npy"), array, allow_pickle=False)
+        columns.append({'name': str(column), 'file': f"col{i}.npy"})
+
+    with open(os.path.join(tmp_dir, _MANIFEST_FILE), 'w') as f:
+        json.dump({'version': version, 'checksum': checksum, 'rows': len(df),
+                   'columns': columns, 'created': time.time()}, f)
+
+    final_dir = os.path.join(snapshot_dir, version)
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+
+    # Swap the pointer last so readers only ever see complete versions
+    pointer_tmp = os.path.join(snapshot_dir, _CURRENT_FILE + '.tmp')
+    with open(pointer_tmp, 'w') as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(snapshot_dir, _CURRENT_FILE))
+
+    _prune_snapshots(snapshot_dir, version)
+    return version
+
+
+def _prune_snapshots(snapshot_dir, current):
+    versions = sorted(d for d in os.listdir(snapshot_dir)
+                      if d.startswith('v') and os.path.isdir(os.path.join(snapshot_dir, d)) and d != current)
+    for old in versions[:-KEEP_SNAPSHOTS] if KEEP_SNAPSHOTS else versions:
+        shutil.rmtree(os.path.join(snapshot_dir, old), ignore_errors=True)
+
+
+def read_snapshot(snapshot_dir):
+    """
+    Load the current snapshot as (DataFrame, manifest), or None if there is none
+    """
+    try:
+        with open(os.path.join(snapshot_dir, _CURRENT_FILE)) as f:
+            version = f.read().strip()
+        version_dir = os.path.join(snapshot_dir, version)
+        with open(os.path.join(version_dir, _MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    data = {}
+    for column in manifest['columns']:
+        data[column['name']] = np.load(os.path.join(version_dir, column['file']), mmap_mode='r', allow_pickle=False)
+    # Numeric columns stay backed by the memory-mapped files (copy=False).
+    # pandas can't hold fixed-width unicode arrays, so text columns are
+    # necessarily converted to Python strings here; they are the small part
+    # of the snapshot, and this is still far cheaper than parsing the sheet
+    df = pd.DataFrame({name: (values.astype(object) if values.dtype.kind == 'U' else np.asarray(values))
+                       for name, values in data.items()}, copy=False)
+    return df, manifest
+
+
+class FoodDatabase:
+    """
+    The food database, served from a local columnar snapshot.
+
+    load() reads the last snapshot (falling back to the sheet only when no
+    snapshot exists). refresh() re-fetches the sheet, and when its content
+    changed writes a new snapshot and swaps in a new (df, catalog) pair in
+    one assignment, so readers never see a DataFrame paired with another
+    version's catalog. If the sheet can't be reached the last good
+    snapshot keeps serving.
+    """
+
+    def __init__(self, source, snapshot_dir=DEFAULT_SNAPSHOT_DIR, refresh_seconds=DEFAULT_REFRESH_SECONDS):
+        self.source = source
+        self.snapshot_dir = snapshot_dir
+        self.refresh_seconds = refresh_seconds
+        self._state = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_refresh_error = None
+
+    @property
+    def df(self):
+        return self._state[0]
+
+    @property
+    def catalog(self):
+        return self._state[1]
+
+    @property
+    def version(self):
+        return self._state[2]['version']
+
+    def _swap(self, df, manifest):
+        self._state = (df, FoodCatalog(df), manifest)
+
+    def load(self):
+        """
+        Load the latest snapshot, or fetch from the source if there is none yet
+        """
+        snapshot = read_snapshot(self.snapshot_dir)
+        if snapshot is not None:
+            df, manifest = snapshot
+            self._swap(df, manifest)
+            logger.info(f"Food database loaded from snapshot {manifest['version']} ({manifest['rows']} rows)")
+            return self
+
+        if not self.refresh():
+            raise RuntimeError(f"No food database snapshot and source unavailable: {self.last_refresh_error}")
+        return self
+
+    def refresh(self):
+        """
+        Fetch the source and swap in a new version if it changed
+
+        Returns True when the database is current, False if the fetch failed.
+        """
+        with self._refresh_lock:
+            try:
+                records = self.source.fetch_records()
+                checksum = records_checksum(records)
+                if self._state is not None and self._state[2].get('checksum') == checksum:
+                    self.last_refresh_error = None
+                    return True
+
+                df = pd.DataFrame(records)
+                version = write_snapshot(df, self.snapshot_dir, checksum)
+                # Serve what was written so fresh and restarted processes agree
+                df, manifest = read_snapshot(self.snapshot_dir)
+                self._swap(df, manifest)
+                self.last_refresh_error = None
+                logger.info(f"Food database refreshed to {version} ({len(df)} rows)")
+                return True
+            except Exception as e:
+                self.last_refresh_error = str(e)
+                logger.error(f"Food database refresh failed, keeping last snapshot: {e}")
+                return False
+
+    def start_background_refresh(self):
+        """
+        Refresh every refresh_seconds on a daemon thread
+        """
+        if self._thread is not None or not self.refresh_seconds:
+            return self._thread
+
+        def run():
+            while not self._stop.wait(self.refresh_seconds):
+                self.refresh()
+
+        self._thread = threading.Thread(target=run, name='food-db-refresh', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        manifest = self._state[2] if self._state else {}
+        return {
+            'version': manifest.get('version'),
+            'rows': manifest.get('rows'),
+            'created': manifest.get('created'),
+            'last_refresh_error': self.last_refresh_error
+        }
@@ -0,0 +1,212 @@
+import io
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Longest side, in pixels, of the image sent for labelling; larger uploads
+# are decoded at reduced size and re-encoded as JPEG. Label detection gains
+# nothing from full-resolution phone photos
+MAX_DIMENSION = int(os.environ.get('DETECT_MAX_DIMENSION', 1024))
+JPEG_QUALITY = int(os.environ.get('DETECT_JPEG_QUALITY', 85))
+
+# Uploads are copied into a temporary file that stays in memory up to this
+# size and spills to disk beyond it
+SPOOL_MEMORY_BYTES = int(os.environ.get('DETECT_SPOOL_MEMORY_BYTES', 1024 * 1024))
+MAX_UPLOAD_BYTES = int(os.environ.get('DETECT_MAX_UPLOAD_BYTES', 20 * 1024 * 1024))
+# Request body limit for the servers: the upload plus multipart headers and
+# any other form fields. Larger bodies are refused before they are read
+MAX_REQUEST_BYTES = MAX_UPLOAD_BYTES + 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Prepared images kept by content hash, so a re-uploaded photo is neither
+# decoded nor re-encoded again. Only re-encoded images are held, bounded by
+# count and total bytes; uploads sent unchanged are remembered without
+# their bytes
+MAX_PREPARED = int(os.environ.get('DETECT_PREPARED_ENTRIES', 64))
+MAX_PREPARED_BYTES = int(os.environ.get('DETECT_PREPARED_BYTES', 16 * 1024 * 1024))
+
+STAGES = ('spool', 'decode', 'resize', 'encode')
+
+PreparedImage = namedtuple('PreparedImage', ['content', 'digest', 'original_bytes', 'sent_bytes',
+                                             'size', 'original_size', 'resized'])
+
+
+def _held(prepared):
+    return len(prepared.content) if prepared.content is not None else 0
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES."""
+
+
+def spool(stream, max_bytes=MAX_UPLOAD_BYTES, chunk_size=CHUNK_SIZE):
+    """
+    Copy an upload stream into a spooled temporary file in chunks, hashing it on the way
+
+    Returns (file positioned at the start, size in bytes, sha256 hex digest).
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            buffer.close()
+            raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+        digest.update(chunk)
+        buffer.write(chunk)
+    buffer.seek(0)
+    return buffer, size, digest.hexdigest()
+
+
+class ImagePreprocessor:
+    """
+    Shrink /detect uploads before they are sent for labelling.
+
+    prepare() spools the upload while hashing it, decodes JPEGs at a reduced
+    scale (Pillow's draft mode skips most of the DCT work), downscales to
+    max_dimension and re-encodes. Images already small enough are sent as
+    uploaded, as are formats Pillow can't read, which the Vision API may
+    still accept. Results are kept by content hash, so duplicate uploads
+    skip decoding; the digest also keys the label cache in the servers.
+    Undecodable uploads are not kept, so they are tried again on a repeat.
+    """
+
+    def __init__(self, max_dimension: int = MAX_DIMENSION, quality: int = JPEG_QUALITY,
+                 max_upload_bytes: int = MAX_UPLOAD_BYTES, max_prepared: int = MAX_PREPARED,
+                 max_prepared_bytes: int = MAX_PREPARED_BYTES):
+        self.max_dimension = max_dimension
+        self.quality = quality
+        self.max_upload_bytes = max_upload_bytes
+        self.max_prepared = max_prepared
+        self.max_prepared_bytes = max_prepared_bytes
+        self._prepared = OrderedDict()
+        self._prepared_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'images': 0, 'duplicates': 0, 'resized': 0, 'undecodable': 0,
+                       'bytes_in': 0, 'bytes_out': 0}
+        self._seconds = dict.fromkeys(STAGES, 0.0)
+
+    def _timed(self, stage, timings, fn, *args):
+        start = time.perf_counter()
+        with metrics.stage(stage):
+            result = fn(*args)
+        timings[stage] = time.perf_counter() - start
+        return result
+
+    def prepare(self, stream) -> PreparedImage:
+        """
+        The bytes to send for an upload stream; raises UploadTooLarge
+        """
+        timings = {}
+        buffer, size, digest = self._timed('spool', timings, spool, stream, self.max_upload_bytes)
+        try:
+            with self._lock:
+                prepared = self._prepared.get(digest)
+                if prepared is not None:
+                    self._prepared.move_to_end(digest)
+            duplicate = prepared is not None
+            if not duplicate:
+                prepared = self._shrink(buffer, size, digest, timings)
+                if prepared.size is not None:
+                    self._keep(prepared)
+            elif prepared.content is None:
+                # Sent unchanged last time; only that decision was kept
+                prepared = prepared._replace(content=self._original(buffer))
+        finally:
+            buffer.close()
+
+        with self._lock:
+            self._stats['images'] += 1
+            self._stats['duplicates'] += duplicate
+            self._stats['bytes_in'] += prepared.original_bytes
+            self._stats['bytes_out'] += prepared.sent_bytes
+            for stage, seconds in timings.items():
+                self._seconds[stage] += seconds
+        return prepared
+
+    def _keep(self, prepared):
+        entry = prepared if prepared.resized else prepared._replace(content=None)
+        with self._lock:
+            previous = self._prepared.pop(prepared.digest, None)
+            if previous is not None:
+                self._prepared_bytes -= _held(previous)
+            self._prepared[prepared.digest] = entry
+            self._prepared_bytes += _held(entry)
+            while self._prepared and (len(self._prepared) > self.max_prepared or
+                                      self._prepared_bytes > self.max_prepared_bytes):
+                _, evicted = self._prepared.popitem(last=False)
+                self._prepared_bytes -= _held(evicted)
+
+    def _shrink(self, buffer, size, digest, timings):
+        from PIL import Image
+
+        try:
+            image, source_format, original_size, oriented = self._timed('decode', timings, self._decode, buffer)
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+            logger.info(f"Sending upload {digest[:12]} unchanged; Pillow could not decode it: {e}")
+            with self._lock:
+                self._stats['undecodable'] += 1
+            return PreparedImage(self._original(buffer), digest, size, size, None, None, False)
+
+        if max(image.size) > self.max_dimension:
+            self._timed('resize', timings, image.thumbnail, (self.max_dimension, self.max_dimension),
+                        Image.BILINEAR, 2.0)
+        if image.size == original_size and source_format == 'JPEG' and not oriented:
+            # Already small enough; re-encoding would only cost quality
+            return PreparedImage(self._original(buffer), digest, size, size, image.size, original_size, False)
+
+        content = self._timed('encode', timings, self._encode, image)
+        if image.size == original_size and len(content) >= size:
+            return PreparedImage(self._original(buffer), digest, size, size, image.size, original_size, False)
+        with self._lock:
+            self._stats['resized'] += 1
+        return PreparedImage(content, digest, size, len(content), image.size, original_size, True)
+
+    def _original(self, buffer):
+        buffer.seek(0)
+        return buffer.read()
+
+    def _decode(self, buffer):
+        from PIL import Image, ImageOps
+
+        image = Image.open(buffer)
+        source_format = image.format
+        original_size = image.size
+        # JPEG only: decode at the smallest 1/2, 1/4 or 1/8 scale still covering the target size
+        scale = min(1.0, self.max_dimension / max(image.size))
+        image.draft('RGB', (max(1, int(image.width * scale)), max(1, int(image.height * scale))))
+        oriented = image.getexif().get(0x0112, 1) != 1
+        if oriented:
+            # Re-encoding drops EXIF, so apply its orientation to the pixels
+            image = ImageOps.exif_transpose(image)
+        image.load()
+        return image, source_format, original_size, oriented
+
+    def _encode(self, image):
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        out = io.BytesIO()
+        image.save(out, format='JPEG', quality=self.quality)
+        return out.getvalue()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            seconds = dict(self._seconds)
+            stats['prepared_entries'] = len(self._prepared)
+            stats['prepared_bytes'] = self._prepared_bytes
+        stats['bytes_saved'] = stats['bytes_in'] - stats['bytes_out']
+        stats['stage_seconds'] = {stage: round(total, 4) for stage, total in seconds.items()}
+        stats['max_dimension'] = self.max_dimension
+        return stats
@@ -0,0 +1,150 @@
+import json
+
+
+class IncrementalSectionParser:
+    """
+    Incrementally parse a streamed JSON object and emit each completed section.
+
+    Text is fed in arbitrary chunks as it arrives from the model. Anything
+    before the first '{' (such as a markdown fence) is skipped. For every
+    top-level field the parser emits:
+
+        {'section': key, 'index': i, 'data': element}   for each element of an array
+        {'section': key, 'data': value}                 for any other value
+
+    as soon as that element or value is complete, without waiting for the
+    rest of the document. Each section is still decoded with json.loads,
+    so malformed sections raise json.JSONDecodeError.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        self._array_key = None
+        self._array_index = 0
+        self._element_start = None
+
+        self.result = {}
+
+    @property
+    def finished(self):
+        """Whether the closing brace of the top-level object has been seen"""
+        return self._finished
+
+    def feed(self, text):
+        """
+        Consume the next chunk of text and return the list of completed sections
+        """
+        self._buffer += text
+        events = []
+        buffer = self._buffer
+
+        while self._pos < len(buffer) and not self._finished:
+            ch = buffer[self._pos]
+
+            if not self._started:
+                if ch == '{':
+                    self._started = True
+                    self._depth = 1
+                self._pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key_start is not None and self._key is None:
+                        self._key = json.loads(buffer[self._key_start:self._pos + 1])
+                        self._key_start = None
+                self._pos += 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None and self._value_start is None:
+                    self._key_start = self._pos
+                elif self._depth == 2 and self._array_key is not None and self._element_start is None:
+                    self._element_start = self._pos
+
+            elif ch == ':' and self._depth == 1 and self._key is not None and self._value_start is None:
+                self._value_start = self._pos + 1
+
+            elif ch in '{[':
+                if self._depth == 1 and self._value_start is not None and self._array_key is None:
+                    if ch == '[' and not buffer[self._value_start:self._pos].strip():
+                        self._array_key = self._key
+                        self._array_index = 0
+                        self.result[self._array_key] = []
+                elif self._depth == 2 and self._array_key is not None and self._element_start is None:
+                    self._element_start = self._pos
+                self._depth += 1
+
+            elif ch in '}]':
+                if self._depth == 2 and self._array_key is not None and ch == ']':
+                    self._emit_element(buffer, self._pos, events)
+                    self._array_key = None
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit_field(buffer, self._pos, events)
+                    self._finished = True
+
+            elif ch == ',':
+                if self._depth == 2 and self._array_key is not None:
+                    self._emit_element(buffer, self._pos, events)
+                elif self._depth == 1:
+                    self._emit_field(buffer, self._pos, events)
+
+            elif not ch.isspace():
+                if self._depth == 2 and self._array_key is not None and self._element_start is None:
+                    self._element_start = self._pos
+
+            self._pos += 1
+
+        return events
+
+    def _emit_element(self, buffer, end, events):
+        if self._element_start is None:
+            return
+        value = json.loads(buffer[self._element_start:end])
+        self.result[self._array_key].append(value)
+        events.append({'section': self._array_key, 'index': self._array_index, 'data': value})
+        self._array_index += 1
+        self._element_start = None
+
+    def _emit_field(self, buffer, end, events):
+        if self._key is None or self._value_start is None:
+            return
+        raw = buffer[self._value_start:end].strip()
+        # Arrays were already emitted element by element
+        if not raw.startswith('['):
+            value = json.loads(raw)
+            self.result[self._key] = value
+            events.append({'section': self._key, 'data': value})
+        self._key = None
+        self._value_start = None
+
+
+def sections_from_object(obj):
+    """
+    Emit the same section events for an already complete object (e.g. a cache hit)
+    """
+    events = []
+    for key, value in obj.items():
+        if isinstance(value, list):
+            for index, element in enumerate(value):
+                events.append({'section': key, 'index': index, 'data': element})
+        else:
+            events.append({'section': key, 'data': value})
+    return events
@@ -0,0 +1,264 @@
+import os
+import copy
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from response_cache import normalize_part
+
+logger = logging.getLogger(__name__)
+
+# <dir>/<kind>/<version>.json holds one generated knowledge base, CURRENT
+# names the one to serve and live.jsonl collects entries fetched live since
+KNOWLEDGE_BASE_DIR = os.environ.get('KNOWLEDGE_BASE_DIR', 'assets/knowledge_base')
+KEEP_VERSIONS = 3
+
+# Entries add() accepts beyond the built version, per kind; lookups for
+# arbitrary user-supplied names would otherwise grow memory and live.jsonl
+# without bound. The next build folds them in and resets the count
+MAX_LIVE_ENTRIES = int(os.environ.get('KNOWLEDGE_BASE_MAX_LIVE_ENTRIES', 1000))
+
+_CURRENT_FILE = 'CURRENT'
+_LIVE_FILE = 'live.jsonl'
+
+# Name lists the batch job generates entries for, per kind
+DEFAULT_NAME_FILES = {
+    'diseases': 'assets/models/disease_detection_model/dict.txt',
+    'pests': os.path.join(KNOWLEDGE_BASE_DIR, 'pests.txt'),
+}
+
+
+def prompt_checksum(prompt_fn):
+    """
+    Fingerprint of a prompt template, so entries generated from an older prompt can be detected
+    """
+    return hashlib.sha256(prompt_fn('{name}').encode('utf-8')).hexdigest()[:12]
+
+
+def read_names(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+class KnowledgeBase:
+    """
+    Precomputed model answers for a closed set of names, held in memory.
+
+    Loaded from the CURRENT version written by build() plus any entries
+    added live since. Lookups are dict reads on the normalized name; misses
+    are left to the caller, which can add() what it fetched so the next
+    lookup (and the next build) has it, up to max_live_entries.
+    """
+
+    def __init__(self, kind: str, directory: str = KNOWLEDGE_BASE_DIR, prompt_checksum: str = None,
+                 max_live_entries: int = MAX_LIVE_ENTRIES):
+        self.kind = kind
+        self.directory = os.path.join(directory, kind)
+        self.prompt_checksum = prompt_checksum
+        self.max_live_entries = max_live_entries
+        self.version = None
+        self._entries = {}
+        self._live_keys = set()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'live_additions': 0, 'live_rejected': 0}
+
+    def load(self):
+        """
+        Read the current version and the live additions; a missing store just starts empty
+        """
+        entries = {}
+        try:
+            with open(os.path.join(self.directory, _CURRENT_FILE)) as f:
+                version = f.read().strip()
+            with open(os.path.join(self.directory, f'{version}.json')) as f:
+                document = json.load(f)
+            entries.update(document['entries'])
+            self.version = document['version']
+            if self.prompt_checksum and document.get('prompt_checksum') != self.prompt_checksum:
+                logger.warning(f"{self.kind} knowledge base {self.version} was built from a different prompt; "
+                               f"rebuild it with knowledge_base.py build {self.kind}")
+        except FileNotFoundError:
+            logger.info(f"No {self.kind} knowledge base found in {self.directory}; all lookups go live")
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Could not load {self.kind} knowledge base: {e}")
+
+        live = _read_live(os.path.join(self.directory, _LIVE_FILE))
+        entries.update(live)
+        with self._lock:
+            self._entries = entries
+            self._live_keys = set(live)
+        logger.info(f"Loaded {len(entries)} {self.kind} knowledge base entries (version {self.version})")
+        return self
+
+    def get(self, name: str):
+        """
+        A copy of the stored answer for name, or None
+        """
+        entry = self._entries.get(normalize_part(name))
+        with self._lock:
+            self._stats['hits' if entry is not None else 'misses'] += 1
+        return copy.deepcopy(entry['info']) if entry is not None else None
+
+    def add(self, name: str, info: dict):
+        """
+        Store a live answer in memory and append it to live.jsonl for later builds
+
+        Returns False, storing nothing, once max_live_entries have been added.
+        """
+        entry = {'name': name, 'info': copy.deepcopy(info), 'created': time.time(),
+                 'prompt_checksum': self.prompt_checksum}
+        key = normalize_part(name)
+        with self._lock:
+            if key not in self._live_keys and len(self._live_keys) >= self.max_live_entries:
+                if not self._stats['live_rejected']:
+                    logger.warning(f"{self.kind} knowledge base has {self.max_live_entries} live entries; "
+                                   f"not storing more until the next build")
+                self._stats['live_rejected'] += 1
+                return False
+            self._entries[key] = entry
+            self._live_keys.add(key)
+            self._stats['live_additions'] += 1
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(os.path.join(self.directory, _LIVE_FILE), 'a') as f:
+                    f.write(json.dumps({'key': key, **entry}) + '\n')
+            except OSError as e:
+                logger.error(f"Could not persist {self.kind} knowledge base entry: {e}")
+        return True
+
+    def __contains__(self, name):
+        return normalize_part(name) in self._entries
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['version'] = self.version
+            stats['entries'] = len(self._entries)
+            stats['live_entries'] = len(self._live_keys)
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+            return stats
+
+
+def _read_live(path):
+    entries = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A write cut short by a crash; the rest of the file is still good
+                    continue
+                entries[record.pop('key')] = record
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def build(kind, names, fetch, directory=KNOWLEDGE_BASE_DIR, prompt_checksum=None, workers=4, only_missing=False):
+    """
+    Generate a new knowledge-base version by calling fetch(name) for every name
+
+    fetch is the provider's live lookup, returning (info, complete);
+    incomplete answers (fallbacks, repaired or padded responses) are left
+    out and retried by the next build. Entries added live since the
+    last build are folded in. With only_missing, names already in the
+    current version under the same prompt are kept rather than regenerated.
+    The new version becomes CURRENT and live.jsonl starts over.
+
+    Returns the new version's document.
+    """
+    kind_dir = os.path.join(directory, kind)
+    current = KnowledgeBase(kind, directory, prompt_checksum).load()
+    entries = {key: entry for key, entry in current._entries.items()
+               if entry.get('prompt_checksum', prompt_checksum) == prompt_checksum}
+
+    todo = [name for name in dict.fromkeys(names)
+            if not (only_missing and normalize_part(name) in entries)]
+    failed = []
+
+    def generate(name):
+        started = time.perf_counter()
+        info, complete = fetch(name)
+        return name, info, complete, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for name, info, complete, seconds in pool.map(generate, todo):
+            if not complete:
+                failed.append(name)
+                print(f"  failed  {name} ({seconds:.1f}s)")
+                continue
+            entries[normalize_part(name)] = {'name': name, 'info': info, 'created': time.time(),
+                                             'prompt_checksum': prompt_checksum}
+            print(f"  built   {name} ({seconds:.1f}s)")
+
+    version = time.strftime('%Y%m%dT%H%M%S', time.gmtime())
+    document = {'kind': kind, 'version': version, 'created': time.time(), 'prompt_checksum': prompt_checksum,
+                'failed': failed, 'entries': entries}
+
+    os.makedirs(kind_dir, exist_ok=True)
+    tmp_file = os.path.join(kind_dir, f'{version}.json.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(document, f, indent=1, sort_keys=True)
+    os.replace(tmp_file, os.path.join(kind_dir, f'{version}.json'))
+
+    tmp_file = os.path.join(kind_dir, _CURRENT_FILE + '.tmp')
+    with open(tmp_file, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp_file, os.path.join(kind_dir, _CURRENT_FILE))
+
+    # Everything live is now in the version; a server appending concurrently
+    # may lose that entry from the file, and will simply fetch it again
+    try:
+        os.remove(os.path.join(kind_dir, _LIVE_FILE))
+    except FileNotFoundError:
+        pass
+
+    versions = sorted(f for f in os.listdir(kind_dir) if f.endswith('.json') and f != f'{version}.json')
+    for old in versions[:-KEEP_VERSIONS + 1] if KEEP_VERSIONS > 1 else versions:
+        os.remove(os.path.join(kind_dir, old))
+    return document
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate the plant disease / pest knowledge base")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help="generate a new version from a list of names")
+    build_parser.add_argument('kind', choices=sorted(DEFAULT_NAME_FILES))
+    build_parser.add_argument('--names', help="file with one name per line (default: the kind's catalog)")
+    build_parser.add_argument('--directory', default=KNOWLEDGE_BASE_DIR)
+    build_parser.add_argument('--workers', type=int, default=4, help="concurrent model calls")
+    build_parser.add_argument('--only-missing', action='store_true',
+                              help="keep existing entries built from the same prompt")
+    stats_parser = commands.add_parser('stats', help="show the current version")
+    stats_parser.add_argument('kind', choices=sorted(DEFAULT_NAME_FILES))
+    stats_parser.add_argument('--directory', default=KNOWLEDGE_BASE_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'stats':
+        print(KnowledgeBase(args.kind, args.directory).load().stats())
+        return
+
+    if args.kind == 'diseases':
+        from plant_disease_info import PlantDiseaseInfo
+        provider = PlantDiseaseInfo()
+        fetch, prompt = provider.fetch_disease_information, provider._disease_prompt
+    else:
+        from pest_disease_info import PestInfo
+        provider = PestInfo()
+        fetch, prompt = provider.fetch_pest_information, provider._pest_prompt
+
+    names = read_names(args.names or DEFAULT_NAME_FILES[args.kind])
+    print(f"Building {args.kind} knowledge base for {len(names)} names")
+    document = build(args.kind, names, lambda name: fetch(name, with_status=True), args.directory,
+                     prompt_checksum(prompt), args.workers, args.only_missing)
+    print(f"Version {document['version']}: {len(document['entries'])} entries, {len(document['failed'])} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class LazySubsystem:
+    """
+    A subsystem (client, model, data set) that is imported and built on first use.
+
+    The factory runs at most once at a time; concurrent callers wait for the
+    same initialization. A failed initialization is retried on the next get().
+    """
+
+    def __init__(self, name, factory):
+        self.name = name
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._instance = None
+        self._state = 'pending'
+        self._error = None
+        self._load_seconds = None
+
+    @property
+    def ready(self):
+        return self._state == 'ready'
+
+    def get(self):
+        """
+        Return the initialized subsystem, building it if needed
+        """
+        if self._state == 'ready':
+            return self._instance
+
+        with self._lock:
+            if self._state == 'ready':
+                return self._instance
+
+            self._state = 'loading'
+            start = time.perf_counter()
+            try:
+                instance = self._factory()
+            except Exception as e:
+                self._state = 'failed'
+                self._error = str(e)
+                logger.error(f"Failed to initialize {self.name}: {e}")
+                raise
+
+            self._instance = instance
+            self._load_seconds = time.perf_counter() - start
+            self._error = None
+            self._state = 'ready'
+            logger.info(f"{self.name} ready in {self._load_seconds:.2f}s")
+            return instance
+
+    def replace(self, instance):
+        """
+        Install a prebuilt instance, e.g. a local stub backend for load tests
+        """
+        with self._lock:
+            self._instance = instance
+            self._error = None
+            self._load_seconds = 0.0
+            self._state = 'ready'
+
+    def status(self):
+        """
+        Report the subsystem state without triggering initialization
+        """
+        status = {'state': self._state}
+        if self._load_seconds is not None:
+            status['load_seconds'] = round(self._load_seconds, 3)
+        if self._error:
+            status['error'] = self._error
+        return status
+
+
+def start_warmup(subsystems):
+    """
+    Initialize the given subsystems one after another on a background daemon thread
+    """
+    def warm():
+        for subsystem in subsystems:
+            try:
+                subsystem.get()
+            except Exception:
+                # Already logged; the subsystem will retry on first use
+                pass
+
+    thread = threading.Thread(target=warm, name='subsystem-warmup', daemon=True)
+    thread.start()
+    return thread
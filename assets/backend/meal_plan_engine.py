@@ -0,0 +1,229 @@
+import numpy as np
+import metrics
+
+MEALS_PER_DAY = ["Breakfast", "Lunch", "Dinner"]
+DURATION_DAYS = {'daily': 1, 'weekly': 7}
+OBJECTIVES = ('random', 'sustainability')
+
+
+# Random foods tried per meal before falling back to listing every food that fits
+DRAWS_PER_MEAL = 32
+# Foods checked at a time, best first, for the sustainability objective
+SCAN_CHUNK = 256
+
+
+class _Day:
+    """
+    Which foods can fill the next meal of a day: those with repeats left
+    that still leave room in the daily budget for the cheapest servings
+    available for the rest of the day.
+    """
+
+    def __init__(self, calories, cheap, remaining, daily_calorie_budget):
+        self.calories = calories
+        # The cheapest foods; enough of them that the plan can't exhaust them all
+        self.cheap = cheap
+        self.remaining = remaining
+        self.budget = daily_calorie_budget
+        self.total = 0.0
+        self.menu = []
+
+    def open(self, left):
+        """
+        Prepare for a meal with `left` more to follow; False if the day can't be completed
+        """
+        if self.budget is None:
+            return True
+        head = self.cheap[self.remaining[self.cheap] > 0]
+        servings = np.repeat(self.calories[head], np.minimum(self.remaining[head], left + 1))[:left + 1]
+        if len(servings) <= left:
+            return False
+        self.rest = servings[:left].sum()
+        self.cut = servings[left - 1] if left else -np.inf
+        self.next = servings[left]
+        return True
+
+    def fits(self, foods):
+        ok = self.remaining[foods] > 0
+        if self.budget is not None:
+            calories = self.calories[foods]
+            # Taking one of the cheapest servings brings the next one into the rest of the day
+            rest = np.where(calories <= self.cut, self.rest - calories + self.next, self.rest)
+            ok &= self.total + calories + rest <= self.budget
+        return ok
+
+    def take(self, food):
+        self.menu.append(food)
+        self.remaining[food] -= 1
+        self.total += self.calories[food]
+
+
+def _draw_plan(rows, calories, scores, days, daily_calorie_budget, max_repeats, objective, rng):
+    """
+    Build the plan day by day from the foods that can still fit. Returns
+    the food rows of the plan, day-major.
+
+    Foods are drawn at random, or for the sustainability objective the
+    highest-scoring food that fits is taken. If that runs a later day out
+    of options, the plan is rebuilt deterministically, taking the most
+    calorific food that fits (which leaves the cheap foods for the days
+    that need them) and spreading repeats.
+    """
+    meals = len(MEALS_PER_DAY)
+    slots = days * meals
+    scores = np.nan_to_num(scores[rows], nan=0.0)
+    calories = calories[rows]
+
+    if daily_calorie_budget is not None:
+        # A food only fits if the cheapest foods leave room for it in the day
+        fits = calories <= daily_calorie_budget - (meals - 1) * calories.min()
+        rows, scores, calories = rows[fits], scores[fits], calories[fits]
+        if len(rows) == 0:
+            raise ValueError("No meal plan found within the daily calorie budget and repeat limit")
+
+    n = len(rows)
+    if max_repeats is not None and n * max_repeats < slots:
+        raise ValueError(f"Not enough foods ({n}) to fill {slots} meals with at most {max_repeats} repeats each")
+    if objective == 'random' and daily_calorie_budget is None and max_repeats is None:
+        # Unconstrained random plan: every draw is feasible
+        return rows[rng.integers(n, size=slots)]
+
+    everything = np.arange(n)
+    # Fewer than slots + meals foods can run out, so the cheapest servings left are always among these
+    pool = min(n, slots + meals)
+    cheap = np.argpartition(calories, pool - 1)[:pool]
+    cheap = cheap[np.argsort(calories[cheap], kind='stable')]
+    by_score = np.argsort(-scores, kind='stable')
+
+    def draw(day):
+        tries = rng.integers(n, size=DRAWS_PER_MEAL)
+        found = tries[day.fits(tries)]
+        if len(found) == 0:
+            found = everything[day.fits(everything)]
+            rng.shuffle(found)
+        return found[0] if len(found) else None
+
+    def best(day):
+        for start in range(0, n, SCAN_CHUNK):
+            chunk = by_score[start:start + SCAN_CHUNK]
+            found = chunk[day.fits(chunk)]
+            if len(found):
+                return found[0]
+        return None
+
+    def greedy(day):
+        found = everything[day.fits(everything)]
+        if len(found) == 0:
+            return None
+        keys = (scores[found], day.remaining[found])
+        if daily_calorie_budget is not None:
+            keys += (calories[found],)
+        return found[np.lexsort(keys)[-1]]
+
+    def fill(pick):
+        remaining = np.full(n, max_repeats if max_repeats is not None else slots, dtype=np.int64)
+        plan = []
+        for _ in range(days):
+            day = _Day(calories, cheap, remaining, daily_calorie_budget)
+            for meal in range(meals):
+                food = pick(day) if day.open(meals - meal - 1) else None
+                if food is None:
+                    return None
+                day.take(food)
+            plan.extend(day.menu)
+        return rows[np.asarray(plan, dtype=np.int64)]
+
+    for pick in ((draw if objective == 'random' else best), greedy):
+        plan = fill(pick)
+        if plan is not None:
+            return plan
+    raise ValueError("No meal plan found within the daily calorie budget and repeat limit")
+
+
+def plan_meals(catalog, dietary_preference=None, allergies=(), duration='weekly', max_calories=None,
+               min_sustainability_score=0, daily_calorie_budget=None, max_repeats=None,
+               objective='random', seed=None):
+    """
+    Generate a meal plan from a FoodCatalog.
+
+    Args:
+        catalog: FoodCatalog to draw foods from
+        dietary_preference, allergies, max_calories, min_sustainability_score:
+            food filters, as in generate_meal_plan (max_calories applies per food)
+        duration: 'daily' or 'weekly'
+        daily_calorie_budget: maximum total calories of each day's meals
+        max_repeats: maximum number of times any food appears in the plan
+        objective: 'random' for any feasible plan, 'sustainability' to
+            favour the highest Sustainability Scores
+        seed: seed (int or sequence of ints) for a reproducible plan
+
+    Returns:
+        dict: plan in the same shape as generate_meal_plan
+    """
+    if duration not in DURATION_DAYS:
+        raise ValueError("Invalid duration. Choose 'daily' or 'weekly'.")
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Invalid objective. Choose one of: {', '.join(OBJECTIVES)}")
+    if max_repeats is not None and max_repeats < 1:
+        raise ValueError("max_repeats must be at least 1")
+
+    with metrics.stage('filter'):
+        rows = catalog.filter_rows(dietary_preference, allergies, max_calories, min_sustainability_score)
+    if daily_calorie_budget is not None:
+        # Foods without a calorie value can't be checked against the budget
+        rows = rows[~np.isnan(catalog.calories[rows])]
+    if len(rows) == 0:
+        raise ValueError("No foods match the given filters")
+
+    days = DURATION_DAYS[duration]
+    rng = np.random.default_rng(seed)
+    plan_rows = _draw_plan(rows, catalog.calories, catalog.scores, days, daily_calorie_budget,
+                           max_repeats, objective, rng)
+
+    names = catalog.food_names(plan_rows)
+    meals = len(MEALS_PER_DAY)
+    if duration == 'daily':
+        return {"Today:": dict(zip(MEALS_PER_DAY, names))}
+    return {f"Day {day + 1}:": dict(zip(MEALS_PER_DAY, names[day * meals:(day + 1) * meals]))
+            for day in range(days)}
+
+
+def plan_options(data):
+    """
+    Read plan_meals keyword arguments from a /generate-meal-plan request body
+    """
+    options = {
+        'dietary_preference': data['dietary_preference'],
+        'allergies': data['allergies'],
+        'duration': data['duration'],
+        'max_calories': data.get('max_calories'),
+        'min_sustainability_score': data.get('min_sustainability_score', 0),
+        'objective': data.get('objective', 'random'),
+        'seed': data.get('seed'),
+    }
+    if data.get('daily_calorie_budget') is not None:
+        options['daily_calorie_budget'] = float(data['daily_calorie_budget'])
+    if data.get('max_repeats') is not None:
+        options['max_repeats'] = int(data['max_repeats'])
+    return options
+
+
+def plan_meals_batch(catalog, requests, seed=None):
+    """
+    Generate one plan per request body; failures are reported per item
+
+    With a batch seed, item i without its own seed uses the seed [seed, i],
+    so the whole batch is reproducible.
+    """
+    results = []
+    for i, data in enumerate(requests):
+        try:
+            options = plan_options(data)
+            if options['seed'] is None and seed is not None:
+                options['seed'] = [seed, i]
+            results.append({'success': True, 'data': plan_meals(catalog, **options)})
+        except KeyError as e:
+            results.append({'success': False, 'error': f"Missing required field: {e.args[0]}"})
+        except (ValueError, TypeError) as e:
+            results.append({'success': False, 'error': str(e)})
+    return results
@@ -0,0 +1,241 @@
+import os
+import time
+import random
+import bisect
+import threading
+import contextvars
+
+# Fraction of requests timed (per-route histograms and stage breakdowns);
+# 0 turns instrumentation off, leaving a module-constant check per stage
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 1.0))
+ENABLED = METRICS_SAMPLE_RATE > 0
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; spans in-process work (sub-millisecond) up to slow upstream calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Route of the request being handled, and whether it was sampled
+_route = contextvars.ContextVar('metrics_route', default='-')
+_sampled = contextvars.ContextVar('metrics_sampled', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """
+    Prometheus-style histogram keyed by a fixed tuple of label names.
+    """
+
+    def __init__(self, name, documentation, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # labels -> [per-bucket counts (last is +Inf), sum]
+        self._series = {}
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        for labels, (counts, total) in sorted(series.items()):
+            base = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            prefix = base + ',' if base else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{base}}} {total}')
+            lines.append(f'{self.name}_count{{{base}}} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            base = ','.join(f'{name}="{_escape(v)}"' for name, v in zip(self.label_names, labels))
+            lines.append(f'{self.name}{{{base}}} {value}')
+        return lines
+
+
+requests_total = Counter('http_requests_total', "Requests handled, sampled or not", ('route', 'method', 'status'))
+request_duration = Histogram('http_request_duration_seconds', "Request latency of sampled requests",
+                             ('route', 'method', 'status'))
+stage_duration = Histogram('stage_duration_seconds',
+                           "Time in upstream, parse, inference, preprocess, filter and serialization stages "
+                           "of sampled requests", ('route', 'stage'))
+_METRICS = (requests_total, request_duration, stage_duration)
+
+
+class _Stage:
+    __slots__ = ('route', 'name', 'started')
+
+    def __init__(self, route, name):
+        self.route = route
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        stage_duration.observe((self.route, self.name), time.perf_counter() - self.started)
+        return False
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    """
+    Context manager timing one stage of the current request
+
+    Labelled with the route being served (or the scope set by route_scope).
+    Outside a sampled request it is a shared no-op.
+    """
+    if not ENABLED:
+        return _NULL_STAGE
+    sampled = _sampled.get()
+    if sampled is None:
+        # No request context (e.g. a batching thread): sample independently
+        sampled = random.random() < METRICS_SAMPLE_RATE
+    return _Stage(_route.get(), name) if sampled else _NULL_STAGE
+
+
+class route_scope:
+    """
+    Label stages run outside any request, such as a micro-batch, with a fixed route name
+    """
+
+    def __init__(self, route):
+        self.route = route
+
+    def __enter__(self):
+        self._token = _route.set(self.route)
+        return self
+
+    def __exit__(self, *exc):
+        _route.reset(self._token)
+        return False
+
+
+def _begin(route):
+    _route.set(route)
+    sampled = random.random() < METRICS_SAMPLE_RATE
+    _sampled.set(sampled)
+    return time.perf_counter() if sampled else None
+
+
+def _finish(route, method, status, started):
+    labels = (route, method, str(status))
+    requests_total.inc(labels)
+    if started is not None:
+        request_duration.observe(labels, time.perf_counter() - started)
+
+
+def render():
+    """
+    All metrics in the Prometheus text exposition format
+    """
+    if not ENABLED:
+        return "# metrics disabled (METRICS_SAMPLE_RATE=0)\n"
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _timed_json_provider(base):
+    class TimedJSONProvider(base):
+        def dumps(self, obj, **kwargs):
+            with stage('serialization'):
+                return super().dumps(obj, **kwargs)
+
+    return TimedJSONProvider
+
+
+def instrument_flask(app):
+    """
+    Time every request to a Flask app and the JSON serialization of its responses
+    """
+    if not ENABLED:
+        return app
+    from flask import request, g
+    from flask.json.provider import DefaultJSONProvider
+
+    app.json = _timed_json_provider(DefaultJSONProvider)(app)
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.metrics_started = _begin(g.metrics_route)
+
+    @app.after_request
+    def _stop_timer(response):
+        _finish(g.get('metrics_route', 'unmatched'), request.method, response.status_code,
+                g.get('metrics_started'))
+        return response
+
+    return app
+
+
+def instrument_quart(app):
+    """
+    Async counterpart of instrument_flask; hooks must be coroutines so the
+    route and sampling context stay on the request's task
+    """
+    if not ENABLED:
+        return app
+    from quart import request, g
+    from quart.json.provider import DefaultJSONProvider
+
+    app.json = _timed_json_provider(DefaultJSONProvider)(app)
+
+    @app.before_request
+    async def _start_timer():
+        g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.metrics_started = _begin(g.metrics_route)
+
+    @app.after_request
+    async def _stop_timer(response):
+        _finish(g.get('metrics_route', 'unmatched'), request.method, response.status_code,
+                g.get('metrics_started'))
+        return response
+
+    return app
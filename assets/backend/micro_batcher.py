@@ -0,0 +1,109 @@
+import time
+import queue
+import asyncio
+import logging
+import threading
+import metrics
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Group concurrently submitted items into batches for a single call.
+
+    A dispatcher thread takes the first queued item and calls
+    run_batch(items) once for it and whatever else is queued. A lone item
+    is dispatched at once; when others are already waiting, collection
+    continues until max_batch_size items are taken or max_wait_ms has
+    passed since the first, so the window only applies under load.
+    run_batch must return one result per item, in order; a result that is
+    an Exception instance is raised to that item's caller only. If
+    run_batch itself raises, every caller in the batch gets the error.
+    """
+
+    def __init__(self, name, run_batch, max_batch_size=32, max_wait_ms=2.0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._run_batch = run_batch
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._stats = {'items': 0, 'batches': 0, 'max_batch': 0, 'batch_seconds': 0.0}
+        self._thread = threading.Thread(target=self._dispatch, name=f'{name}-batcher', daemon=True)
+        self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        if self.max_batch_size == 1:
+            return batch
+        try:
+            batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            # Nothing else queued: waiting out the window would only add latency
+            return batch
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch(self):
+        while True:
+            pending = [(item, future) for item, future in self._collect() if future.set_running_or_notify_cancel()]
+            if not pending:
+                continue
+
+            start = time.perf_counter()
+            try:
+                # Stages timed inside run_batch are attributed to the batcher, not a route
+                with metrics.route_scope(f'batch:{self.name}'):
+                    results = self._run_batch([item for item, _ in pending])
+                if len(results) != len(pending):
+                    raise RuntimeError(f"{self.name}: run_batch returned {len(results)} results for {len(pending)} items")
+            except Exception as e:
+                logger.error(f"{self.name} batch of {len(pending)} failed: {e}")
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - start
+
+            with self._stats_lock:
+                self._stats['items'] += len(pending)
+                self._stats['batches'] += 1
+                self._stats['max_batch'] = max(self._stats['max_batch'], len(pending))
+                self._stats['batch_seconds'] += elapsed
+
+            for (_, future), result in zip(pending, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def submit(self, item):
+        """
+        Queue an item; returns a Future of its result
+        """
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def call(self, item):
+        return self.submit(item).result()
+
+    async def call_async(self, item):
+        return await asyncio.wrap_future(self.submit(item))
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['mean_batch'] = round(stats['items'] / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['batch_seconds'] = round(stats['batch_seconds'], 3)
+        stats['queued'] = self._queue.qsize()
+        return stats
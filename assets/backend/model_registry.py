@@ -0,0 +1,194 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import argparse
+
+# Files that make up one version of the crop-yield model; model.keras or
+# model.npz may be missing depending on how the version was produced
+ARTIFACTS = ('model.keras', 'model.npz', 'scaler.joblib', 'encoders.joblib')
+REQUIRED_ARTIFACTS = ('scaler.joblib', 'encoders.joblib')
+
+MANIFEST_FILE = 'manifest.json'
+CURRENT_FILE = 'CURRENT'
+VERSIONS_DIR = 'versions'
+
+# Version ids name directories under VERSIONS_DIR, so nothing that could
+# step outside it (separators, '..', leading dots) is accepted
+VERSION_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9._-]{0,63}')
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_manifest(directory, version=None):
+    """
+    Manifest of the artifacts in a directory: sha256 and size per file
+
+    Without an explicit version the id is derived from the checksums, so the
+    same artifacts always get the same id.
+    """
+    files = {}
+    for name in ARTIFACTS:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            files[name] = {'sha256': file_checksum(path), 'bytes': os.path.getsize(path)}
+
+    missing = [name for name in REQUIRED_ARTIFACTS if name not in files]
+    if missing or not ('model.keras' in files or 'model.npz' in files):
+        raise ValueError(f"Incomplete model artifacts in {directory}: need {', '.join(REQUIRED_ARTIFACTS)} "
+                         f"and model.keras or model.npz")
+
+    if version is None:
+        combined = hashlib.sha256(''.join(files[name]['sha256'] for name in sorted(files)).encode())
+        version = combined.hexdigest()[:12]
+    return {'version': version, 'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'files': files}
+
+
+def verify(directory, manifest):
+    """
+    Raise ValueError if any artifact listed in the manifest is missing or altered
+    """
+    for name, expected in manifest['files'].items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            raise ValueError(f"Model version {manifest['version']} is missing {name}")
+        if file_checksum(path) != expected['sha256']:
+            raise ValueError(f"Checksum mismatch for {name} in model version {manifest['version']}")
+
+
+def version_dir(model_path, version):
+    if not isinstance(version, str) or not VERSION_PATTERN.fullmatch(version):
+        raise ValueError(f"Invalid model version id: {version!r}")
+    return os.path.join(model_path, VERSIONS_DIR, version)
+
+
+def check_published(model_path, version):
+    """
+    Raise ValueError unless version is a well-formed id among list_versions(model_path)
+    """
+    version_dir(model_path, version)
+    if version not in list_versions(model_path):
+        raise ValueError(f"Unknown model version: {version}")
+
+
+def list_versions(model_path):
+    root = os.path.join(model_path, VERSIONS_DIR)
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root)
+                  if os.path.exists(os.path.join(root, name, MANIFEST_FILE)))
+
+
+def current_version(model_path):
+    """
+    Version named by the CURRENT pointer, or None for the flat (unversioned) layout
+    """
+    try:
+        with open(os.path.join(model_path, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def resolve(model_path, version=None):
+    """
+    Locate and verify a model version; returns (directory, manifest)
+
+    version defaults to the CURRENT pointer. A model_path without one is
+    served from its flat artifacts, versioned by content checksum.
+    """
+    version = version or current_version(model_path)
+    if version is None:
+        return model_path, build_manifest(model_path)
+
+    directory = version_dir(model_path, version)
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"Unknown model version: {version}") from None
+    verify(directory, manifest)
+    return directory, manifest
+
+
+def activate(model_path, version):
+    """
+    Point CURRENT at a published version (atomic rename)
+    """
+    if not os.path.exists(os.path.join(version_dir(model_path, version), MANIFEST_FILE)):
+        raise ValueError(f"Unknown model version: {version}")
+    tmp_file = os.path.join(model_path, CURRENT_FILE + '.tmp')
+    with open(tmp_file, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp_file, os.path.join(model_path, CURRENT_FILE))
+
+
+def publish(model_path, source_dir, version=None, make_current=True):
+    """
+    Copy the artifacts in source_dir into a new immutable version under model_path
+
+    The version directory is assembled under a temporary name and renamed
+    into place, so a half-written version is never visible. Returns the
+    manifest.
+    """
+    manifest = build_manifest(source_dir, version)
+    version = manifest['version']
+    target = version_dir(model_path, version)
+    if os.path.exists(target):
+        raise ValueError(f"Model version already exists: {version}")
+
+    staging = os.path.join(model_path, VERSIONS_DIR, f'.{version}.tmp')
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for name in manifest['files']:
+        shutil.copy2(os.path.join(source_dir, name), os.path.join(staging, name))
+    with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    verify(staging, manifest)
+    os.rename(staging, target)
+
+    if make_current:
+        activate(model_path, version)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage versions of the crop-yield model")
+    parser.add_argument('--model-path', default='assets/models/crop_yield_model')
+    commands = parser.add_subparsers(dest='command', required=True)
+    publish_parser = commands.add_parser('publish', help="publish a directory of artifacts as a new version")
+    publish_parser.add_argument('source', help="directory with model.keras/model.npz, scaler.joblib, encoders.joblib")
+    publish_parser.add_argument('--version', help="version id (default: checksum of the artifacts)")
+    publish_parser.add_argument('--no-activate', action='store_true', help="publish without moving CURRENT")
+    activate_parser = commands.add_parser('activate', help="point CURRENT at a published version")
+    activate_parser.add_argument('version')
+    commands.add_parser('list', help="list published versions")
+    verify_parser = commands.add_parser('verify', help="check a version's checksums")
+    verify_parser.add_argument('version', nargs='?')
+    args = parser.parse_args()
+
+    if args.command == 'publish':
+        manifest = publish(args.model_path, args.source, args.version, make_current=not args.no_activate)
+        print(f"Published model version {manifest['version']}")
+    elif args.command == 'activate':
+        activate(args.model_path, args.version)
+        print(f"Active model version: {args.version}")
+    elif args.command == 'list':
+        current = current_version(args.model_path)
+        for version in list_versions(args.model_path):
+            print(f"{'*' if version == current else ' '} {version}")
+    else:
+        directory, manifest = resolve(args.model_path, args.version)
+        print(f"Model version {manifest['version']} OK ({directory})")
+
+
+if __name__ == "__main__":
+    main()
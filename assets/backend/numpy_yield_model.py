@@ -0,0 +1,239 @@
+import os
+import io
+import json
+import zipfile
+import logging
+import argparse
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# File name of the exported NumPy model inside the model directory
+NUMPY_MODEL_FILE = 'model.npz'
+
+_ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+}
+
+
+class NumpyYieldModel:
+    """
+    NumPy-only runtime for the exported crop-yield network.
+
+    The exported weights already include the StandardScaler and the
+    BatchNormalization layers, so predict() takes raw (unscaled) feature
+    rows in FEATURES order and runs a plain stack of dense layers.
+    """
+
+    def __init__(self, weights, biases, activations):
+        self.weights = weights
+        self.biases = biases
+        self.activations = activations
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an exported .npz model file
+        """
+        with np.load(path, allow_pickle=False) as data:
+            count = int(data['layer_count'])
+            weights = [np.ascontiguousarray(data[f'W{i}'], dtype=np.float32) for i in range(count)]
+            biases = [np.ascontiguousarray(data[f'b{i}'], dtype=np.float32) for i in range(count)]
+            activations = [str(a) for a in data['activations']]
+
+        for activation in activations:
+            if activation not in _ACTIVATIONS:
+                raise ValueError(f"Unsupported activation in exported model: {activation}")
+
+        return cls(weights, biases, activations)
+
+    @property
+    def input_size(self):
+        return self.weights[0].shape[0]
+
+    def predict(self, features):
+        """
+        Predict yields for a (n, input_size) array of raw features
+
+        Returns a 1-D float32 array of length n.
+        """
+        x = np.asarray(features, dtype=np.float32)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+
+        for W, b, activation in zip(self.weights, self.biases, self.activations):
+            x = x @ W
+            x += b
+            x = _ACTIVATIONS[activation](x)
+
+        return x[:, 0]
+
+
+def _read_keras_archive(keras_file):
+    """
+    Read layer configs and weights from a Keras 3 .keras archive without TensorFlow
+    """
+    import h5py
+
+    with zipfile.ZipFile(keras_file) as archive:
+        config = json.loads(archive.read('config.json'))
+        weights_bytes = archive.read('model.weights.h5')
+
+    layers = []
+    with h5py.File(io.BytesIO(weights_bytes), 'r') as h5:
+        for layer in config['config']['layers']:
+            name = layer['config']['name']
+            variables = []
+            group = h5.get(f'layers/{name}/vars')
+            if group is not None:
+                variables = [np.array(group[str(i)], dtype=np.float64) for i in range(len(group))]
+            layers.append((layer['class_name'], layer['config'], variables))
+
+    return layers
+
+
+def fold_layers(layers, scaler):
+    """
+    Fold the scaler and BatchNormalization layers into the dense weights
+
+    Every non-dense transform here is a per-feature affine map (x * a + c)
+    applied to the input of the next Dense layer, so it can be absorbed as
+    W' = a[:, None] * W and b' = b + c @ W.
+
+    Returns (weights, biases, activations) lists for NumpyYieldModel.
+    """
+    # The StandardScaler is the first input-side affine map
+    pending_scale = 1.0 / np.asarray(scaler.scale_, dtype=np.float64)
+    pending_shift = -np.asarray(scaler.mean_, dtype=np.float64) * pending_scale
+
+    weights, biases, activations = [], [], []
+
+    for class_name, config, variables in layers:
+        if class_name in ('InputLayer', 'Dropout'):
+            # Dropout is the identity at inference time
+            continue
+
+        if class_name == 'Dense':
+            kernel = variables[0]
+            bias = variables[1] if config.get('use_bias', True) else np.zeros(kernel.shape[1])
+
+            if pending_scale is not None:
+                bias = bias + pending_shift @ kernel
+                kernel = pending_scale[:, None] * kernel
+                pending_scale = pending_shift = None
+
+            weights.append(kernel)
+            biases.append(bias)
+            activations.append(config.get('activation', 'linear'))
+
+        elif class_name == 'BatchNormalization':
+            if pending_scale is not None:
+                raise ValueError("Consecutive normalization layers are not supported")
+
+            # Variable order follows Keras: gamma, beta, moving_mean, moving_variance
+            idx = 0
+            gamma = variables[idx] if config.get('scale', True) else None
+            idx += 1 if gamma is not None else 0
+            beta = variables[idx] if config.get('center', True) else None
+            idx += 1 if beta is not None else 0
+            moving_mean, moving_variance = variables[idx], variables[idx + 1]
+
+            inv_std = 1.0 / np.sqrt(moving_variance + config.get('epsilon', 1e-3))
+            pending_scale = inv_std * (gamma if gamma is not None else 1.0)
+            pending_shift = (beta if beta is not None else 0.0) - moving_mean * pending_scale
+
+        else:
+            raise ValueError(f"Unsupported layer type for NumPy export: {class_name}")
+
+    if pending_scale is not None:
+        raise ValueError("Model cannot end with a normalization layer")
+
+    for activation in activations:
+        if activation not in _ACTIVATIONS:
+            raise ValueError(f"Unsupported activation for NumPy export: {activation}")
+
+    return weights, biases, activations
+
+
+def export_numpy_model(model_path, output_file=None):
+    """
+    Export model.keras + scaler.joblib from model_path into a compact .npz file
+
+    Returns the path of the written file.
+    """
+    import joblib
+
+    scaler = joblib.load(os.path.join(model_path, 'scaler.joblib'))
+    layers = _read_keras_archive(os.path.join(model_path, 'model.keras'))
+    weights, biases, activations = fold_layers(layers, scaler)
+
+    arrays = {'layer_count': np.array(len(weights)), 'activations': np.array(activations)}
+    for i, (W, b) in enumerate(zip(weights, biases)):
+        arrays[f'W{i}'] = W.astype(np.float32)
+        arrays[f'b{i}'] = b.astype(np.float32)
+
+    output_file = output_file or os.path.join(model_path, NUMPY_MODEL_FILE)
+
+    # Write to a temp file first so readers never see a partial model
+    tmp_file = output_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_file, output_file)
+
+    logger.info(f"NumPy model exported to {output_file}")
+    return output_file
+
+
+def verify_parity(model_path, numpy_file=None, samples=2000, seed=0):
+    """
+    Compare the exported NumPy model against the Keras model on random inputs
+
+    Inputs are drawn around the scaler's training distribution. Returns a dict
+    with the maximum absolute and relative differences.
+    """
+    import joblib
+    import tensorflow as tf
+
+    scaler = joblib.load(os.path.join(model_path, 'scaler.joblib'))
+    keras_model = tf.keras.models.load_model(os.path.join(model_path, 'model.keras'))
+    numpy_model = NumpyYieldModel.load(numpy_file or os.path.join(model_path, NUMPY_MODEL_FILE))
+
+    rng = np.random.default_rng(seed)
+    features = scaler.mean_ + rng.standard_normal((samples, len(scaler.mean_))) * scaler.scale_ * 2
+
+    expected = keras_model.predict((features - scaler.mean_) / scaler.scale_, verbose=0)[:, 0]
+    actual = numpy_model.predict(features)
+
+    # Relative error is measured against the typical output magnitude so that
+    # predictions near zero don't dominate the float32 rounding comparison
+    abs_diff = np.abs(expected - actual)
+    denominator = np.maximum(np.abs(expected), np.abs(expected).mean())
+    return {
+        'samples': samples,
+        'max_abs_diff': float(abs_diff.max()),
+        'max_rel_diff': float((abs_diff / denominator).max())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the crop-yield model for NumPy-only serving")
+    parser.add_argument('--model-path', default='assets/models/crop_yield_model')
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--verify', action='store_true', help="check parity against the Keras model")
+    parser.add_argument('--tolerance', type=float, default=1e-4, help="max allowed relative difference")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    path = export_numpy_model(args.model_path, args.output)
+    print(f"Exported {path}")
+
+    if args.verify:
+        report = verify_parity(args.model_path, path)
+        print(f"Parity: {report}")
+        if report['max_rel_diff'] > args.tolerance:
+            raise SystemExit("Parity check failed")
+
+
+if __name__ == "__main__":
+    main()
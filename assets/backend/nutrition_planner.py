@@ -1,50 +1,37 @@
-import gspread
-from google.oauth2.service_account import Credentials
 import pandas as pd
 import random
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import google.generativeai as genai
 import os
+import metrics
+from upstream import UpstreamClient
+from single_flight import SingleFlight
+from response_cache import ResponseCache, normalize_part
+from food_catalog import recommend_foods, filter_allergies, filter_nutrition
+from food_database import FoodDatabase, GoogleSheetSource
 print("Current working directory:", os.getcwd())
-scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-
-creds = Credentials.from_service_account_file("path-to-your-credentials.json", scopes=scopes)
-
-client = gspread.authorize(creds)
 
 sheet_url = "https://docs.google.com/spreadsheets/d/1x2u92DmTs_oMGqrE_czdS7tC7AruOwTv6mN7LJIXSeg/edit?usp=sharing" # Food database Google Sheet
-sheet = client.open_by_url(sheet_url).sheet1
-
-data = sheet.get_all_records()
 
-df = pd.DataFrame(data)
+# Served from the local snapshot; the sheet is only downloaded when no
+# snapshot exists yet and then re-checked in the background
+food_db = FoodDatabase(GoogleSheetSource("path-to-your-credentials.json", sheet_url)).load()
+food_db.start_background_refresh()
 
 genai.configure(api_key="YOUR_API_KEY") # Google Generative AI API Key
 
-# Food Recommendation System
-def recommend_foods(df, dietary_preference=None, min_sustainability_score=0):
-    # Filter by dietary preference
-    if dietary_preference:
-        df = df[df["Dietary Tags"].str.contains(dietary_preference, case=False, na=False)]
-
-    # Filter by minimum sustainability score
-    df = df[df["Sustainability Score"] >= min_sustainability_score]
-
-    # Sort by Sustainability Score (higher is better)
-    df = df.sort_values(by="Sustainability Score", ascending=False)
-
-    return df
+# One reused model handle for recipe suggestions, with a deadline and retries
+recipe_client = UpstreamClient('recipes', "gemini-1.5-pro-latest")
+# Generated recipes, per (ingredient, meal type); identical requests in
+# flight at the same time share one upstream call
+recipe_cache = ResponseCache('recipes')
+recipe_inflight = SingleFlight('recipes')
 
-# Filter allergens
-def filter_allergies(df, allergies):
-    for allergen in allergies:
-        df = df[~df["Food Name"].str.contains(allergen, case=False, na=False)]
-    return df
-
-# Filter nutritional requirements
-def filter_nutrition(df, min_protein=None, max_calories=None, min_vitamins=None):
-    if max_calories:
-        df = df[df["Calories"] <= max_calories]
-    return df
+# Recipes one batch request generates at once; the upstream client's
+# process-wide limit still applies on top
+RECIPE_BATCH_CONCURRENCY = int(os.environ.get('RECIPE_BATCH_CONCURRENCY', 6))
 
 # Generate a meal plan
 def generate_meal_plan(df, dietary_preference, allergies, duration, max_calories=None, min_sustainability_score=0):
@@ -57,15 +44,18 @@ def generate_meal_plan(df, dietary_preference, allergies, duration, max_calories
     # Filter nutritional requirements
     filtered_foods = filter_nutrition(filtered_foods, max_calories)
 
-    # Generate meal plan
+    return build_meal_plan(filtered_foods["Food Name"].tolist(), duration)
+
+# Pick a food for every meal of the plan
+def build_meal_plan(food_names, duration):
     meal_plan = {}
     meals_per_day = ["Breakfast", "Lunch", "Dinner"]
 
     if duration == "daily":
-        meal_plan["Today:"] = {meal: random.choice(filtered_foods["Food Name"].tolist()) for meal in meals_per_day}
+        meal_plan["Today:"] = {meal: random.choice(food_names) for meal in meals_per_day}
     elif duration == "weekly":
         for day in range(1, 8):
-            meal_plan[f"Day {day}:"] = {meal: random.choice(filtered_foods["Food Name"].tolist()) for meal in meals_per_day}
+            meal_plan[f"Day {day}:"] = {meal: random.choice(food_names) for meal in meals_per_day}
     else:
         raise ValueError("Invalid duration. Choose 'daily' or 'weekly'.")
 
@@ -79,18 +69,131 @@ def display_meal_plan(meal_plan):
             print(f"{meal}: {food}")
 
 # Generate recipe suggestions using Gemini
-def suggest_recipes(ingredient, meal_type):
-    model = genai.GenerativeModel("gemini-1.5-pro-latest")
-
-    prompt = f"Suggest a {meal_type} recipe using {ingredient}. Include a brief description and step-by-step instructions. Include sustainability score and calories per serving too. Ensure no words are bolded and the ingredients are clearly marked with bullet points (\"🍳\") if necessary and the steps are numbered. Don't include asterisks as bullet points."
+def recipe_prompt(ingredient, meal_type):
+    return f"Suggest a {meal_type} recipe using {ingredient}. Include a brief description and step-by-step instructions. Include sustainability score and calories per serving too. Ensure no words are bolded and the ingredients are clearly marked with bullet points (\"🍳\") if necessary and the steps are numbered. Don't include asterisks as bullet points."
+
+def _recipe_key(ingredient, meal_type):
+    return recipe_cache.make_key('recipe', ingredient, meal_type)
+
+def _generate_recipe(ingredient, meal_type):
+    """
+    Generate a recipe and cache it; raises if generation fails
+    """
+    prompt = recipe_prompt(ingredient, meal_type)
+    with metrics.stage('upstream'):
+        recipe = recipe_inflight.do(prompt, lambda: recipe_client.generate(prompt)).text
+    recipe_cache.set(_recipe_key(ingredient, meal_type), recipe)
+    return recipe
+
+async def _generate_recipe_async(ingredient, meal_type):
+    prompt = recipe_prompt(ingredient, meal_type)
+    with metrics.stage('upstream'):
+        recipe = (await recipe_inflight.do_async(prompt, lambda: recipe_client.generate_async(prompt))).text
+    recipe_cache.set(_recipe_key(ingredient, meal_type), recipe)
+    return recipe
 
+def suggest_recipes(ingredient, meal_type):
+    cached = recipe_cache.get(_recipe_key(ingredient, meal_type))
+    if cached is not None:
+        return cached
     try:
         # Generate recipe using Gemini
-        response = model.generate_content(prompt)
-        return response.text
+        return _generate_recipe(ingredient, meal_type)
     except Exception as e:
         return f"Failed to generate recipe: {e}"
 
+# Async variant of suggest_recipes for the ASGI server
+async def suggest_recipes_async(ingredient, meal_type):
+    cached = recipe_cache.get(_recipe_key(ingredient, meal_type))
+    if cached is not None:
+        return cached
+    try:
+        return await _generate_recipe_async(ingredient, meal_type)
+    except Exception as e:
+        return f"Failed to generate recipe: {e}"
+
+# Distinct (ingredient, meal type) pairs of a meal plan
+def meal_plan_pairs(meal_plan):
+    """
+    Deduplicate the meals of a plan ({"Day 1:": {"Breakfast": food, ...}, ...})
+    into [{'ingredient', 'meal_type', 'meals': ["Day 1: Breakfast", ...]}, ...]
+    in plan order; spellings that normalize the same count as one pair.
+    """
+    if not isinstance(meal_plan, dict) or not all(isinstance(meals, dict) for meals in meal_plan.values()):
+        raise ValueError("meal_plan must map each day to {meal type: food}")
+    pairs = {}
+    for day, meals in meal_plan.items():
+        for meal_type, food in meals.items():
+            key = (normalize_part(food), normalize_part(meal_type))
+            pair = pairs.setdefault(key, {'ingredient': food, 'meal_type': meal_type, 'meals': []})
+            pair['meals'].append(f"{day.rstrip(':')}: {meal_type}")
+    return list(pairs.values())
+
+def _recipe_event(pair, cached=None):
+    event = dict(pair)
+    try:
+        event['recipe'] = cached if cached is not None else _generate_recipe(pair['ingredient'], pair['meal_type'])
+    except Exception as e:
+        event['error'] = f"Failed to generate recipe: {e}"
+    event['cached'] = cached is not None
+    return event
+
+# Recipes for many pairs, yielded as each one is ready
+def suggest_recipes_batch(pairs, concurrency=RECIPE_BATCH_CONCURRENCY):
+    """
+    Yield {**pair, 'recipe' or 'error', 'cached'} for every pair from
+    meal_plan_pairs, cached ones first and the rest in completion order,
+    generating up to `concurrency` at once.
+    """
+    misses = []
+    for pair in pairs:
+        cached = recipe_cache.get(_recipe_key(pair['ingredient'], pair['meal_type']))
+        if cached is not None:
+            yield _recipe_event(pair, cached)
+        else:
+            misses.append(pair)
+    if not misses:
+        return
+
+    pool = ThreadPoolExecutor(max_workers=min(concurrency, len(misses)))
+    try:
+        # Each call runs in a copy of the request's context so its timings keep the route label
+        futures = [pool.submit(contextvars.copy_context().run, _recipe_event, pair) for pair in misses]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # A client that disconnects mid-stream cancels the recipes not started yet
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# Async variant of suggest_recipes_batch for the ASGI server
+async def suggest_recipes_batch_async(pairs, concurrency=RECIPE_BATCH_CONCURRENCY):
+    misses = []
+    for pair in pairs:
+        cached = recipe_cache.get(_recipe_key(pair['ingredient'], pair['meal_type']))
+        if cached is not None:
+            yield _recipe_event(pair, cached)
+        else:
+            misses.append(pair)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def generate(pair):
+        event = dict(pair, cached=False)
+        async with semaphore:
+            try:
+                event['recipe'] = await _generate_recipe_async(pair['ingredient'], pair['meal_type'])
+            except Exception as e:
+                event['error'] = f"Failed to generate recipe: {e}"
+        return event
+
+    tasks = [asyncio.ensure_future(generate(pair)) for pair in misses]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
 # Main Program
 def main():
     try:
@@ -102,19 +205,23 @@ def main():
         min_sustainability_score = int(input("Enter minimum sustainability score: "))
 
         # Generate meal plan
-        meal_plan = generate_meal_plan(df, dietary_preference, allergies, duration, max_calories, min_sustainability_score)
+        meal_plan = generate_meal_plan(food_db.df, dietary_preference, allergies, duration, max_calories, min_sustainability_score)
 
         # Display meal plan
         print("\n--- Meal Plan ---")
         display_meal_plan(meal_plan)
 
-        # Suggest recipes
+        # Suggest recipes, generating each distinct one once and concurrently
         print("\n--- Recipe Suggestions ---")
+        recipes = {}
+        for event in suggest_recipes_batch(meal_plan_pairs(meal_plan)):
+            for meal in event['meals']:
+                recipes[meal] = event.get('recipe', event.get('error'))
         for day, meals in meal_plan.items():
             print(f"\n{day}")
             for meal, food in meals.items():
                 print(f"\n{meal}: {food}")
-                print(suggest_recipes(food, meal))
+                print(recipes[f"{day.rstrip(':')}: {meal}"])
     except ValueError as e:
         print(f"Error: {e}")
     except Exception as e:
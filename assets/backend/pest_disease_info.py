@@ -1,107 +1,157 @@
 import google.generativeai as genai
 import logging
-from typing import Dict, Any
-import json
+import metrics
+from typing import Dict, Any, Tuple
+from single_flight import SingleFlight
+from upstream import UpstreamClient
+from structured_output import StructuredOutputParser, JSON_GENERATION_CONFIG, CLEAN_OUTCOMES
+from knowledge_base import KnowledgeBase, prompt_checksum
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Keys the prompt asks for; a response missing any of them (typically one
+# cut off mid-way) is treated as a failed generation
+PEST_INFO_SCHEMA = {
+    "type": "object",
+    "required": ["description", "causes", "symptoms", "treatment", "prevention"],
+    "properties": {
+        "description": {"type": "string"},
+        "causes": {"type": "array"},
+        "symptoms": {"type": "array"},
+        "treatment": {"type": "array"},
+        "prevention": {"type": "array"},
+    },
+}
+
 # Configure the Gemini API with your API key
 def configure_genai():
     genai.configure(api_key="YOUR_API_KEY")
 
 class PestInfo:
     
-    def __init__(self):
+    def __init__(self, knowledge_base: KnowledgeBase = None):
         logger.info("Initializing Pest Information provider")
         configure_genai()
-        # Initialize the Gemini model
-        self.model = genai.GenerativeModel('gemini-1.5-pro')
+        # Shared Gemini handle behind a deadline, concurrency limit and retries
+        self.upstream = UpstreamClient('pest_info', 'gemini-1.5-pro', JSON_GENERATION_CONFIG)
+        # Identical prompts in flight at the same time share one upstream call
+        self.inflight = SingleFlight('pest_info')
+        self.parser = StructuredOutputParser('pest_info', PEST_INFO_SCHEMA)
+        # Precomputed answers for the pest catalog (see knowledge_base.py)
+        self.knowledge_base = knowledge_base if knowledge_base is not None else KnowledgeBase(
+            'pests', prompt_checksum=prompt_checksum(self._pest_prompt)).load()
+
+    def _generate(self, prompt: str):
+        """Call the model, sharing the upstream call with identical in-flight prompts."""
+        with metrics.stage('upstream'):
+            return self.inflight.do(prompt, lambda: self.upstream.generate(prompt))
+
+    async def _generate_async(self, prompt: str):
+        """Non-blocking model call for the async server, coalesced like _generate."""
+        with metrics.stage('upstream'):
+            return await self.inflight.do_async(prompt, lambda: self.upstream.generate_async(prompt))
     
     def get_pest_information(self, pest_name: str) -> Dict[str, Any]:
-        
+        known = self.knowledge_base.get(pest_name)
+        if known is not None:
+            return known
+        return self._remember(pest_name, *self.fetch_pest_information(pest_name, with_status=True))
+
+    async def get_pest_information_async(self, pest_name: str) -> Dict[str, Any]:
+        """Async variant of get_pest_information for the ASGI server."""
+        known = self.knowledge_base.get(pest_name)
+        if known is not None:
+            return known
         try:
-            # Craft prompt for the AI
-            prompt = f"""
-            Provide detailed information about the pest "{pest_name}" with the following structure:
-            
-            1. Description: A brief 2-3 sentence explanation of what the pest is and its significance.
-            2. Causes: Bullet points of the pathogen or environmental factors that cause this pest. 
-            3. Symptoms: Bullet points of the visual symptoms and how they progress.
-            4. Treatment: Bullet points of the most effective treatments for this pest.
-            5. Prevention: Bullet points of methods to prevent this pest.
-            
-            Format your response as a JSON object with the following keys: "description", "causes", "symptoms", "treatment", "prevention".
-            The "description" value should be a concise paragraph. All other values should be in bullet point form. Do not include any introductory text or conclusion.
-            """
+            response = await self._generate_async(self._pest_prompt(pest_name))
+            info, complete = self._parse_pest_information(response.text, pest_name)
+        except Exception as e:
+            logger.error(f"Error getting AI pest information: {str(e)}")
+            info, complete = self._pest_error_fallback(pest_name), False
+        return self._remember(pest_name, info, complete)
+
+    def fetch_pest_information(self, pest_name: str, with_status: bool = False):
+        """
+        Generate the information live, bypassing the knowledge base (used to build it).
+
+        With with_status=True, returns (info, complete); complete is False for
+        fallbacks and for answers that needed repair or had sections filled in.
+        """
+        try:
+            response = self._generate(self._pest_prompt(pest_name))
+            info, complete = self._parse_pest_information(response.text, pest_name)
+        except Exception as e:
+            logger.error(f"Error getting AI pest information: {str(e)}")
+            info, complete = self._pest_error_fallback(pest_name), False
+        return (info, complete) if with_status else info
+
+    def _remember(self, pest_name: str, info: Dict[str, Any], complete: bool) -> Dict[str, Any]:
+        # Only complete answers are kept; anything else is retried on the next lookup
+        if complete:
+            self.knowledge_base.add(pest_name, info)
+        return info
+
+    def _pest_prompt(self, pest_name: str) -> str:
+        # Craft prompt for the AI
+        prompt = f"""
+        Provide detailed information about the pest "{pest_name}" with the following structure:
             
-            # Generate content
-            response = self.model.generate_content(prompt)
+        1. Description: A brief 2-3 sentence explanation of what the pest is and its significance.
+        2. Causes: Bullet points of the pathogen or environmental factors that cause this pest. 
+        3. Symptoms: Bullet points of the visual symptoms and how they progress.
+        4. Treatment: Bullet points of the most effective treatments for this pest.
+        5. Prevention: Bullet points of methods to prevent this pest.
             
-            # Extract and parse JSON from response
-            try:
-                # Find JSON content in the response
-                content = response.text
-                
-                # Extract JSON from the response if it's wrapped in markdown code blocks
-                if "```json" in content and "```" in content:
-                    json_start = content.find("```json") + 7
-                    json_end = content.rfind("```")
-                    
-                    if json_start < 0 or json_end <= 0:
-                        raise ValueError("No JSON object found in response")
-                        
-                    json_str = content[json_start:json_end].strip()
-                    pest_info = json.loads(json_str)
-                else:
-                    # Try to find JSON directly in the content
-                    json_start = content.find('{')
-                    json_end = content.rfind('}') + 1
-                    
-                    if json_start < 0 or json_end <= 0:
-                        raise ValueError("No JSON object found in response")
-                        
-                    json_str = content[json_start:json_end]
-                    pest_info = json.loads(json_str)
-                
-                # Ensure all keys exist with fallback text
-                required_keys = ["description", "causes", "symptoms", "treatment", "prevention"]
-                for key in required_keys:
-                    if key not in pest_info or not pest_info[key]:
-                        if key == "description":
-                            pest_info[key] = f"Information about {pest_name} not available."
-                        else:
-                            pest_info[key] = [f"Information about {key} for {pest_name} not available."]
+        Format your response as a JSON object with the following keys: "description", "causes", "symptoms", "treatment", "prevention".
+        The "description" value should be a concise paragraph. All other values should be in bullet point form. Do not include any introductory text or conclusion.
+        """
+        return prompt
+
+    def _parse_pest_information(self, content: str, pest_name: str) -> Tuple[Dict[str, Any], bool]:
+        # Parse (and if needed repair) the JSON response
+        try:
+            pest_info, outcome = self.parser.parse(content, with_outcome=True)
+            complete = outcome in CLEAN_OUTCOMES
+
+            # Fill in empty sections with fallback text
+            required_keys = ["description", "causes", "symptoms", "treatment", "prevention"]
+            for key in required_keys:
+                if not pest_info[key]:
+                    complete = False
+                    if key == "description":
+                        pest_info[key] = f"Information about {pest_name} not available."
+                    else:
+                        pest_info[key] = [f"Information about {key} for {pest_name} not available."]
                 
-                return pest_info
+            return pest_info, complete
                 
-            except (json.JSONDecodeError, ValueError) as e:
-                logger.error(f"Error parsing JSON: {str(e)}")
-                logger.debug(f"Raw response: {response.text}")
+        except ValueError as e:
+            logger.error(f"Error parsing JSON: {str(e)}")
+            logger.debug(f"Raw response: {content}")
                 
-                # Return fallback information in case of JSON parsing error
-                return {
-                    "pest": pest_name,
-                    "error": "Could not parse response as JSON",
-                    "description": f"Information about {pest_name} could not be retrieved.",
-                    "causes": ["Information not available due to a parsing error."],
-                    "symptoms": ["Information not available due to a parsing error."],
-                    "treatment": ["Please consult with a plant pathology expert for treatment options."],
-                    "prevention": ["Regular plant care and monitoring is recommended."]
-                }
-            
-        except Exception as e:
-            logger.error(f"Error getting AI pest information: {str(e)}")
-            # Return fallback information
+            # Return fallback information in case of JSON parsing error
             return {
                 "pest": pest_name,
-                "error": "Could not generate structured pest information",
+                "error": "Could not parse response as JSON",
                 "description": f"Information about {pest_name} could not be retrieved.",
-                "causes": ["Information not available due to an error."],
-                "symptoms": ["Information not available due to an error."],
+                "causes": ["Information not available due to a parsing error."],
+                "symptoms": ["Information not available due to a parsing error."],
                 "treatment": ["Please consult with a plant pathology expert for treatment options."],
                 "prevention": ["Regular plant care and monitoring is recommended."]
-            }
+            }, False
+
+    def _pest_error_fallback(self, pest_name: str) -> Dict[str, Any]:
+        # Fallback information when the model call fails
+        return {
+            "pest": pest_name,
+            "error": "Could not generate structured pest information",
+            "description": f"Information about {pest_name} could not be retrieved.",
+            "causes": ["Information not available due to an error."],
+            "symptoms": ["Information not available due to an error."],
+            "treatment": ["Please consult with a plant pathology expert for treatment options."],
+            "prevention": ["Regular plant care and monitoring is recommended."]
+        }
 
 
 # Example usage
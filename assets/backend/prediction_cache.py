@@ -0,0 +1,83 @@
+import os
+import threading
+from collections import OrderedDict
+from feature_pipeline import NUMERIC_FIELDS
+
+# Defaults, overridable through the environment (0 entries disables the cache)
+DEFAULT_MAX_ENTRIES = int(os.environ.get('PREDICTION_CACHE_ENTRIES', 10000))
+DEFAULT_DECIMALS = int(os.environ.get('PREDICTION_CACHE_DECIMALS', 2))
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of single-record yield predictions.
+
+    Keys are the encoded Area and Item plus the numeric inputs rounded to
+    `decimals` places, so requests that differ only below that precision
+    share an entry. The owner scores the quantize()d record, so an entry
+    holds the prediction for its key whichever request filled it.
+    The owner must clear() it (or key by version) whenever the model artifacts change.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, decimals=DEFAULT_DECIMALS):
+        self.max_entries = max_entries
+        self.decimals = decimals
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'invalidations': 0}
+
+    def quantize(self, record):
+        """
+        Copy of a record with its numeric inputs rounded to the key's precision
+        """
+        row = dict(record)
+        for field in NUMERIC_FIELDS:
+            row[field] = round(float(record[field]), self.decimals)
+        return row
+
+    def make_key(self, pipeline, record, version=None):
+        """
+        Cache key for a quantize()d record; raises ValueError for unknown categories
+
+        The model version is part of the key so a prediction finishing
+        after a hot reload can't be served for the new version.
+        """
+        return (version, pipeline.area_code(record['Area']), pipeline.item_code(record['Item'])) + \
+            tuple(record[field] for field in NUMERIC_FIELDS)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._stats['stores'] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        """
+        Hit/miss counters and current size
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['max_entries'] = self.max_entries
+            stats['decimals'] = self.decimals
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+            return stats
@@ -0,0 +1,341 @@
+import os
+import csv
+import json
+import time
+import zlib
+import random
+import hashlib
+import logging
+import sqlite3
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from structured_output import CLEAN_OUTCOMES
+
+logger = logging.getLogger(__name__)
+
+# Advisor answers generated ahead of time by the batch job below, keyed like
+# the advisor's response cache so the server can look them up directly
+PREGENERATED_DB = os.environ.get('ADVISOR_PREGENERATED_DB', 'assets/knowledge_base/advisor.sqlite3')
+
+ENDPOINTS = ('recommendations', 'farming_calendar')
+
+# Print a throughput line after this many finished tasks
+REPORT_EVERY = 25
+
+
+def prompt_checksums(advisor):
+    """
+    Fingerprint of each endpoint's prompt template, so answers from an older prompt are not served
+    """
+    templates = {
+        'recommendations': advisor._recommendations_prompt('{location}', '{crop_type}', '{climate_challenge}'),
+        'farming_calendar': advisor._farming_calendar_prompt('{location}', '{crop_type}'),
+    }
+    return {endpoint: hashlib.sha256(template.encode('utf-8')).hexdigest()[:12]
+            for endpoint, template in templates.items()}
+
+
+class PregeneratedStore:
+    """
+    SQLite table of pre-generated advisor answers, indexed by response-cache key.
+
+    Values are zlib-compressed JSON. The server opens it read-only and
+    treats a missing file as empty; rows whose prompt checksum doesn't match
+    the running prompt are ignored.
+    """
+
+    def __init__(self, path: str = PREGENERATED_DB, writable: bool = False, prompt_checksums: dict = None):
+        self.path = path
+        self.prompt_checksums = prompt_checksums or {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0}
+        self._db = None
+        try:
+            if writable:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                # Lets the server keep reading while a job writes
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS answers ("
+                    "key TEXT PRIMARY KEY, endpoint TEXT NOT NULL, location TEXT NOT NULL, "
+                    "crop_type TEXT NOT NULL, climate_challenge TEXT, prompt_checksum TEXT, "
+                    "value BLOB NOT NULL, created REAL NOT NULL)"
+                )
+                self._db.commit()
+            elif os.path.exists(path):
+                self._db = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+            else:
+                logger.info(f"No pre-generated advisor answers at {path}")
+        except sqlite3.Error as e:
+            logger.error(f"Pre-generated advisor answers unavailable: {e}")
+            self._db = None
+
+    def get(self, key: str):
+        """
+        The stored answer for a response-cache key, or None
+        """
+        if self._db is None:
+            return None
+        try:
+            with self._lock:
+                row = self._db.execute("SELECT endpoint, prompt_checksum, value FROM answers WHERE key = ?",
+                                       (key,)).fetchone()
+            if row is None:
+                outcome, value = 'misses', None
+            elif self.prompt_checksums.get(row[0], row[1]) != row[1]:
+                outcome, value = 'stale', None
+            else:
+                outcome, value = 'hits', json.loads(zlib.decompress(row[2]))
+        except (sqlite3.Error, zlib.error, ValueError) as e:
+            logger.error(f"Pre-generated answer read failed: {e}")
+            outcome, value = 'misses', None
+        with self._lock:
+            self._stats[outcome] += 1
+        return value
+
+    def put(self, key: str, endpoint: str, location: str, crop_type: str, climate_challenge, value):
+        data = zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'), 9)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, endpoint, location, crop_type, climate_challenge, self.prompt_checksums.get(endpoint),
+                 data, time.time())
+            )
+            self._db.commit()
+
+    def current_keys(self):
+        """
+        Keys already generated from the running prompts; a resumed job skips these
+        """
+        if self._db is None:
+            return set()
+        with self._lock:
+            rows = self._db.execute("SELECT key, endpoint, prompt_checksum FROM answers").fetchall()
+        return {key for key, endpoint, checksum in rows
+                if self.prompt_checksums.get(endpoint, checksum) == checksum}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['enabled'] = self._db is not None
+            if self._db is not None:
+                stats['entries'], stats['bytes'] = self._db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM answers").fetchone()
+            return stats
+
+
+class RateLimiter:
+    """
+    Spaces calls at least 1/rate seconds apart across all threads; rate=None disables it
+    """
+
+    def __init__(self, rate: float = None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """
+    Local stand-in for the Gemini model, for trying the job without an API key
+
+    Answers each prompt with a small valid document after `latency`
+    seconds, and raises for a `failure_rate` fraction of calls.
+    """
+
+    def __init__(self, latency: float = 0.2, failure_rate: float = 0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise RuntimeError("fake upstream error")
+        if 'seasonal farming calendar' in prompt:
+            document = {'seasonal_calendar': [{'season': 'Main', 'farming_activities': [{'activity': 'Planting'}]}],
+                        'annual_considerations': ['Mulching']}
+        else:
+            strategy = {'name': 'Cover crops', 'description': 'Keep soil covered', 'benefits': ['Moisture']}
+            document = {'climate_conditions': ['Hot'], 'adaptation_strategies': [strategy],
+                        'mitigation_strategies': [strategy]}
+        return _FakeResponse(json.dumps(document))
+
+
+def read_pairs(path):
+    """
+    (location, crop_type, climate_challenge) rows from a CSV with those column names
+    """
+    with open(path, newline='') as f:
+        rows = csv.DictReader(line for line in f if line.strip() and not line.startswith('#'))
+        return [(row['location'].strip(), row['crop_type'].strip(), (row.get('climate_challenge') or '').strip() or None)
+                for row in rows]
+
+
+def _tasks(advisor, pairs, endpoints):
+    """
+    One task per distinct response-cache key: (key, endpoint, location, crop_type, climate_challenge)
+    """
+    tasks = {}
+    for location, crop_type, climate_challenge in pairs:
+        if 'recommendations' in endpoints:
+            key = advisor.cache.make_key('recommendations', location, crop_type, climate_challenge)
+            tasks.setdefault(key, (key, 'recommendations', location, crop_type, climate_challenge))
+        if 'farming_calendar' in endpoints:
+            key = advisor.cache.make_key('farming_calendar', location, crop_type)
+            tasks.setdefault(key, (key, 'farming_calendar', location, crop_type, None))
+    return list(tasks.values())
+
+
+def _generate(advisor, endpoint, location, crop_type, climate_challenge, limiter, retries, backoff):
+    """
+    Generate and parse one answer, retrying upstream and parse failures with jittered exponential backoff
+
+    Answers that were truncated or needed repair count as failures, so
+    only clean ones are stored.
+    """
+    if endpoint == 'recommendations':
+        prompt = advisor._recommendations_prompt(location, crop_type, climate_challenge)
+        parser = advisor.recommendations_parser
+    else:
+        prompt = advisor._farming_calendar_prompt(location, crop_type)
+        parser = advisor.farming_calendar_parser
+
+    for attempt in range(retries + 1):
+        limiter.wait()
+        try:
+            value, outcome = parser.parse(advisor._generate(prompt).text, with_outcome=True)
+            if outcome not in CLEAN_OUTCOMES:
+                raise ValueError(f"{outcome} response")
+            return value, attempt
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            logger.warning(f"{endpoint} for {location} / {crop_type} failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def build(advisor, pairs, store, endpoints=ENDPOINTS, workers=4, rate=None, retries=3, backoff=1.0, force=False):
+    """
+    Generate advisor answers for every (location, crop_type) pair into store
+
+    Runs at most `workers` model calls at once and starts at most `rate`
+    per second. Each answer is committed as soon as it is parsed, so an
+    interrupted run loses only the calls in flight; a rerun skips keys
+    already generated from the current prompts unless force is set.
+    Failed calls are retried here, through the rate limiter, so the
+    advisor's upstream client is set not to retry on its own.
+
+    Returns a summary with counts and throughput.
+    """
+    tasks = _tasks(advisor, pairs, endpoints)
+    done_keys = set() if force else store.current_keys()
+    todo = [task for task in tasks if task[0] not in done_keys]
+    summary = {'tasks': len(tasks), 'skipped': len(tasks) - len(todo), 'generated': 0, 'failed': 0,
+               'retries': 0, 'interrupted': False}
+    print(f"{len(tasks)} answers for {len(pairs)} pairs; {summary['skipped']} already generated, {len(todo)} to go")
+
+    advisor.upstream.retries = 0
+    limiter = RateLimiter(rate)
+    started = time.perf_counter()
+
+    def report():
+        elapsed = time.perf_counter() - started
+        finished = summary['generated'] + summary['failed']
+        throughput = finished / elapsed if elapsed else 0.0
+        eta = (len(todo) - finished) / throughput if throughput else float('inf')
+        print(f"  {finished}/{len(todo)} in {elapsed:.1f}s ({throughput:.2f}/s, {summary['failed']} failed, "
+              f"eta {eta:.0f}s)")
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {pool.submit(_generate, advisor, *task[1:], limiter, retries, backoff): task for task in todo}
+        for future in as_completed(futures):
+            key, endpoint, location, crop_type, climate_challenge = futures[future]
+            try:
+                value, attempts = future.result()
+            except Exception as e:
+                summary['failed'] += 1
+                print(f"  failed  {endpoint} {location} / {crop_type}: {e}")
+            else:
+                store.put(key, endpoint, location, crop_type, climate_challenge, value)
+                summary['generated'] += 1
+                summary['retries'] += attempts
+            if (summary['generated'] + summary['failed']) % REPORT_EVERY == 0:
+                report()
+    except KeyboardInterrupt:
+        summary['interrupted'] = True
+        print("Interrupted; finished answers are saved, rerun the same command to resume")
+    finally:
+        pool.shutdown(wait=not summary['interrupted'], cancel_futures=True)
+
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    summary['per_second'] = round(summary['generated'] / summary['seconds'], 3) if summary['seconds'] else 0.0
+    report()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate advisor recommendations and farming calendars")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help="generate answers for a CSV of location,crop_type[,climate_challenge]")
+    build_parser.add_argument('pairs')
+    build_parser.add_argument('--db', default=PREGENERATED_DB)
+    build_parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    build_parser.add_argument('--workers', type=int, default=4, help="concurrent model calls")
+    build_parser.add_argument('--rate', type=float, default=None, help="max model calls started per second")
+    build_parser.add_argument('--retries', type=int, default=3)
+    build_parser.add_argument('--backoff', type=float, default=1.0, help="first retry delay in seconds")
+    build_parser.add_argument('--force', action='store_true', help="regenerate answers that already exist")
+    build_parser.add_argument('--fake-latency', type=float, default=None,
+                              help="use a local fake model with this latency instead of Gemini")
+    build_parser.add_argument('--fake-failure-rate', type=float, default=0.0)
+    stats_parser = commands.add_parser('stats', help="show what the store holds")
+    stats_parser.add_argument('--db', default=PREGENERATED_DB)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'stats':
+        print(PregeneratedStore(args.db).stats())
+        return
+
+    from climate_smart_advisor import ClimateSmartFarmingAdvisor
+    from response_cache import ResponseCache
+
+    endpoints = [endpoint.strip() for endpoint in args.endpoints.split(',')]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    # Same cache namespace as the server so keys match; nothing is cached here
+    advisor = ClimateSmartFarmingAdvisor(cache=ResponseCache('advisor', db_path=None))
+    if args.fake_latency is not None:
+        advisor.upstream.model = FakeModel(args.fake_latency, args.fake_failure_rate)
+    store = PregeneratedStore(args.db, writable=True, prompt_checksums=prompt_checksums(advisor))
+
+    summary = build(advisor, read_pairs(args.pairs), store, endpoints, args.workers, args.rate, args.retries,
+                    args.backoff, args.force)
+    print(summary)
+    print(store.stats())
+
+
+if __name__ == "__main__":
+    main()
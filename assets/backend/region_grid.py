@@ -0,0 +1,162 @@
+import os
+import csv
+import math
+import logging
+import threading
+from collections import namedtuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+REGIONS_FILE = os.environ.get('REGIONS_FILE', 'assets/knowledge_base/regions.csv')
+
+# Geohash length of a grid cell; 4 characters is about 39 x 20 km at the
+# equator, so every farm in a cell shares one region (and one cached answer)
+GEOHASH_PRECISION = int(os.environ.get('REGION_GEOHASH_PRECISION', 4))
+
+# Cells resolved to a region, kept in memory; the gazetteer is small, so
+# this bounds memory rather than saving work
+MAX_CELLS = 100000
+
+EARTH_RADIUS_KM = 6371.0
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+Region = namedtuple('Region', ['name', 'cell', 'latitude', 'longitude'])
+
+
+def geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """
+    Geohash of a point: interleaved longitude/latitude bisections, 5 bits per character
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= mid:
+            value |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def cell_center(cell):
+    """
+    (latitude, longitude) at the middle of a geohash cell
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in cell:
+        value = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            mid = (interval[0] + interval[1]) / 2
+            if value >> shift & 1:
+                interval[0] = mid
+            else:
+                interval[1] = mid
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+
+def parse_coordinates(latitude, longitude):
+    """
+    Validate request coordinates and return them as floats; raises ValueError
+    """
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        raise ValueError("latitude and longitude must be numbers")
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or math.isnan(latitude + longitude):
+        raise ValueError("latitude must be within [-90, 90] and longitude within [-180, 180]")
+    return latitude, longitude
+
+
+def read_regions(path):
+    with open(path, newline='') as f:
+        rows = csv.DictReader(line for line in f if not line.startswith('#'))
+        return [(row['name'], float(row['latitude']), float(row['longitude']), float(row['radius_km']))
+                for row in rows]
+
+
+class RegionGrid:
+    """
+    Map coordinates to a canonical region through a geohash grid.
+
+    A point is snapped to its geohash cell, and the cell (by its centre) to
+    the smallest gazetteer region covering it, so lookups are a geohash
+    computation plus a dict read once a cell has been seen. Cells outside
+    every region are named after their centre instead.
+    """
+
+    def __init__(self, path: str = REGIONS_FILE, precision: int = GEOHASH_PRECISION):
+        self.precision = precision
+        try:
+            regions = read_regions(path)
+        except (OSError, KeyError, ValueError) as e:
+            logger.error(f"Could not load region gazetteer {path}: {e}")
+            regions = []
+        self.names = [name for name, _, _, _ in regions]
+        self._lat = np.radians([lat for _, lat, _, _ in regions])
+        self._lon = np.radians([lon for _, _, lon, _ in regions])
+        self._radius = np.array([radius for _, _, _, radius in regions], dtype=float)
+        self._cells = {}
+        self._lock = threading.Lock()
+        self._stats = {'lookups': 0, 'cells': 0, 'unmatched_cells': 0}
+        logger.info(f"Loaded {len(regions)} gazetteer regions from {path}")
+
+    def _resolve_cell(self, cell):
+        lat, lon = cell_center(cell)
+        name = None
+        if self.names:
+            phi, lam = math.radians(lat), math.radians(lon)
+            # Haversine distance from the cell centre to every region centre
+            a = (np.sin((self._lat - phi) / 2) ** 2
+                 + math.cos(phi) * np.cos(self._lat) * np.sin((self._lon - lam) / 2) ** 2)
+            distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+            covering = np.flatnonzero(distance <= self._radius)
+            if len(covering):
+                # The smallest, so a state wins over the country around it
+                name = self.names[covering[np.argmin(self._radius[covering])]]
+        if name is None:
+            name = f"the area around {abs(lat):.1f}°{'N' if lat >= 0 else 'S'}, {abs(lon):.1f}°{'E' if lon >= 0 else 'W'}"
+        return Region(name, cell, round(lat, 4), round(lon, 4)), name in self.names
+
+    def locate(self, latitude, longitude) -> Region:
+        """
+        The region cell containing a point; raises ValueError for invalid coordinates
+        """
+        latitude, longitude = parse_coordinates(latitude, longitude)
+        cell = geohash(latitude, longitude, self.precision)
+        region = self._cells.get(cell)
+        if region is None:
+            region, matched = self._resolve_cell(cell)
+            with self._lock:
+                if len(self._cells) >= MAX_CELLS:
+                    self._cells.clear()
+                self._cells[cell] = region
+                self._stats['cells'] += 1
+                self._stats['unmatched_cells'] += not matched
+        with self._lock:
+            self._stats['lookups'] += 1
+        return region
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['regions'] = len(self.names)
+        stats['precision'] = self.precision
+        return stats
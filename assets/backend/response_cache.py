@@ -0,0 +1,202 @@
+import os
+import copy
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through the environment
+DEFAULT_TTL_SECONDS = int(os.environ.get('RESPONSE_CACHE_TTL', 24 * 60 * 60))
+DEFAULT_MEMORY_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MEMORY_ENTRIES', 1024))
+DEFAULT_DISK_ENTRIES = int(os.environ.get('RESPONSE_CACHE_DISK_ENTRIES', 50000))
+DEFAULT_DB_PATH = os.environ.get('RESPONSE_CACHE_DB', 'response_cache.sqlite3')
+
+# How long a write waits for another connection's lock before giving up
+SQLITE_BUSY_TIMEOUT_SECONDS = 5.0
+
+
+def normalize_part(value):
+    """
+    Normalize a prompt input so trivially different spellings share a cache entry
+    """
+    if value is None:
+        return ''
+    return ' '.join(str(value).split()).lower()
+
+
+class ResponseCache:
+    """
+    Two-tier cache for generated JSON responses.
+
+    The first tier is an in-process LRU dict; the second is a SQLite table
+    that survives restarts. Entries expire after ttl_seconds in both tiers
+    and each tier evicts its least recently used entries when full.
+    Pass db_path=None to keep the cache in memory only.
+
+    SQLite is only touched outside the memory tier's lock, so memory hits
+    never wait on disk I/O. Disk hits don't write: their access times are
+    collected and saved with the next store.
+    """
+
+    def __init__(self,
+                 namespace: str,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+                 max_disk_entries: int = DEFAULT_DISK_ENTRIES,
+                 db_path: str = DEFAULT_DB_PATH):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+
+        self._lock = threading.Lock()
+        # Serializes use of the shared connection; never held together with _lock
+        self._db_lock = threading.Lock()
+        self._accessed = {}
+        self._memory = OrderedDict()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+        self._db = None
+        if db_path:
+            try:
+                # Every namespace shares the file, each through its own connection
+                self._db = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_SECONDS * 1000)}")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                    "created REAL NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (namespace, key))"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS responses_namespace_accessed "
+                                 "ON responses (namespace, accessed)")
+                self._db.execute("CREATE INDEX IF NOT EXISTS responses_namespace_created "
+                                 "ON responses (namespace, created)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Response cache disk tier disabled: {e}")
+                self._db = None
+
+    def make_key(self, endpoint: str, *parts) -> str:
+        """
+        Build a cache key from an endpoint name and its normalized prompt inputs
+        """
+        raw = json.dumps([self.namespace, endpoint] + [normalize_part(p) for p in parts])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        """
+        Return a copy of the cached value, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return copy.deepcopy(value)
+                del self._memory[key]
+
+        value = self._disk_get(key, now)
+        with self._lock:
+            if value is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['disk_hits'] += 1
+            self._memory_set(key, value, now)
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value):
+        """
+        Store a JSON-serializable value in both tiers
+        """
+        now = time.time()
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._memory_set(key, value, now)
+            self._stats['stores'] += 1
+        self._disk_set(key, value, now)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._accessed.clear()
+                self._db.execute("DELETE FROM responses WHERE namespace = ?", (self.namespace,))
+                self._db.commit()
+
+    def stats(self):
+        """
+        Hit/miss counters and current tier sizes
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+            lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+            stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+            stats['disk_enabled'] = self._db is not None
+            return stats
+
+    def _memory_set(self, key, value, now):
+        self._memory[key] = (value, now + self.ttl_seconds)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _disk_get(self, key, now):
+        if self._db is None:
+            return None
+        try:
+            with self._db_lock:
+                row = self._db.execute("SELECT value, created FROM responses WHERE namespace = ? AND key = ?",
+                                       (self.namespace, key)).fetchone()
+                # Expired rows are left for the next store to delete
+                if row is None or row[1] + self.ttl_seconds <= now:
+                    return None
+                self._accessed[key] = now
+            return json.loads(row[0])
+        except (sqlite3.Error, json.JSONDecodeError) as e:
+            logger.error(f"Response cache read failed: {e}")
+            return None
+
+    def _disk_set(self, key, value, now):
+        if self._db is None:
+            return
+        data = json.dumps(value)
+        try:
+            with self._db_lock:
+                try:
+                    self._write(key, data, now)
+                except sqlite3.Error:
+                    self._db.rollback()
+                    raise
+        except sqlite3.Error as e:
+            logger.error(f"Response cache write failed: {e}")
+
+    def _write(self, key, data, now):
+        if self._accessed:
+            self._db.executemany("UPDATE responses SET accessed = ? WHERE namespace = ? AND key = ?",
+                                 [(accessed, self.namespace, hit) for hit, accessed in self._accessed.items()])
+            self._accessed.clear()
+        self._db.execute(
+            "INSERT OR REPLACE INTO responses (namespace, key, value, created, accessed) VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, key, data, now, now)
+        )
+        # Evict this namespace's expired rows, then its least recently used beyond the size bound
+        self._db.execute("DELETE FROM responses WHERE namespace = ? AND created <= ?",
+                         (self.namespace, now - self.ttl_seconds))
+        self._db.execute(
+            "DELETE FROM responses WHERE namespace = ? AND key IN ("
+            "SELECT key FROM responses WHERE namespace = ? ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_disk_entries)
+        )
+        self._db.commit()
@@ -1,33 +1,49 @@
 # server.py - API server for climate_smart_advisor
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import json
 import os
 import io
-from google.cloud import vision
-import tensorflow as tf
-import pandas as pd
-import numpy as np
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.model_selection import train_test_split
-import joblib
 import logging
-from climate_smart_advisor import ClimateSmartFarmingAdvisor
-from plant_disease_info import PlantDiseaseInfo
-from nutrition_planner import recommend_foods, generate_meal_plan, suggest_recipes, df
-from crop_predictor import CropYieldPredictor
+from subsystems import (advisor, disease_info, predictor, nutrition, vision_client, disease_classifier, warm_up,
+                        health_status, predict_one, image_preprocessor, detect_cache, detect_labels,
+                        DETECT_ENGINE)
+from image_preprocessing import UploadTooLarge, MAX_REQUEST_BYTES
+import single_flight
+import structured_output
+import upstream
+import metrics
+import meal_plan_engine
+from disease_classifier import DEFAULT_TOP_K
+from yield_sweep import parse_sweep, sweep_payload, SWEEP_FORMATS
 
 
 app = Flask(__name__)
+# Refuse request bodies past the /detect upload limit before reading them
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
 CORS(app)  # Enable CORS for all routes
+metrics.instrument_flask(app)
 
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "path-to-your-credentials.json"
-client = vision.ImageAnnotatorClient()
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'error': f"Request exceeds {MAX_REQUEST_BYTES} bytes"}), 413
+
+@app.before_request
+def start_warmup():
+    # Warm up in the process that actually serves requests, not at import:
+    # the debug reloader imports this module in two processes, and a WSGI
+    # server may import it before forking. No-op after the first request
+    warm_up()
+
+# Upper bound on records accepted by /predict/batch in a single request
+MAX_BATCH_RECORDS = 10000
+
+# Upper bound on plans generated by /generate-meal-plan/batch in a single request
+MAX_BATCH_PLANS = 1000
+
+# Upper bound on distinct recipes generated by /suggest-recipes/batch in a single request
+MAX_BATCH_RECIPES = 100
 
-# Initialize the advisor
-advisor = ClimateSmartFarmingAdvisor()
-disease_info = PlantDiseaseInfo()
-predictor = CropYieldPredictor(model_path='assets/models/crop_yield_model')
 
 @app.route('/recommendations', methods=['POST'])
 def get_recommendations():
@@ -41,7 +57,7 @@ def get_recommendations():
     climate_challenge = data.get('climate_challenge')  # Optional
     
     try:
-        recommendations = advisor.get_climate_smart_recommendations(
+        recommendations = advisor.get().get_climate_smart_recommendations(
             location=location,
             crop_type=crop_type,
             climate_challenge=climate_challenge
@@ -50,6 +66,43 @@ def get_recommendations():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _stream_response(events):
+    """
+    Send section events as NDJSON, or as server-sent events with ?format=sse
+
+    A failure partway through ends the stream with an error event (an SSE
+    "error" event), so clients can tell it from a finished stream.
+    """
+    sse = request.args.get('format') == 'sse'
+
+    def body():
+        try:
+            for event in events:
+                yield f"data: {json.dumps(event)}\n\n" if sse else json.dumps(event) + "\n"
+        except Exception as e:
+            app.logger.error(f"Stream failed: {str(e)}")
+            event = {'error': str(e), 'done': True}
+            yield f"event: error\ndata: {json.dumps(event)}\n\n" if sse else json.dumps(event) + "\n"
+
+    return Response(stream_with_context(body()), mimetype='text/event-stream' if sse else 'application/x-ndjson')
+
+@app.route('/recommendations/stream', methods=['POST'])
+def stream_recommendations():
+    data = request.json
+
+    if not data or 'location' not in data or 'crop_type' not in data:
+        return jsonify({'error': 'Missing required fields: location and crop_type'}), 400
+
+    try:
+        events = advisor.get().stream_climate_smart_recommendations(
+            location=data['location'],
+            crop_type=data['crop_type'],
+            climate_challenge=data.get('climate_challenge')
+        )
+        return _stream_response(events)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/adaptation_strategies', methods=['POST'])
 def get_adaptation_strategies():
     data = request.json
@@ -61,7 +114,7 @@ def get_adaptation_strategies():
     climate_challenge = data['climate_challenge']
     
     try:
-        strategies = advisor.get_specific_adaptation_strategy(
+        strategies = advisor.get().get_specific_adaptation_strategy(
             location=location,
             climate_challenge=climate_challenge
         )
@@ -80,7 +133,7 @@ def get_farming_calendar():
     crop_type = data['crop_type']
     
     try:
-        calendar = advisor.get_sustainable_farming_calendar(
+        calendar = advisor.get().get_sustainable_farming_calendar(
             location=location,
             crop_type=crop_type
         )
@@ -88,6 +141,22 @@ def get_farming_calendar():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
+@app.route('/farming_calendar/stream', methods=['POST'])
+def stream_farming_calendar():
+    data = request.json
+
+    if not data or 'location' not in data or 'crop_type' not in data:
+        return jsonify({'error': 'Missing required fields: location and crop_type'}), 400
+
+    try:
+        events = advisor.get().stream_sustainable_farming_calendar(
+            location=data['location'],
+            crop_type=data['crop_type']
+        )
+        return _stream_response(events)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/recommendations/by-coordinates', methods=['POST'])
 def get_recommendations_by_coordinates():
     data = request.json
@@ -101,14 +170,16 @@ def get_recommendations_by_coordinates():
     climate_challenge = data.get('climate_challenge')  # Optional
     
     try:
-        # You'll need to modify your advisor class to handle coordinates instead of location names
-        recommendations = advisor.get_climate_smart_recommendations_by_coordinates(
+        # Coordinates are snapped to a region cell, so nearby farms share a cached answer
+        recommendations = advisor.get().get_climate_smart_recommendations_by_coordinates(
             latitude=latitude,
             longitude=longitude,
             crop_type=crop_type,
             climate_challenge=climate_challenge
         )
         return jsonify(recommendations)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
@@ -122,7 +193,7 @@ def get_plant_disease_info():
     disease_name = data['disease_name']
     
     try:
-        result = disease_info.get_disease_information(
+        result = disease_info.get().get_disease_information(
             disease_name=disease_name
         )
         return jsonify(result)
@@ -135,8 +206,8 @@ def get_plant_disease_info():
 def api_recommend_foods():
     try:
         data = request.json
-        filtered = recommend_foods(
-            df,
+        planner = nutrition.get()
+        filtered = planner.food_db.catalog.recommend_foods(
             dietary_preference=data.get('dietary_preference'),
             min_sustainability_score=data.get('min_sustainability_score', 0),
         )
@@ -150,30 +221,59 @@ def api_recommend_foods():
 def api_generate_meal_plan():
     try:
         data = request.json
-        meal_plan = generate_meal_plan(
-            df,
-            dietary_preference=data['dietary_preference'],
-            allergies=data['allergies'],
-            duration=data['duration'],
-            max_calories=data.get('max_calories'),
-            min_sustainability_score=data.get('min_sustainability_score', 0),
-        )
+        planner = nutrition.get()
+        meal_plan = meal_plan_engine.plan_meals(planner.food_db.catalog, **meal_plan_engine.plan_options(data))
         return jsonify({'success': True, 'data': meal_plan})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
+@app.route('/generate-meal-plan/batch', methods=['POST'])
+def api_generate_meal_plan_batch():
+    try:
+        data = request.json
+        plans = data['requests']
+        if not isinstance(plans, list):
+            return jsonify({'success': False, 'error': 'requests must be a list'}), 400
+        if len(plans) > MAX_BATCH_PLANS:
+            return jsonify({'success': False, 'error': f'Too many requests: {len(plans)} (max {MAX_BATCH_PLANS})'}), 400
+        planner = nutrition.get()
+        results = meal_plan_engine.plan_meals_batch(planner.food_db.catalog, plans, seed=data.get('seed'))
+        return jsonify({'success': True, 'data': results})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
 @app.route('/suggest-recipe', methods=['POST'])
 def api_suggest_recipe():
     try:
         data = request.json
-        recipe = suggest_recipes(
+        recipe = nutrition.get().suggest_recipes(
             data['ingredient'],
             data['meal_type'],
         )
         return jsonify({'success': True, 'data': recipe})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
-    
+
+@app.route('/suggest-recipes/batch', methods=['POST'])
+def api_suggest_recipes_batch():
+    """
+    Recipes for every distinct (food, meal type) of a meal plan, streamed as each one is ready
+    """
+    try:
+        data = request.json
+        planner = nutrition.get()
+        pairs = planner.meal_plan_pairs(data['meal_plan'])
+        if len(pairs) > MAX_BATCH_RECIPES:
+            return jsonify({'success': False, 'error': f'Too many distinct meals: {len(pairs)} (max {MAX_BATCH_RECIPES})'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    def events():
+        yield from planner.suggest_recipes_batch(pairs)
+        yield {'done': True, 'recipes': len(pairs)}
+
+    return _stream_response(events())
+
 @app.route('/predict', methods=['POST'])
 def predict():
     try:
@@ -210,11 +310,12 @@ def predict():
             return jsonify({'error': f'Invalid input data: {e}', 'status': 'error'}), 400
         
         # Make prediction
-        yield_prediction = predictor.predict_yield(input_data)
+        yield_prediction, model_version = predict_one(input_data)
         
         # Return prediction
         return jsonify({
             'yield': yield_prediction,
+            'model_version': model_version,
             'status': 'success'
         })
     
@@ -225,15 +326,152 @@ def predict():
         logging.error(f"Unexpected error: {e}")
         return jsonify({'error': 'Internal server error', 'status': 'error'}), 500
     
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Score many yield records in one request
+
+    Accepts {"records": [...]} with either a list of record objects or a
+    columnar object of equal-length arrays. Results are returned in input
+    order; rows that fail validation carry their own error.
+    """
+    try:
+        data = request.json
+
+        if not data or 'records' not in data:
+            return jsonify({'error': 'Missing required field: records', 'status': 'error'}), 400
+
+        records = data['records']
+        if not isinstance(records, (list, dict)):
+            return jsonify({'error': 'records must be a list or a columnar object', 'status': 'error'}), 400
+
+        count = len(records) if isinstance(records, list) else max((len(v) for v in records.values()), default=0)
+        if count > MAX_BATCH_RECORDS:
+            return jsonify({
+                'error': f'Too many records: {count} (max {MAX_BATCH_RECORDS})',
+                'status': 'error'
+            }), 400
+
+        options = {}
+        if 'chunk_size' in data:
+            options['chunk_size'] = int(data['chunk_size'])
+        results, model_version = predictor.get().predict_yield_batch(records, with_version=True, **options)
+
+        return jsonify({
+            'results': results,
+            'count': len(results),
+            'failed': sum(1 for r in results if 'error' in r),
+            'model_version': model_version,
+            'status': 'success'
+        })
+
+    except (ValueError, TypeError) as e:
+        logging.error(f"Batch input error: {e}")
+        return jsonify({'error': str(e), 'status': 'error'}), 400
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return jsonify({'error': 'Internal server error', 'status': 'error'}), 500
+
+@app.route('/predict/sweep', methods=['POST'])
+def predict_sweep():
+    try:
+        data = request.json
+        if not data:
+            return jsonify({'error': 'Missing request body', 'status': 'error'}), 400
+
+        output_format = data.get('format', 'json')
+        if output_format not in SWEEP_FORMATS:
+            return jsonify({'error': f'Invalid format. Choose one of: {", ".join(SWEEP_FORMATS)}', 'status': 'error'}), 400
+
+        axes = parse_sweep(data)
+        grid = predictor.get().predict_yield_grid(data['Area'], data['Item'], axes)
+        payload, mimetype = sweep_payload(grid, axes, output_format)
+        if output_format == 'json':
+            return jsonify(payload)
+        return Response(payload, mimetype=mimetype)
+
+    except ValueError as e:
+        logging.error(f"Sweep input error: {e}")
+        return jsonify({'error': str(e), 'status': 'error'}), 400
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        return jsonify({'error': 'Internal server error', 'status': 'error'}), 500
+
+@app.route('/model/reload', methods=['POST'])
+def reload_model():
+    """
+    Load a yield-model version in the background and swap it in once warmed up
+
+    Optional body {"version": "..."}; defaults to the version CURRENT points
+    at. Poll /health (model.reload) for the outcome.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        # Only published versions; the id becomes a path under the model directory
+        status = predictor.get().reload(data.get('version'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'reload': status, 'model_version': predictor.get().version, 'status': 'accepted'}), 202
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """
     Health check endpoint to verify API is running
+
+    Never triggers initialization; reports which subsystems are ready.
+    """
+    return jsonify(health_status())
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """
+    Hit/miss counters for the response caches of initialized subsystems
     """
-    return jsonify({
-        'status': 'healthy',
-        'model_loaded': predictor.model is not None
-    })
+    caches = {}
+    if advisor.ready:
+        caches['advisor'] = advisor.get().cache.stats()
+        caches['region_cells'] = advisor.get().regions.stats()
+        caches['advisor_pregenerated'] = advisor.get().pregenerated.stats()
+    if predictor.ready and predictor.get().cache is not None:
+        caches['prediction'] = predictor.get().cache.stats()
+    if nutrition.ready:
+        caches['recipes'] = nutrition.get().recipe_cache.stats()
+    return jsonify(caches)
+
+@app.route('/coalescing/stats', methods=['GET'])
+def coalescing_stats():
+    """
+    Counts of upstream model calls shared by concurrent identical requests
+    """
+    return jsonify(single_flight.all_stats())
+
+@app.route('/parsing/stats', methods=['GET'])
+def parsing_stats():
+    """
+    Per-endpoint counts of direct, extracted, repaired and failed model-response parses, with time spent
+    """
+    return jsonify(structured_output.all_stats())
+
+@app.route('/upstream/stats', methods=['GET'])
+def upstream_stats():
+    """
+    Per-client model call counts: attempts, retries, hedges, timeouts and calls in flight
+    """
+    return jsonify(upstream.all_stats())
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Per-route request latency and per-stage timings in the Prometheus text format
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/detect/stats', methods=['GET'])
+def detect_stats():
+    """
+    Upload preprocessing totals (bytes saved, duplicates, time per stage) and label cache hits
+    """
+    return jsonify({'preprocessing': image_preprocessor.stats(), 'labels': detect_cache.stats()})
 
 @app.route('/detect', methods=['POST'])
 def detect():
@@ -242,25 +480,44 @@ def detect():
 
     try:
         file = request.files['file']
-        content = file.read()
+        image = image_preprocessor.prepare(file.stream)
         
         # Log file details
-        app.logger.info(f"File received: {file.filename}, size: {len(content)} bytes")
-        
+        app.logger.info(f"File received: {file.filename}, size: {image.original_bytes} bytes, "
+                        f"sending {image.sent_bytes} bytes")
+
+        if request.args.get('engine', DETECT_ENGINE) == 'local':
+            try:
+                top_k = int(request.args.get('top_k', DEFAULT_TOP_K))
+                labels = detect_labels(image, 'local', top_k,
+                                       lambda: disease_classifier.get().classify(image.content, top_k=top_k))
+                return jsonify({'labels': labels, 'engine': 'local'})
+            except Exception as e:
+                app.logger.warning(f"Local classifier failed, falling back to Vision API: {str(e)}")
+
+        def label_detection():
+            client = vision_client.get()
+            from google.cloud import vision
+            with metrics.stage('upstream'):
+                response = client.label_detection(image=vision.Image(content=image.content))
+            return [{'description': label.description, 'score': label.score} for label in response.label_annotations]
+
         try:
-            image = vision.Image(content=content)
-            response = client.label_detection(image=image)
-            labels = response.label_annotations
-            
-            results = [{'description': label.description, 'score': label.score} for label in labels]
+            results = detect_labels(image, 'vision', None, label_detection)
             return jsonify({'labels': results})
         except Exception as e:
             app.logger.error(f"Vision API error: {str(e)}")
             return jsonify({'error': f"Vision API error: {str(e)}"}), 500
             
+    except UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
     except Exception as e:
         app.logger.error(f"File processing error: {str(e)}")
         return jsonify({'error': f"File processing error: {str(e)}"}), 500
 
 if __name__ == '__main__':
+    # The reloader runs this block in both the file watcher and the serving
+    # child; only the child (WERKZEUG_RUN_MAIN) should load the backends
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warm_up()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
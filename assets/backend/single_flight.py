@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Every SingleFlight group, by name, so stats can be reported in one place
+_groups = {}
+_groups_lock = threading.Lock()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+        self.future = None
+        # Async callers currently awaiting the shared task
+        self.awaiting = 0
+        self.abandoned = False
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers that arrive while
+    it is still running wait and receive the same result object (or
+    exception), so results should be treated as read-only. Nothing is
+    cached once the call completes.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self._stats = {'calls': 0, 'executions': 0, 'coalesced': 0, 'max_waiters': 0}
+
+        with _groups_lock:
+            _groups[name] = self
+
+    def do(self, key, fn):
+        """
+        Run fn() once for all concurrent callers with the same key
+        """
+        with self._lock:
+            self._stats['calls'] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats['coalesced'] += 1
+                self._stats['max_waiters'] = max(self._stats['max_waiters'], call.waiters)
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['executions'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key, coro_fn):
+        """
+        Async counterpart of do(): await coro_fn() once for all concurrent callers
+        with the same key on the running event loop
+
+        The shared call runs in its own task, so any caller (the first one
+        included) can be cancelled without affecting the others; the task is
+        only cancelled once every caller has gone.
+        """
+        with self._lock:
+            self._stats['calls'] += 1
+            call = self._async_calls.get(key)
+            if call is not None and not call.abandoned:
+                call.waiters += 1
+                self._stats['coalesced'] += 1
+                self._stats['max_waiters'] = max(self._stats['max_waiters'], call.waiters)
+            else:
+                call = _Call()
+                self._async_calls[key] = call
+                self._stats['executions'] += 1
+
+        if call.future is None:
+            # No await since the call was registered, so no other caller on this loop has seen it yet
+            try:
+                call.future = asyncio.ensure_future(coro_fn())
+            except BaseException:
+                with self._lock:
+                    del self._async_calls[key]
+                raise
+            call.future.add_done_callback(lambda task: self._finish_async(key, call, task))
+
+        call.awaiting += 1
+        try:
+            return await asyncio.shield(call.future)
+        except asyncio.CancelledError:
+            if call.awaiting == 1 and not call.future.done():
+                call.abandoned = True
+                call.future.cancel()
+            raise
+        finally:
+            call.awaiting -= 1
+
+    def _finish_async(self, key, call, task):
+        with self._lock:
+            if self._async_calls.get(key) is call:
+                del self._async_calls[key]
+        if not task.cancelled():
+            # Mark any exception as retrieved; callers still awaiting receive it
+            task.exception()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls) + len(self._async_calls)
+            stats['waiting'] = sum(call.waiters for call in list(self._calls.values()) + list(self._async_calls.values()))
+            return stats
+
+
+def all_stats():
+    """
+    Stats for every SingleFlight group created in this process
+    """
+    with _groups_lock:
+        groups = dict(_groups)
+    return {name: group.stats() for name, group in groups.items()}
@@ -0,0 +1,263 @@
+import time
+import logging
+import argparse
+from collections import Counter
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler, LabelEncoder
+from feature_pipeline import NUMERIC_FIELDS
+
+logger = logging.getLogger(__name__)
+
+TARGET = 'hg/ha_yield'
+COLUMNS = ['Area', 'Item'] + NUMERIC_FIELDS + [TARGET]
+
+# Rows parsed per pandas read_csv chunk
+DEFAULT_CHUNK_SIZE = 100000
+DEFAULT_BATCH_SIZE = 1024
+DEFAULT_VALIDATION_FRACTION = 0.2
+# Training rows held in the cross-chunk shuffle buffer. CSVs are often
+# sorted (yield_df.csv is by Area), so batches only approach i.i.d. when the
+# buffer spans many groups; at ~40 bytes a row, 200k rows is about 8 MB
+DEFAULT_SHUFFLE_BUFFER = 200000
+
+# build_model's Adam learning rate was tuned for batches of 32; larger
+# batches take proportionally larger steps, up to this cap
+BASE_BATCH_SIZE = 32
+MAX_LEARNING_RATE = 0.01
+
+
+def _as_paths(csv_paths):
+    return [csv_paths] if isinstance(csv_paths, str) else list(csv_paths)
+
+
+def _read_chunks(path, chunk_size):
+    """
+    Yield (row_ids, chunk) for the complete rows of one CSV, chunk by chunk
+    """
+    start = 0
+    for raw in pd.read_csv(path, usecols=COLUMNS, chunksize=chunk_size):
+        row_ids = np.arange(start, start + len(raw), dtype=np.uint64)
+        start += len(raw)
+        complete = raw.notna().all(axis=1).to_numpy()
+        yield row_ids[complete], raw[complete]
+
+
+def _validation_mask(file_index, row_ids, fraction):
+    """
+    Stable pseudo-random validation split from (file, row) so both passes agree without storing it
+    """
+    mixed = (row_ids * np.uint64(2654435761) + np.uint64(file_index) * np.uint64(40503)) % np.uint64(2 ** 32)
+    return mixed.astype(np.float64) / 2 ** 32 < fraction
+
+
+def fit_preprocessing(csv_paths, chunk_size=DEFAULT_CHUNK_SIZE, validation_fraction=DEFAULT_VALIDATION_FRACTION):
+    """
+    Fit the Area/Item encoders and the feature scaler in one streaming pass
+
+    Numeric means and variances are merged chunk by chunk (Chan et al.).
+    Encoded-column statistics follow from the per-label counts once the
+    sorted class lists, and so the codes, are known.
+
+    Returns (area_encoder, item_encoder, scaler, train_rows, validation_rows).
+    """
+    area_counts, item_counts = Counter(), Counter()
+    count = 0
+    mean = np.zeros(len(NUMERIC_FIELDS))
+    m2 = np.zeros(len(NUMERIC_FIELDS))
+    validation_rows = 0
+
+    for file_index, path in enumerate(_as_paths(csv_paths)):
+        for row_ids, chunk in _read_chunks(path, chunk_size):
+            if len(chunk) == 0:
+                continue
+            area_counts.update(chunk['Area'].astype(str).value_counts().to_dict())
+            item_counts.update(chunk['Item'].astype(str).value_counts().to_dict())
+            validation_rows += int(_validation_mask(file_index, row_ids, validation_fraction).sum())
+
+            values = chunk[NUMERIC_FIELDS].to_numpy(dtype=np.float64)
+            n = len(values)
+            chunk_mean = values.mean(axis=0)
+            chunk_m2 = ((values - chunk_mean) ** 2).sum(axis=0)
+            delta = chunk_mean - mean
+            total = count + n
+            mean += delta * n / total
+            m2 += chunk_m2 + delta ** 2 * count * n / total
+            count = total
+
+    if count == 0:
+        raise ValueError("No complete training rows found")
+
+    def encoder_and_stats(counts):
+        encoder = LabelEncoder()
+        encoder.classes_ = np.array(sorted(counts), dtype=object)
+        weights = np.array([counts[label] for label in encoder.classes_], dtype=np.float64)
+        codes = np.arange(len(weights), dtype=np.float64)
+        code_mean = (codes * weights).sum() / count
+        return encoder, code_mean, (((codes - code_mean) ** 2) * weights).sum() / count
+
+    area_encoder, area_mean, area_var = encoder_and_stats(area_counts)
+    item_encoder, item_mean, item_var = encoder_and_stats(item_counts)
+
+    scaler = StandardScaler()
+    scaler.mean_ = np.concatenate([[area_mean, item_mean], mean])
+    scaler.var_ = np.concatenate([[area_var, item_var], m2 / count])
+    scale = np.sqrt(scaler.var_)
+    scaler.scale_ = np.where(scale == 0, 1.0, scale)
+    scaler.n_samples_seen_ = count
+    scaler.n_features_in_ = len(scaler.mean_)
+
+    return area_encoder, item_encoder, scaler, count - validation_rows, validation_rows
+
+
+def make_dataset(csv_paths, pipeline, subset, batch_size=DEFAULT_BATCH_SIZE, chunk_size=DEFAULT_CHUNK_SIZE,
+                 validation_fraction=DEFAULT_VALIDATION_FRACTION, shuffle_buffer=DEFAULT_SHUFFLE_BUFFER):
+    """
+    Stream one subset ('train' or 'validation') of the CSVs as a batched tf.data.Dataset
+
+    Files are read concurrently with interleave, chunks are encoded and
+    scaled by a parallel map using the fitted pipeline, and batches are
+    prefetched. Training rows are shuffled across chunks and files through
+    a buffer of shuffle_buffer rows, reshuffled every epoch.
+    """
+    import tensorflow as tf
+
+    paths = _as_paths(csv_paths)
+    validation = subset == 'validation'
+
+    def rows(path, file_index):
+        for row_ids, chunk in _read_chunks(path.decode(), chunk_size):
+            mask = _validation_mask(int(file_index), row_ids, validation_fraction)
+            chunk = chunk[mask if validation else ~mask]
+            if len(chunk):
+                yield (chunk['Area'].astype(str).to_numpy(dtype=str),
+                       chunk['Item'].astype(str).to_numpy(dtype=str),
+                       chunk[NUMERIC_FIELDS].to_numpy(dtype=np.float32),
+                       chunk[TARGET].to_numpy(dtype=np.float32))
+
+    signature = (tf.TensorSpec([None], tf.string), tf.TensorSpec([None], tf.string),
+                 tf.TensorSpec([None, len(NUMERIC_FIELDS)], tf.float32), tf.TensorSpec([None], tf.float32))
+
+    def table(codes):
+        return tf.lookup.StaticHashTable(
+            tf.lookup.KeyValueTensorInitializer(list(codes), [float(code) for code in codes.values()],
+                                                key_dtype=tf.string, value_dtype=tf.float32),
+            default_value=-1.0)
+
+    area_table, item_table = table(pipeline.area_codes), table(pipeline.item_codes)
+    multiplier = tf.constant(pipeline.multiplier)
+    offset = tf.constant(pipeline.offset)
+
+    def encode(areas, items, numeric, target):
+        features = tf.concat([area_table.lookup(areas)[:, None], item_table.lookup(items)[:, None], numeric], axis=1)
+        return features * multiplier + offset, target
+
+    files = tf.data.Dataset.from_tensor_slices((paths, list(range(len(paths)))))
+    dataset = files.interleave(
+        lambda path, file_index: tf.data.Dataset.from_generator(rows, args=(path, file_index),
+                                                                 output_signature=signature),
+        cycle_length=min(len(paths), 4), num_parallel_calls=tf.data.AUTOTUNE, deterministic=validation)
+    dataset = dataset.map(encode, num_parallel_calls=tf.data.AUTOTUNE)
+    if validation:
+        return dataset.rebatch(batch_size).prefetch(tf.data.AUTOTUNE)
+    dataset = dataset.unbatch().shuffle(shuffle_buffer, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def train_streaming(predictor, csv_paths, epochs=100, batch_size=DEFAULT_BATCH_SIZE, chunk_size=DEFAULT_CHUNK_SIZE,
+                    validation_fraction=DEFAULT_VALIDATION_FRACTION, patience=5, save=True,
+                    shuffle_buffer=DEFAULT_SHUFFLE_BUFFER):
+    """
+    Train predictor's network from CSVs without loading them into memory
+
+    Stops when validation MAE hasn't improved for `patience` epochs and
+    keeps the best weights. Returns a list of per-epoch dicts with loss,
+    MAE, wall-clock seconds and training samples per second (measured over
+    the training steps, excluding validation).
+    """
+    import tensorflow as tf
+    from feature_pipeline import FeaturePipeline
+    from crop_predictor import ModelVersion
+
+    start = time.perf_counter()
+    area_encoder, item_encoder, scaler, train_rows, validation_rows = fit_preprocessing(
+        csv_paths, chunk_size, validation_fraction)
+    print(f"Preprocessing fitted in {time.perf_counter() - start:.1f}s "
+          f"({train_rows} training rows, {validation_rows} validation rows, "
+          f"{len(area_encoder.classes_)} areas, {len(item_encoder.classes_)} items)")
+    if validation_rows == 0:
+        raise ValueError("Validation split is empty; add rows or raise validation_fraction")
+
+    pipeline = FeaturePipeline(area_encoder, item_encoder, scaler)
+    train_data = make_dataset(csv_paths, pipeline, 'train', batch_size, chunk_size, validation_fraction,
+                              shuffle_buffer)
+    validation_data = make_dataset(csv_paths, pipeline, 'validation', batch_size, chunk_size, validation_fraction)
+
+    report = []
+
+    class EpochThroughput(tf.keras.callbacks.Callback):
+        # Samples/s counts training steps only; the validation pass at the
+        # end of each epoch starts with on_test_begin
+        def on_epoch_begin(self, epoch, logs=None):
+            self.started = time.perf_counter()
+            self.training_seconds = None
+
+        def on_test_begin(self, logs=None):
+            if self.training_seconds is None:
+                self.training_seconds = time.perf_counter() - self.started
+
+        def on_epoch_end(self, epoch, logs=None):
+            seconds = time.perf_counter() - self.started
+            training_seconds = self.training_seconds or seconds
+            entry = {'epoch': epoch + 1, 'seconds': round(seconds, 3),
+                     'training_seconds': round(training_seconds, 3),
+                     'samples_per_second': round(train_rows / training_seconds, 1)}
+            entry.update({name: float(value) for name, value in (logs or {}).items()})
+            report.append(entry)
+            print(f"Epoch {epoch + 1}: {seconds:.1f}s, {entry['samples_per_second']:,.0f} samples/s, "
+                  f"mae={entry.get('mae', float('nan')):.1f}, val_mae={entry.get('val_mae', float('nan')):.1f}")
+
+    model = predictor.build_model(len(scaler.mean_))
+    base_rate = float(model.optimizer.learning_rate.numpy())
+    model.optimizer.learning_rate.assign(min(base_rate * batch_size / BASE_BATCH_SIZE, MAX_LEARNING_RATE))
+    model.fit(
+        train_data,
+        validation_data=validation_data,
+        epochs=epochs,
+        verbose=0,
+        callbacks=[
+            tf.keras.callbacks.EarlyStopping(monitor='val_mae', patience=patience, restore_best_weights=True),
+            EpochThroughput(),
+        ]
+    )
+
+    predictor._activate(ModelVersion(None, model, None, scaler, area_encoder, item_encoder))
+    if save:
+        predictor.save_model()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the crop-yield model by streaming CSV files")
+    parser.add_argument('csv', nargs='+', help="training CSV(s) with Area, Item, the numeric inputs and hg/ha_yield")
+    parser.add_argument('--model-path', default='assets/models/crop_yield_model')
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--validation-fraction', type=float, default=DEFAULT_VALIDATION_FRACTION)
+    parser.add_argument('--shuffle-buffer', type=int, default=DEFAULT_SHUFFLE_BUFFER,
+                        help="training rows shuffled together across chunks")
+    parser.add_argument('--patience', type=int, default=5, help="epochs without val_mae improvement before stopping")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from crop_predictor import CropYieldPredictor
+
+    predictor = CropYieldPredictor(model_path=args.model_path, backend='keras')
+    predictor.train_streaming(args.csv, epochs=args.epochs, batch_size=args.batch_size, chunk_size=args.chunk_size,
+                              validation_fraction=args.validation_fraction, patience=args.patience,
+                              shuffle_buffer=args.shuffle_buffer)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Ask Gemini for a bare JSON document (response_mime_type) instead of prose
+# or markdown around it; GEMINI_JSON_MODE=0 turns this off for SDKs or models
+# without it. Prompts still describe the expected shape, and every response
+# is validated locally, because the prompts' shapes are looser than what
+# the SDK's response_schema accepts.
+JSON_MODE = os.environ.get('GEMINI_JSON_MODE', '1') != '0'
+JSON_GENERATION_CONFIG = {'response_mime_type': 'application/json'} if JSON_MODE else None
+
+# Truncation repair tries cutting back to at most this many earlier element boundaries
+MAX_REPAIR_CANDIDATES = 32
+
+_FENCE = re.compile(r'```[a-zA-Z]*\s*')
+# A string (group 1 is its closing quote, absent if the text ends inside it) or a structural character
+_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*(")?|[{}\[\],]')
+_CLOSER = re.compile(r'\s*[}\]]')
+_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'number': (int, float),
+    'integer': int,
+    'boolean': bool,
+}
+
+# Parse outcomes where the whole document arrived; anything else was cut short
+COMPLETE_OUTCOMES = ('direct', 'extracted', 'repaired')
+# Complete and parsed without any repair; what long-lived stores should accept
+CLEAN_OUTCOMES = ('direct', 'extracted')
+
+# Every parser, by endpoint name, so stats can be reported in one place
+_parsers = {}
+_parsers_lock = threading.Lock()
+
+
+class StructuredOutputError(ValueError):
+    """Raised when a response can't be turned into a valid object, even after repair."""
+
+
+def _strip_fences(text):
+    """
+    The content of the first ```json fence (to the closing fence, or the end if it was cut off)
+    """
+    fence = _FENCE.search(text)
+    if fence is None:
+        return text
+    end = text.find('```', fence.end())
+    return text[fence.end():end if end >= 0 else len(text)]
+
+
+def _without(text, start, end, skipped):
+    """
+    text[start:end] minus the characters at the (sorted) skipped positions
+    """
+    parts = []
+    pos = start
+    for index in skipped:
+        if index >= end:
+            break
+        parts.append(text[pos:index])
+        pos = index + 1
+    parts.append(text[pos:end])
+    return ''.join(parts)
+
+
+def repair_candidates(text):
+    """
+    Repaired versions of a JSON object prefix, most complete first
+
+    Trailing commas are dropped and text after the top-level object is
+    ignored. If the object is truncated, the first candidate closes the
+    open string and containers where the text stops; the rest cut back to
+    successively earlier element boundaries and close from there.
+
+    Returns (candidates, truncated); truncated candidates are missing
+    whatever the model didn't get to write.
+    """
+    start = text.find('{')
+    if start < 0:
+        return [], False
+
+    stack = []
+    skipped = []
+    in_string = False
+    end = len(text)
+    # (cut position, open containers) at each point a prefix can be cut and closed
+    boundaries = []
+
+    for match in _TOKEN.finditer(text, start):
+        token = match.group()
+        if token[0] == '"':
+            if match.group(1) is None:
+                in_string = True
+                break
+        elif token in '{[':
+            stack.append(token)
+        elif token in '}]':
+            if not stack or (token == '}') != (stack[-1] == '{'):
+                end = match.start()
+                break
+            stack.pop()
+            if not stack:
+                return [_without(text, start, match.end(), skipped)], False
+            boundaries.append((match.end(), tuple(stack)))
+        else:
+            boundaries.append((match.start(), tuple(stack)))
+            if _CLOSER.match(text, match.end()):
+                skipped.append(match.start())
+
+    def closed(prefix, open_containers):
+        return prefix.rstrip().rstrip(',') + ''.join('}' if c == '{' else ']' for c in reversed(open_containers))
+
+    candidates = [closed(_without(text, start, end, skipped) + ('"' if in_string else ''), stack)]
+    for cut, open_containers in reversed(boundaries[-MAX_REPAIR_CANDIDATES:]):
+        candidates.append(closed(_without(text, start, cut, skipped), open_containers))
+    return candidates, True
+
+
+def validate(value, schema, path='$'):
+    """
+    Check value against a small JSON-schema subset and return it
+
+    Supports type, required, properties and items. A lone string where an
+    array is expected is wrapped in a list, the one shape slip the model
+    makes often enough to be worth fixing. Raises StructuredOutputError.
+    """
+    expected = schema.get('type')
+    if expected == 'array' and isinstance(value, str):
+        value = [value]
+    # bool is an int subclass but never a valid number here
+    wrong_type = expected and (not isinstance(value, _TYPES[expected])
+                               or expected in ('number', 'integer') and isinstance(value, bool))
+    if wrong_type:
+        raise StructuredOutputError(f"{path}: expected {expected}, got {type(value).__name__}")
+
+    if isinstance(value, dict):
+        for key in schema.get('required', ()):
+            if key not in value:
+                raise StructuredOutputError(f"{path}: missing required field '{key}'")
+        for key, subschema in schema.get('properties', {}).items():
+            if key in value and value[key] is not None:
+                value[key] = validate(value[key], subschema, f"{path}.{key}")
+    elif isinstance(value, list) and 'items' in schema:
+        value = [validate(item, schema['items'], f"{path}[{i}]") for i, item in enumerate(value)]
+    return value
+
+
+class StructuredOutputParser:
+    """
+    Turn one endpoint's model responses into validated objects.
+
+    Tries, in order: the whole response as JSON (what JSON mode returns),
+    the object inside markdown fences or surrounding prose, and finally
+    repair_candidates for trailing commas and truncated output, so a
+    slightly malformed generation is still usable instead of being thrown
+    away and requested again. A truncated response is still returned, but
+    its outcome is 'truncated': it can be shown, and shouldn't be cached
+    or persisted.
+    """
+
+    def __init__(self, name: str, schema: dict = None):
+        self.name = name
+        self.schema = schema
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'direct': 0, 'extracted': 0, 'repaired': 0, 'truncated': 0,
+                       'failures': 0, 'schema_failures': 0, 'parse_seconds': 0.0}
+
+        with _parsers_lock:
+            _parsers[name] = self
+
+    def parse(self, text: str, with_outcome: bool = False):
+        """
+        Parse and validate a response; raises StructuredOutputError
+
+        With with_outcome=True, returns (value, outcome), where outcome is
+        'direct', 'extracted', 'repaired' (complete, with trailing commas
+        fixed) or 'truncated' (COMPLETE_OUTCOMES lists the complete ones).
+        """
+        started = time.perf_counter()
+        outcome = 'failures'
+        try:
+            with metrics.stage('parse'):
+                value, outcome = self._decode(text or '')
+                if self.schema is not None:
+                    try:
+                        value = validate(value, self.schema)
+                    except StructuredOutputError:
+                        outcome = 'schema_failures'
+                        raise
+            return (value, outcome) if with_outcome else value
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._stats['calls'] += 1
+                self._stats[outcome] += 1
+                self._stats['parse_seconds'] += elapsed
+
+    def _decode(self, text):
+        stripped = text.strip()
+        try:
+            return json.loads(stripped), 'direct'
+        except json.JSONDecodeError:
+            pass
+
+        body = _strip_fences(stripped)
+        start, end = body.find('{'), body.rfind('}')
+        if start < 0:
+            raise StructuredOutputError("No JSON object found in response")
+        if end > start:
+            try:
+                return json.loads(body[start:end + 1]), 'extracted'
+            except json.JSONDecodeError:
+                pass
+
+        candidates, truncated = repair_candidates(body)
+        for candidate in candidates:
+            try:
+                value = json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+            logger.info(f"Repaired {'truncated' if truncated else 'malformed'} {self.name} response "
+                        f"({len(body) - len(candidate):+d} chars)")
+            return value, 'truncated' if truncated else 'repaired'
+        raise StructuredOutputError("Response is not valid JSON and could not be repaired")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['parse_seconds'] = round(stats['parse_seconds'], 6)
+        stats['mean_parse_us'] = round(stats['parse_seconds'] / stats['calls'] * 1e6, 1) if stats['calls'] else 0.0
+        return stats
+
+
+def all_stats():
+    """
+    Stats for every StructuredOutputParser created in this process
+    """
+    with _parsers_lock:
+        parsers = dict(_parsers)
+    return {name: parser.stats() for name, parser in parsers.items()}
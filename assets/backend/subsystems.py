@@ -0,0 +1,184 @@
+# subsystems.py - Lazily initialized backends shared by server.py and async_server.py
+import os
+import asyncio
+import threading
+from lazy_loader import LazySubsystem, start_warmup
+from image_preprocessing import ImagePreprocessor
+from response_cache import ResponseCache
+from single_flight import SingleFlight
+
+# /detect engine: 'vision' (Google Vision labels) or 'local' (bundled TFLite
+# classifier, falling back to Vision); requests can override with ?engine=
+DETECT_ENGINE = os.environ.get('DETECT_ENGINE', 'vision')
+
+# Comma-separated subsystems to initialize on a background thread at startup;
+# anything not listed (or everything, if empty) is initialized on first use
+WARMUP_SUBSYSTEMS = os.environ.get(
+    'WARMUP_SUBSYSTEMS',
+    'predictor,advisor,disease_info,vision,nutrition' + (',disease_classifier' if DETECT_ENGINE == 'local' else '')
+)
+
+# /predict micro-batching: concurrent requests arriving within the wait
+# window are scored in one forward pass (a request arriving alone is scored
+# at once); a batch size of 1 disables it. Off by default: the shipped
+# NumPy model scores a record in microseconds, so the hand-off to the
+# batcher thread costs more than it saves. Worth enabling (e.g. 64) for
+# the Keras backend, where each forward pass has a fixed overhead
+PREDICT_BATCH_MAX_SIZE = int(os.environ.get('PREDICT_BATCH_MAX_SIZE', 1))
+PREDICT_BATCH_MAX_WAIT_MS = float(os.environ.get('PREDICT_BATCH_MAX_WAIT_MS', 2.0))
+
+os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "path-to-your-credentials.json"
+
+# Heavy dependencies (TensorFlow, Gemini, Vision, Google Sheets) are imported
+# inside these factories so the server can answer /health immediately
+def _create_vision_client():
+    from google.cloud import vision
+    return vision.ImageAnnotatorClient()
+
+def _create_vision_async_client():
+    from google.cloud import vision
+    return vision.ImageAnnotatorAsyncClient()
+
+def _create_advisor():
+    from climate_smart_advisor import ClimateSmartFarmingAdvisor
+    return ClimateSmartFarmingAdvisor()
+
+def _create_disease_info():
+    from plant_disease_info import PlantDiseaseInfo
+    return PlantDiseaseInfo()
+
+def _create_predictor():
+    from crop_predictor import CropYieldPredictor
+    from prediction_cache import DEFAULT_MAX_ENTRIES, DEFAULT_DECIMALS
+    return CropYieldPredictor(model_path='assets/models/crop_yield_model',
+                              cache_entries=DEFAULT_MAX_ENTRIES, cache_decimals=DEFAULT_DECIMALS)
+
+def _create_disease_classifier():
+    from disease_classifier import DiseaseClassifier
+    return DiseaseClassifier(model_dir='assets/models/disease_detection_model')
+
+def _create_prediction_batcher():
+    from micro_batcher import MicroBatcher
+
+    def run(records):
+        # Look the predictor up per batch so a reloaded model is picked up
+        results, version = predictor.get().predict_yield_batch(records, with_version=True)
+        return [(r['yield'], version) if 'yield' in r else ValueError(r['error']) for r in results]
+
+    return MicroBatcher('predict', run, PREDICT_BATCH_MAX_SIZE, PREDICT_BATCH_MAX_WAIT_MS)
+
+def _load_nutrition_planner():
+    # Importing the module downloads the food database
+    import nutrition_planner
+    return nutrition_planner
+
+vision_client = LazySubsystem('vision', _create_vision_client)
+vision_async_client = LazySubsystem('vision_async', _create_vision_async_client)
+advisor = LazySubsystem('advisor', _create_advisor)
+disease_info = LazySubsystem('disease_info', _create_disease_info)
+predictor = LazySubsystem('predictor', _create_predictor)
+nutrition = LazySubsystem('nutrition', _load_nutrition_planner)
+disease_classifier = LazySubsystem('disease_classifier', _create_disease_classifier)
+prediction_batcher = LazySubsystem('prediction_batcher', _create_prediction_batcher)
+
+# /detect uploads are downscaled before labelling; labels are kept (in memory
+# only) by the upload's content hash, so a duplicate image is never sent for
+# inference twice, and concurrent identical uploads share one call
+image_preprocessor = ImagePreprocessor()
+detect_cache = ResponseCache('detect', db_path=None)
+detect_inflight = SingleFlight('detect')
+
+SUBSYSTEMS = {s.name: s for s in (predictor, advisor, disease_info, vision_client, vision_async_client, nutrition,
+                                  disease_classifier, prediction_batcher)}
+
+
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+
+
+def warm_up(names=WARMUP_SUBSYSTEMS):
+    """
+    Start background initialization of the named subsystems (comma-separated)
+
+    Only the first call in a process starts anything; later calls return the same thread.
+    """
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None:
+            selected = [SUBSYSTEMS[name.strip()] for name in names.split(',') if name.strip() in SUBSYSTEMS]
+            if selected:
+                _warmup_thread = start_warmup(selected)
+        return _warmup_thread
+
+
+def predict_one(input_data):
+    """
+    Predict the yield of one validated /predict record, batched with concurrent requests
+
+    Returns (yield, version of the model that produced it).
+    """
+    if PREDICT_BATCH_MAX_SIZE > 1:
+        return prediction_batcher.get().call(input_data)
+    return predictor.get().predict_yield(input_data, with_version=True)
+
+
+async def predict_one_async(input_data):
+    if PREDICT_BATCH_MAX_SIZE > 1:
+        if not prediction_batcher.ready:
+            await asyncio.to_thread(prediction_batcher.get)
+        return await prediction_batcher.get().call_async(input_data)
+    if not predictor.ready:
+        await asyncio.to_thread(predictor.get)
+    return await asyncio.to_thread(predictor.get().predict_yield, input_data, True)
+
+
+def detect_labels(image, engine, top_k, run):
+    """
+    Labels for a prepared upload from run(), unless an identical image was labelled already
+    """
+    key = detect_cache.make_key(engine, image.digest, top_k)
+    labels = detect_cache.get(key)
+    if labels is None:
+        labels = detect_inflight.do(key, run)
+        detect_cache.set(key, labels)
+    return labels
+
+
+async def detect_labels_async(image, engine, top_k, run):
+    """
+    Async variant of detect_labels; run() returns an awaitable
+    """
+    key = detect_cache.make_key(engine, image.digest, top_k)
+    labels = detect_cache.get(key)
+    if labels is None:
+        labels = await detect_inflight.do_async(key, run)
+        detect_cache.set(key, labels)
+    return labels
+
+
+def health_status():
+    """
+    Health payload shared by both servers; never triggers initialization
+    """
+    model_loaded = predictor.ready and predictor.get().is_loaded()
+    response = {
+        'status': 'healthy',
+        'model_loaded': model_loaded,
+        'subsystems': {name: subsystem.status() for name, subsystem in SUBSYSTEMS.items()}
+    }
+    if model_loaded:
+        model = predictor.get().model_status()
+        response['model_version'] = model['version']
+        response['model_backend'] = model['backend']
+        response['model'] = model
+        if predictor.get().cache is not None:
+            response['prediction_cache'] = predictor.get().cache.stats()
+    if disease_info.ready:
+        response['knowledge_base'] = {'diseases': disease_info.get().knowledge_base.stats()}
+    if nutrition.ready:
+        response['food_database'] = nutrition.get().food_db.status()
+    if disease_classifier.ready:
+        response['disease_classifier'] = disease_classifier.get().stats()
+    if prediction_batcher.ready:
+        response['predict_batching'] = prediction_batcher.get().stats()
+    return response
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# The backend is a flat set of modules imported by name, with asset paths
+# relative to the repository root
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_ROOT = os.path.dirname(os.path.dirname(BACKEND_DIR))
+sys.path.insert(0, BACKEND_DIR)
+
+# Keep response caches in memory and skip background initialization
+os.environ.setdefault('RESPONSE_CACHE_DB', '')
+os.environ.setdefault('WARMUP_SUBSYSTEMS', '')
@@ -0,0 +1,91 @@
+import json
+import time
+import asyncio
+import threading
+
+
+class Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class SlowModel:
+    """
+    Deliberately slow stand-in for a Gemini model: counts calls and the most run at once
+
+    latency may be a list, giving each call's latency in turn (the last one repeats).
+    error is raised instead of answering; a stream raises it halfway through.
+    """
+
+    def __init__(self, latency=0.2, document=None, error=None, text=None):
+        self.latency = latency
+        self.text = text if text is not None else json.dumps(document if document is not None else {'answer': 42})
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            if isinstance(self.latency, list):
+                return self.latency[min(self.calls, len(self.latency)) - 1]
+            return self.latency
+
+    def _exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if stream:
+            return self._chunks()
+        latency = self._enter()
+        try:
+            time.sleep(latency)
+            if self.error is not None:
+                raise self.error
+            return Response(self.text)
+        finally:
+            self._exit()
+
+    def _pieces(self, size=16):
+        pieces = [self.text[i:i + size] for i in range(0, len(self.text), size)]
+        for i, piece in enumerate(pieces):
+            if self.error is not None and i == len(pieces) // 2:
+                raise self.error
+            yield Response(piece)
+
+    def _chunks(self):
+        self._enter()
+        try:
+            yield from self._pieces()
+        finally:
+            self._exit()
+
+    async def _chunks_async(self):
+        self._enter()
+        try:
+            for chunk in self._pieces():
+                await asyncio.sleep(0)
+                yield chunk
+        finally:
+            self._exit()
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        if stream:
+            return self._chunks_async()
+        latency = self._enter()
+        try:
+            await asyncio.sleep(latency)
+            if self.error is not None:
+                raise self.error
+            return Response(self.text)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self._exit()
@@ -0,0 +1,68 @@
+import json
+import pytest
+from fakes import SlowModel
+
+pytest.importorskip('google.generativeai')
+from climate_smart_advisor import ClimateSmartFarmingAdvisor
+from pregenerated import PregeneratedStore
+from response_cache import ResponseCache
+
+STRATEGY = {'name': 'Cover crops', 'description': 'Keep soil covered'}
+VALID = {'climate_conditions': ['Hot'], 'adaptation_strategies': [STRATEGY], 'mitigation_strategies': [STRATEGY]}
+
+
+@pytest.fixture
+def advisor(tmp_path):
+    return ClimateSmartFarmingAdvisor(cache=ResponseCache('test_advisor', db_path=None),
+                                      pregenerated=PregeneratedStore(str(tmp_path / 'none.sqlite3')))
+
+
+def _cached(advisor):
+    return advisor.cache.get(advisor.cache.make_key('recommendations', 'Kedah', 'Rice', None))
+
+
+def test_clean_stream_is_validated_and_cached(advisor):
+    advisor.upstream.model = SlowModel(latency=0, document=VALID)
+    events = list(advisor.stream_climate_smart_recommendations('Kedah', 'Rice'))
+    assert events[-1] == {'done': True}
+    assert _cached(advisor) == VALID
+
+
+def test_stream_failing_the_schema_is_not_cached(advisor):
+    # Parses cleanly as JSON, but lacks the required mitigation_strategies
+    advisor.upstream.model = SlowModel(latency=0, document={'adaptation_strategies': [STRATEGY]})
+    events = list(advisor.stream_climate_smart_recommendations('Kedah', 'Rice'))
+    assert 'error' in events[-1] and events[-1]['done']
+    assert _cached(advisor) is None
+
+
+def test_truncated_stream_is_sent_but_not_cached(advisor):
+    text = json.dumps(VALID)
+    advisor.upstream.model = SlowModel(latency=0, text=text[:text.rindex('"description"')])
+    events = list(advisor.stream_climate_smart_recommendations('Kedah', 'Rice'))
+    assert events[-1] == {'done': True}
+    assert {event['section'] for event in events[:-1]} >= {'adaptation_strategies', 'mitigation_strategies'}
+    assert _cached(advisor) is None
+
+
+def test_truncated_response_is_not_cached(advisor):
+    text = json.dumps(VALID)
+    advisor.upstream.model = SlowModel(latency=0, text=text[:-20])
+    assert advisor.get_climate_smart_recommendations('Kedah', 'Rice')['mitigation_strategies']
+    assert _cached(advisor) is None
+
+    advisor.upstream.model = SlowModel(latency=0, document=VALID)
+    advisor.get_climate_smart_recommendations('Kedah', 'Rice')
+    assert _cached(advisor) == VALID
+
+
+def test_repaired_response_is_served_but_not_cached(advisor):
+    text = json.dumps(VALID)[:-1] + ', }'
+    advisor.upstream.model = SlowModel(latency=0, text=text)
+    assert advisor.get_climate_smart_recommendations('Kedah', 'Rice') == VALID
+    assert _cached(advisor) is None
+
+    advisor.upstream.model = SlowModel(latency=0, text=text)
+    events = list(advisor.stream_climate_smart_recommendations('Kedah', 'Rice'))
+    assert events[-1] == {'done': True}
+    assert _cached(advisor) is None
@@ -0,0 +1,41 @@
+import json
+import pytest
+from fakes import SlowModel
+
+pytest.importorskip('google.generativeai')
+from knowledge_base import KnowledgeBase
+from plant_disease_info import PlantDiseaseInfo
+from pest_disease_info import PestInfo
+
+INFO = {'description': 'A leaf disease', 'causes': ['Fungus'], 'symptoms': ['Spots'],
+        'treatment': ['Fungicide'], 'prevention': ['Rotation']}
+
+
+@pytest.fixture(params=[(PlantDiseaseInfo, 'diseases', 'get_disease_information'),
+                        (PestInfo, 'pests', 'get_pest_information')])
+def provider(request, tmp_path):
+    cls, kind, method = request.param
+    instance = cls(knowledge_base=KnowledgeBase(kind, str(tmp_path)).load())
+    return instance, getattr(instance, method)
+
+
+def test_clean_answer_is_remembered(provider):
+    instance, get = provider
+    instance.upstream.model = SlowModel(latency=0, document=INFO)
+    assert get('Rust') == INFO
+    assert 'Rust' in instance.knowledge_base
+
+
+@pytest.mark.parametrize('text', [
+    json.dumps(INFO)[:-40],                 # truncated: sections cut off
+    json.dumps(dict(INFO, causes=[])),      # empty section, padded with filler
+    json.dumps(INFO)[:-1] + ', }',          # complete, but needed repair
+    'not json at all',                      # parse-error fallback
+])
+def test_incomplete_answers_are_not_remembered(provider, text):
+    instance, get = provider
+    instance.upstream.model = SlowModel(latency=0, text=text)
+    info = get('Rust')
+    assert all(info[key] for key in INFO)
+    assert 'Rust' not in instance.knowledge_base
+    assert instance.knowledge_base.stats()['live_additions'] == 0
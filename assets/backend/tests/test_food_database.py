@@ -0,0 +1,66 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from food_database import FoodDatabase, LocalSheetSource, read_snapshot
+
+FOODS = [
+    {'Food Name': 'Brown rice', 'Calories': 216, 'Dietary Tags': 'vegan', 'Sustainability Score': 7},
+    {'Food Name': 'Tempeh', 'Calories': 195, 'Dietary Tags': 'vegan, high-protein', 'Sustainability Score': 9},
+    {'Food Name': 'Chicken breast', 'Calories': 165, 'Dietary Tags': '', 'Sustainability Score': ''},
+]
+
+
+class UnreachableSource:
+    def fetch_records(self):
+        raise ConnectionError("sheet unavailable")
+
+
+def _write_sheet(path, rows):
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def _memory_mapped(array):
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+
+def test_snapshot_write_mmap_reload_and_checksum_refresh(tmp_path):
+    sheet = str(tmp_path / 'foods.csv')
+    snapshots = str(tmp_path / 'snapshots')
+    _write_sheet(sheet, FOODS)
+
+    database = FoodDatabase(LocalSheetSource(sheet), snapshot_dir=snapshots, refresh_seconds=0).load()
+    first_version = database.version
+    assert len(database.df) == 3
+
+    # A restarted process serves the snapshot without reaching the sheet
+    restarted = FoodDatabase(UnreachableSource(), snapshot_dir=snapshots, refresh_seconds=0).load()
+    assert restarted.version == first_version
+    assert list(restarted.df['Food Name']) == ['Brown rice', 'Tempeh', 'Chicken breast']
+    assert _memory_mapped(restarted.df['Calories'].to_numpy())
+    # Blank sheet cells in a numeric column become NaN rather than a text column
+    assert np.isnan(restarted.df['Sustainability Score'].to_numpy()[2])
+
+    # Unchanged content keeps the version; changed content swaps in a new one
+    assert database.refresh() and database.version == first_version
+    _write_sheet(sheet, FOODS + [{'Food Name': 'Kale', 'Calories': 49, 'Dietary Tags': 'vegan',
+                                  'Sustainability Score': 8}])
+    assert database.refresh()
+    assert database.version != first_version
+    assert len(database.df) == 4 and len(database.catalog.names) == 4
+    assert read_snapshot(snapshots)[1]['version'] == database.version
+
+    # A failing source keeps the last good snapshot serving
+    database.source = UnreachableSource()
+    assert not database.refresh()
+    assert database.status()['last_refresh_error'] == 'sheet unavailable'
+    assert len(database.df) == 4
+
+
+def test_load_without_snapshot_or_source_fails(tmp_path):
+    with pytest.raises(RuntimeError):
+        FoodDatabase(UnreachableSource(), snapshot_dir=str(tmp_path / 'empty')).load()
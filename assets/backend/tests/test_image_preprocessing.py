@@ -0,0 +1,66 @@
+import io
+import os
+import pytest
+from image_preprocessing import ImagePreprocessor, MAX_REQUEST_BYTES, MAX_UPLOAD_BYTES
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def _jpeg(size, seed=0):
+    image = Image.effect_noise(size, 64 + seed).convert('RGB')
+    out = io.BytesIO()
+    image.save(out, format='JPEG', quality=95)
+    return out.getvalue()
+
+
+def test_large_images_are_kept_within_the_byte_budget():
+    uploads = [_jpeg((2000, 1500), seed) for seed in range(4)]
+    preprocessor = ImagePreprocessor(max_dimension=512, max_prepared_bytes=1)
+    sent = [preprocessor.prepare(io.BytesIO(upload)) for upload in uploads]
+    assert all(image.resized for image in sent)
+
+    # Room for two re-encoded images only: the oldest two were evicted
+    budget = len(sent[2].content) + len(sent[3].content)
+    preprocessor = ImagePreprocessor(max_dimension=512, max_prepared_bytes=budget)
+    for upload in uploads:
+        preprocessor.prepare(io.BytesIO(upload))
+    stats = preprocessor.stats()
+    assert (stats['prepared_entries'], stats['prepared_bytes']) == (2, budget)
+
+    assert preprocessor.prepare(io.BytesIO(uploads[3])).content == sent[3].content
+    preprocessor.prepare(io.BytesIO(uploads[0]))
+    assert preprocessor.stats()['duplicates'] == 1
+
+
+def test_unchanged_uploads_are_remembered_without_their_bytes():
+    upload = _jpeg((200, 150))
+    preprocessor = ImagePreprocessor(max_dimension=512)
+    first = preprocessor.prepare(io.BytesIO(upload))
+    assert not first.resized and first.content == upload
+    assert preprocessor.stats()['prepared_bytes'] == 0
+
+    again = preprocessor.prepare(io.BytesIO(upload))
+    assert again.content == upload and preprocessor.stats()['duplicates'] == 1
+
+
+def test_undecodable_uploads_are_not_kept():
+    upload = os.urandom(4096)
+    preprocessor = ImagePreprocessor()
+    for _ in range(2):
+        assert preprocessor.prepare(io.BytesIO(upload)).content == upload
+    stats = preprocessor.stats()
+    assert (stats['undecodable'], stats['duplicates'], stats['prepared_entries']) == (2, 0, 0)
+
+
+def test_servers_accept_bodies_up_to_the_upload_limit():
+    pytest.importorskip('google.generativeai')
+    import server
+    import async_server
+
+    assert MAX_REQUEST_BYTES > MAX_UPLOAD_BYTES
+    for app in (server.app, async_server.app):
+        assert app.config['MAX_CONTENT_LENGTH'] == MAX_REQUEST_BYTES
+
+    response = server.app.test_client().post('/detect', data=b'x' * (MAX_REQUEST_BYTES + 1),
+                                              content_type='multipart/form-data; boundary=x')
+    assert response.status_code == 413 and 'error' in response.get_json()
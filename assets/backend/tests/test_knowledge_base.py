@@ -0,0 +1,34 @@
+import json
+from knowledge_base import KnowledgeBase, build
+
+INFO = {'description': 'A leaf disease', 'causes': ['Fungus'], 'symptoms': ['Spots'],
+        'treatment': ['Fungicide'], 'prevention': ['Rotation']}
+
+
+def test_live_additions_are_capped(tmp_path):
+    knowledge_base = KnowledgeBase('diseases', str(tmp_path), max_live_entries=2).load()
+    assert knowledge_base.add('Leaf Blight', INFO)
+    assert knowledge_base.add('Rust', INFO)
+    assert knowledge_base.add('rust', INFO)  # same key, replaces rather than grows
+    assert not knowledge_base.add('Made Up Name', INFO)
+
+    assert 'Made Up Name' not in knowledge_base
+    lines = (tmp_path / 'diseases' / 'live.jsonl').read_text().splitlines()
+    assert len(lines) == 3 and all('Made Up Name' != json.loads(line)['name'] for line in lines)
+    stats = knowledge_base.stats()
+    assert stats['live_entries'] == 2 and stats['live_rejected'] == 1
+
+    # The cap survives a restart, and a build folds the live entries in and resets it
+    reloaded = KnowledgeBase('diseases', str(tmp_path), max_live_entries=2).load()
+    assert not reloaded.add('Another Name', INFO)
+    build('diseases', [], lambda name: (INFO, True), str(tmp_path))
+    rebuilt = KnowledgeBase('diseases', str(tmp_path), max_live_entries=2).load()
+    assert 'Rust' in rebuilt and rebuilt.add('Another Name', INFO)
+
+
+def test_build_leaves_out_incomplete_answers(tmp_path):
+    answers = {'Rust': (INFO, True), 'Leaf Blight': (dict(INFO, causes=['Information not available.']), False)}
+    document = build('diseases', list(answers), answers.get, str(tmp_path), workers=1)
+    assert document['failed'] == ['Leaf Blight']
+    knowledge_base = KnowledgeBase('diseases', str(tmp_path)).load()
+    assert knowledge_base.get('Rust') == INFO and 'Leaf Blight' not in knowledge_base
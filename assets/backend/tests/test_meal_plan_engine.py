@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+from food_catalog import FoodCatalog
+from meal_plan_engine import plan_meals, plan_meals_batch
+
+
+def _catalog(calories, scores=None, tags='Vegan'):
+    scores = scores if scores is not None else [50] * len(calories)
+    return FoodCatalog(pd.DataFrame({
+        'Food Name': [f"Food {i}" for i in range(len(calories))],
+        'Dietary Tags': [tags] * len(calories),
+        'Sustainability Score': scores,
+        'Calories': calories,
+    }))
+
+
+def _foods(plan):
+    return [food for day in plan.values() for food in day.values()]
+
+
+def _day_calories(catalog, plan):
+    calories = dict(zip(catalog.names, catalog.calories))
+    return [sum(calories[food] for food in day.values()) for day in plan.values()]
+
+
+@pytest.mark.parametrize('objective', ['random', 'sustainability'])
+def test_repeat_limit_uses_every_food_when_it_must(objective):
+    # 21 foods, 21 meals, each food at most once: the only plans use them all
+    catalog = _catalog([300] * 21, scores=list(range(21)))
+    for seed in range(100):
+        plan = plan_meals(catalog, 'Vegan', duration='weekly', max_repeats=1, objective=objective, seed=seed)
+        assert sorted(_foods(plan)) == sorted(catalog.names)
+
+
+@pytest.mark.parametrize('max_repeats', [None, 3])
+def test_calorie_budget_leaves_cheap_foods_for_later_days(max_repeats):
+    # Every day needs two of the five 100 kcal foods next to one 500 kcal food
+    catalog = _catalog([100] * 5 + [500] * 195)
+    for seed in range(50):
+        plan = plan_meals(catalog, 'Vegan', duration='weekly', daily_calorie_budget=700,
+                          max_repeats=max_repeats, seed=seed)
+        assert max(_day_calories(catalog, plan)) <= 700
+        if max_repeats:
+            assert max(_foods(plan).count(food) for food in _foods(plan)) <= max_repeats
+
+
+def test_infeasible_requests_raise():
+    catalog = _catalog([100] * 5 + [500] * 195)
+    with pytest.raises(ValueError, match="No meal plan found"):
+        plan_meals(catalog, 'Vegan', duration='weekly', daily_calorie_budget=700, max_repeats=2)
+    with pytest.raises(ValueError, match="Not enough foods"):
+        plan_meals(_catalog([300] * 20), 'Vegan', duration='weekly', max_repeats=1)
+
+
+def test_seeded_plans_are_reproducible():
+    rng = np.random.default_rng(0)
+    catalog = _catalog(rng.integers(50, 1200, 500).tolist(), rng.integers(0, 101, 500).tolist())
+    options = dict(duration='weekly', daily_calorie_budget=1500, max_repeats=2)
+    assert plan_meals(catalog, 'Vegan', seed=3, **options) == plan_meals(catalog, 'Vegan', seed=3, **options)
+    assert plan_meals(catalog, 'Vegan', seed=3, **options) != plan_meals(catalog, 'Vegan', seed=4, **options)
+
+
+def test_sustainability_objective_takes_the_best_foods_that_fit():
+    scores = list(range(30))
+    catalog = _catalog([400] * 30, scores=scores)
+    plan = plan_meals(catalog, 'Vegan', duration='weekly', max_repeats=1, objective='sustainability')
+    assert sorted(_foods(plan)) == [f"Food {i}" for i in sorted(range(9, 30), key=str)]
+
+    # A 1000 kcal budget rules out the top food next to two 400 kcal foods
+    catalog = _catalog([900, 400, 400, 400, 100, 100], scores=[100, 90, 80, 70, 10, 5])
+    plan = plan_meals(catalog, 'Vegan', duration='daily', daily_calorie_budget=1000, max_repeats=1,
+                      objective='sustainability')
+    assert sorted(_foods(plan)) == ['Food 1', 'Food 2', 'Food 4']
+
+
+def test_batch_reports_failures_per_item_and_is_reproducible():
+    catalog = _catalog([300] * 21)
+    base = {'dietary_preference': 'Vegan', 'allergies': [], 'duration': 'weekly'}
+    requests = [dict(base, max_repeats=1), dict(base, max_repeats=1, dietary_preference='Pescatarian'),
+                {'allergies': []}, dict(base, daily_calorie_budget=600, seed=5)]
+    results = plan_meals_batch(catalog, requests, seed=7)
+    assert [r['success'] for r in results] == [True, False, False, False]
+    assert results[1]['error'] == "No foods match the given filters"
+    assert results[2]['error'].startswith("Missing required field")
+    assert "No meal plan found" in results[3]['error']
+    assert plan_meals_batch(catalog, requests, seed=7) == results
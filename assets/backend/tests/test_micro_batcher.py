@@ -0,0 +1,99 @@
+import time
+import asyncio
+import threading
+import pytest
+from micro_batcher import MicroBatcher
+
+
+class Recorder:
+    """run_batch stand-in: doubles each item, records batches, and can be held on the first one"""
+
+    def __init__(self, hold_first=False):
+        self.batches = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+        if not hold_first:
+            self.release.set()
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        self.started.set()
+        self.release.wait(5)
+        return [ValueError(f"bad {item}") if item < 0 else item * 2 for item in items]
+
+
+def test_lone_request_is_not_delayed_by_the_window():
+    batcher = MicroBatcher('test', Recorder(), max_batch_size=64, max_wait_ms=500)
+    for item in range(3):
+        start = time.perf_counter()
+        assert batcher.call(item) == item * 2
+        assert time.perf_counter() - start < 0.1
+    assert batcher.stats()['batches'] == 3
+
+
+def test_results_fan_out_in_order_and_errors_stay_per_item():
+    run = Recorder(hold_first=True)
+    batcher = MicroBatcher('test', run, max_batch_size=64, max_wait_ms=50)
+    first = batcher.submit(0)
+    assert run.started.wait(5)
+    items = [5, -1, 7, 3, -2, 9]
+    futures = [batcher.submit(item) for item in items]
+    run.release.set()
+
+    assert first.result(5) == 0
+    for item, future in zip(items, futures):
+        if item < 0:
+            with pytest.raises(ValueError, match=f"bad {item}"):
+                future.result(5)
+        else:
+            assert future.result(5) == item * 2
+    assert run.batches[1] == items
+
+
+def test_batches_are_cut_at_max_batch_size():
+    run = Recorder(hold_first=True)
+    batcher = MicroBatcher('test', run, max_batch_size=4, max_wait_ms=20)
+    batcher.submit(0)
+    assert run.started.wait(5)
+    futures = [batcher.submit(item) for item in range(1, 11)]
+    run.release.set()
+
+    assert [future.result(5) for future in futures] == [item * 2 for item in range(1, 11)]
+    assert [len(batch) for batch in run.batches] == [1, 4, 4, 2]
+    assert batcher.stats()['max_batch'] == 4
+
+
+def test_batch_size_one_never_groups():
+    run = Recorder(hold_first=True)
+    batcher = MicroBatcher('test', run, max_batch_size=1, max_wait_ms=20)
+    batcher.submit(0)
+    assert run.started.wait(5)
+    futures = [batcher.submit(item) for item in range(1, 4)]
+    run.release.set()
+
+    assert [future.result(5) for future in futures] == [2, 4, 6]
+    assert [len(batch) for batch in run.batches] == [1, 1, 1, 1]
+
+
+def test_cancelled_futures_are_skipped():
+    run = Recorder(hold_first=True)
+    batcher = MicroBatcher('test', run, max_batch_size=64, max_wait_ms=20)
+    batcher.submit(0)
+    assert run.started.wait(5)
+    kept, cancelled, also_kept = batcher.submit(1), batcher.submit(2), batcher.submit(3)
+    assert cancelled.cancel()
+    run.release.set()
+
+    assert (kept.result(5), also_kept.result(5)) == (2, 6)
+    assert run.batches[1] == [1, 3] and cancelled.cancelled()
+
+
+def test_failing_batch_reaches_every_caller():
+    def run(items):
+        raise RuntimeError("model unavailable")
+
+    batcher = MicroBatcher('test', run)
+    with pytest.raises(RuntimeError, match="model unavailable"):
+        batcher.call(1)
+    with pytest.raises(RuntimeError, match="model unavailable"):
+        asyncio.run(batcher.call_async(2))
@@ -0,0 +1,49 @@
+import os
+import shutil
+import pytest
+from conftest import REPO_ROOT
+import model_registry
+
+SOURCE = os.path.join(REPO_ROOT, 'assets', 'models', 'crop_yield_model')
+
+
+@pytest.fixture
+def registry(tmp_path):
+    source = tmp_path / 'source'
+    source.mkdir()
+    for name in ('model.npz', 'scaler.joblib', 'encoders.joblib'):
+        shutil.copy(os.path.join(SOURCE, name), source / name)
+    model_path = str(tmp_path / 'registry')
+    os.makedirs(model_path)
+    manifest = model_registry.publish(model_path, str(source))
+    # A directory outside the registry that also carries a valid manifest
+    model_registry.publish(str(tmp_path / 'elsewhere'), str(source), version='outside')
+    return model_path, manifest['version']
+
+
+def test_published_version_is_accepted(registry):
+    model_path, version = registry
+    model_registry.check_published(model_path, version)
+    assert model_registry.resolve(model_path, version)[1]['version'] == version
+
+
+@pytest.mark.parametrize('version', ['../../elsewhere/versions/outside', '..', '.hidden', 'a/b', '', 42,
+                                     'deadbeef0000'])
+def test_unpublished_or_unsafe_versions_are_rejected(registry, version):
+    model_path, _ = registry
+    with pytest.raises(ValueError):
+        model_registry.check_published(model_path, version)
+    with pytest.raises(ValueError):
+        model_registry.activate(model_path, version)
+    assert model_registry.current_version(model_path) == registry[1]
+
+
+def test_reload_rejects_traversal_before_loading(registry):
+    from crop_predictor import CropYieldPredictor
+
+    model_path, version = registry
+    predictor = CropYieldPredictor(model_path=model_path, backend='numpy')
+    with pytest.raises(ValueError):
+        predictor.reload('../../elsewhere/versions/outside', background=False)
+    assert predictor.reload_status()['state'] != 'loading'
+    assert predictor.version == version
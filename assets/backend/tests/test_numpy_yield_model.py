@@ -0,0 +1,24 @@
+import os
+import numpy as np
+import pytest
+from conftest import REPO_ROOT
+from numpy_yield_model import NumpyYieldModel, export_numpy_model, verify_parity, NUMPY_MODEL_FILE
+
+MODEL_PATH = os.path.join(REPO_ROOT, 'assets', 'models', 'crop_yield_model')
+
+pytest.importorskip('tensorflow')
+joblib = pytest.importorskip('joblib')
+
+
+def test_shipped_numpy_model_matches_keras():
+    report = verify_parity(MODEL_PATH, os.path.join(MODEL_PATH, NUMPY_MODEL_FILE), samples=500)
+    assert report['max_rel_diff'] < 1e-4
+
+
+def test_export_matches_shipped_file(tmp_path):
+    exported = NumpyYieldModel.load(export_numpy_model(MODEL_PATH, str(tmp_path / NUMPY_MODEL_FILE)))
+    shipped = NumpyYieldModel.load(os.path.join(MODEL_PATH, NUMPY_MODEL_FILE))
+
+    scaler = joblib.load(os.path.join(MODEL_PATH, 'scaler.joblib'))
+    rows = scaler.mean_ + np.random.default_rng(1).standard_normal((64, len(scaler.mean_))) * scaler.scale_
+    np.testing.assert_allclose(exported.predict(rows), shipped.predict(rows), rtol=1e-6)
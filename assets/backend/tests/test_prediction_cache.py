@@ -0,0 +1,47 @@
+import os
+import pytest
+from conftest import REPO_ROOT
+from crop_predictor import CropYieldPredictor
+
+MODEL_PATH = os.path.join(REPO_ROOT, 'assets', 'models', 'crop_yield_model')
+
+
+def _record(**changes):
+    record = {'Area': 'Albania', 'Item': 'Maize', 'Year': 2000, 'average_rain_fall_mm_per_year': 1485.0,
+              'pesticides_tonnes': 121.0, 'avg_temp': 16.37}
+    record.update(changes)
+    return record
+
+
+@pytest.fixture
+def predictors():
+    cached = CropYieldPredictor(model_path=MODEL_PATH, backend='numpy', cache_entries=100, cache_decimals=1)
+    uncached = CropYieldPredictor(model_path=MODEL_PATH, backend='numpy')
+    return cached, uncached
+
+
+def test_entry_holds_the_prediction_for_its_key_whoever_fills_it(predictors):
+    cached, uncached = predictors
+    low = _record(avg_temp=16.36)
+    high = _record(avg_temp=16.44)
+    expected = uncached.predict_yield(_record(avg_temp=16.4))
+
+    # Both round to 16.4; whichever arrives first, both get the prediction for 16.4
+    for first, second in ((low, high), (high, low)):
+        cached.cache.clear()
+        assert cached.predict_yield(first) == pytest.approx(expected, rel=1e-6)
+        assert cached.predict_yield(second) == pytest.approx(expected, rel=1e-6)
+    assert cached.cache.stats()['hits'] == 2
+
+
+def test_single_and_batch_paths_agree(predictors):
+    cached, uncached = predictors
+    records = [_record(avg_temp=16.36 + 0.01 * i, pesticides_tonnes=121.04) for i in range(10)]
+    batch = [result['yield'] for result in cached.predict_yield_batch(records)]
+    cached.cache.clear()
+    single = [cached.predict_yield(record) for record in records]
+    assert batch == pytest.approx(single, rel=1e-6)
+
+    # Within the documented tolerance of the unrounded inputs
+    exact = [result['yield'] for result in uncached.predict_yield_batch(records)]
+    assert batch == pytest.approx(exact, rel=1e-2)
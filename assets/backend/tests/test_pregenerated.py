@@ -0,0 +1,111 @@
+import time
+import threading
+import pytest
+from pregenerated import PregeneratedStore, RateLimiter, FakeModel, build, prompt_checksums
+
+PAIRS = [('Kedah', 'Rice', None), ('Perak', 'Durian', 'Drought'), ('Johor', 'Oil Palm', None)]
+
+
+@pytest.fixture
+def advisor():
+    pytest.importorskip('google.generativeai')
+    from climate_smart_advisor import ClimateSmartFarmingAdvisor
+    from response_cache import ResponseCache
+
+    advisor = ClimateSmartFarmingAdvisor(cache=ResponseCache('advisor', db_path=None))
+    advisor.upstream.model = FakeModel(latency=0)
+    return advisor
+
+
+def _store(advisor, path):
+    return PregeneratedStore(str(path), writable=True, prompt_checksums=prompt_checksums(advisor))
+
+
+def test_rate_limiter_spaces_calls_across_threads():
+    limiter = RateLimiter(rate=50)
+    started = []
+
+    def call():
+        limiter.wait()
+        started.append(time.monotonic())
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Eight calls at 50/s: the last can't start before the eighth slot, 7 intervals in
+    assert max(started) - start >= 7 * 0.02
+
+
+def test_rate_limiter_disabled_does_not_wait():
+    limiter = RateLimiter(None)
+    start = time.monotonic()
+    for _ in range(100):
+        limiter.wait()
+    assert time.monotonic() - start < 0.05
+
+
+def test_rerun_resumes_from_current_keys(advisor, tmp_path):
+    store = _store(advisor, tmp_path / 'advisor.sqlite3')
+    summary = build(advisor, PAIRS[:2], store, workers=2)
+    assert summary['generated'] == 4 and summary['failed'] == 0
+    assert len(store.current_keys()) == 4
+
+    # A rerun with one new pair generates only its two answers
+    advisor.upstream.model = model = FakeModel(latency=0)
+    summary = build(advisor, PAIRS, store, workers=2)
+    assert (summary['skipped'], summary['generated'], model.calls) == (4, 2, 2)
+
+    # Answers from an older prompt are regenerated
+    stale = PregeneratedStore(str(tmp_path / 'advisor.sqlite3'), writable=True,
+                              prompt_checksums={'recommendations': 'old', 'farming_calendar': 'old'})
+    assert stale.current_keys() == set()
+    key = advisor.cache.make_key('recommendations', 'Kedah', 'Rice', None)
+    assert store.get(key)['adaptation_strategies']
+
+
+def test_build_respects_rate(advisor, tmp_path):
+    store = _store(advisor, tmp_path / 'advisor.sqlite3')
+    start = time.perf_counter()
+    summary = build(advisor, PAIRS, store, workers=6, rate=20)
+    assert summary['generated'] == 6
+    # Six calls at 20/s: the last starts at least 5 intervals after the first
+    assert time.perf_counter() - start >= 5 / 20 * 0.9
+
+
+class _FlakyModel(FakeModel):
+    """Fails each prompt's first call with a retryable upstream error"""
+
+    def __init__(self):
+        super().__init__(latency=0)
+        self.seen = set()
+
+    def generate_content(self, prompt, **kwargs):
+        if prompt not in self.seen:
+            self.seen.add(prompt)
+            self.calls += 1
+            raise ConnectionError("reset")
+        return super().generate_content(prompt, **kwargs)
+
+
+def test_failures_are_retried_once_by_the_job(advisor, tmp_path):
+    advisor.upstream.model = model = _FlakyModel()
+    summary = build(advisor, PAIRS[:1], _store(advisor, tmp_path / 'advisor.sqlite3'), backoff=0.01)
+    # One failed and one successful call per answer: the upstream client didn't retry as well
+    assert (summary['generated'], summary['retries'], model.calls) == (2, 2, 4)
+    assert advisor.upstream.stats()['retries'] == 0
+
+
+def test_truncated_answers_are_retried_not_stored(advisor, tmp_path):
+    class Truncating(FakeModel):
+        def generate_content(self, prompt, **kwargs):
+            response = super().generate_content(prompt, **kwargs)
+            response.text = response.text[:-10]
+            return response
+
+    advisor.upstream.model = Truncating(latency=0)
+    store = _store(advisor, tmp_path / 'advisor.sqlite3')
+    summary = build(advisor, PAIRS[:1], store, retries=1, backoff=0.01)
+    assert summary['failed'] == 2 and store.current_keys() == set()
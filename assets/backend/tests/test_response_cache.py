@@ -0,0 +1,60 @@
+import sqlite3
+import time
+import threading
+from response_cache import ResponseCache
+
+
+def test_namespaces_sharing_a_file_are_isolated(tmp_path):
+    db = str(tmp_path / 'cache.sqlite3')
+    advisor = ResponseCache('advisor', ttl_seconds=3600, max_disk_entries=2, db_path=db)
+    recipes = ResponseCache('recipes', ttl_seconds=0.05, max_disk_entries=2, db_path=db)
+
+    for i in range(2):
+        advisor.set(f'a{i}', {'answer': i})
+    time.sleep(0.1)
+    # A short-TTL namespace expiring and evicting its own rows leaves the other alone
+    for i in range(3):
+        recipes.set(f'r{i}', {'recipe': i})
+    recipes.clear()
+
+    reopened = ResponseCache('advisor', ttl_seconds=3600, db_path=db)
+    assert [reopened.get(f'a{i}') for i in range(2)] == [{'answer': 0}, {'answer': 1}]
+    assert sqlite3.connect(db).execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+
+def test_disk_bound_is_per_namespace(tmp_path):
+    db = str(tmp_path / 'cache.sqlite3')
+    cache = ResponseCache('advisor', max_disk_entries=2, db_path=db)
+    for i in range(4):
+        cache.set(f'k{i}', i)
+    rows = sqlite3.connect(db).execute("SELECT key FROM responses WHERE namespace = 'advisor'").fetchall()
+    assert sorted(key for key, in rows) == ['k2', 'k3']
+
+
+def test_disk_hits_defer_access_times_to_the_next_store(tmp_path):
+    db = str(tmp_path / 'cache.sqlite3')
+    writer = ResponseCache('advisor', max_disk_entries=2, db_path=db)
+    writer.set('old', 1)
+    writer.set('new', 2)
+
+    # A fresh process reads 'old' from disk; nothing is written until it stores
+    reader = ResponseCache('advisor', max_disk_entries=2, max_memory_entries=0, db_path=db)
+    changes = reader._db.total_changes
+    assert reader.get('old') == 1
+    assert reader._db.total_changes == changes
+
+    # The saved access time makes 'new' the least recently used one to evict
+    reader.set('newest', 3)
+    rows = sqlite3.connect(db).execute("SELECT key FROM responses").fetchall()
+    assert sorted(key for key, in rows) == ['newest', 'old']
+
+
+def test_memory_hits_do_not_wait_for_disk(tmp_path):
+    cache = ResponseCache('advisor', db_path=str(tmp_path / 'cache.sqlite3'))
+    cache.set('k', {'v': 1})
+    with cache._db_lock:
+        hit = threading.Thread(target=cache.get, args=('k',))
+        hit.start()
+        hit.join(1)
+        assert not hit.is_alive()
+    assert cache.stats()['memory_hits'] == 1
@@ -0,0 +1,101 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from fakes import SlowModel
+from single_flight import SingleFlight
+
+
+def test_concurrent_identical_calls_share_one_model_call():
+    model = SlowModel(latency=0.3)
+    flight = SingleFlight('test_threads')
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        results = list(pool.map(lambda _: flight.do('prompt', lambda: model.generate_content('prompt')), range(20)))
+
+    assert model.calls == 1
+    assert all(result is results[0] for result in results)
+    stats = flight.stats()
+    assert stats['executions'] == 1 and stats['coalesced'] == 19 and stats['in_flight'] == 0
+
+
+def test_errors_reach_every_waiter():
+    model = SlowModel(latency=0.2, error=RuntimeError('upstream down'))
+    flight = SingleFlight('test_errors')
+
+    def call(_):
+        try:
+            flight.do('prompt', lambda: model.generate_content('prompt'))
+        except RuntimeError as e:
+            return str(e)
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        assert list(pool.map(call, range(5))) == ['upstream down'] * 5
+    assert model.calls == 1
+
+
+def test_async_calls_share_one_model_call():
+    model = SlowModel(latency=0.2)
+    flight = SingleFlight('test_async')
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async('prompt', lambda: model.generate_content_async('prompt'))
+                                      for _ in range(50)))
+
+    results = asyncio.run(main())
+    assert model.calls == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats()['coalesced'] == 49
+
+
+def test_cancelled_leader_does_not_cancel_waiters():
+    model = SlowModel(latency=0.2)
+    flight = SingleFlight('test_cancel_leader')
+
+    async def main():
+        leader = asyncio.create_task(flight.do_async('prompt', lambda: model.generate_content_async('prompt')))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.do_async('prompt', lambda: model.generate_content_async('prompt')))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()).text == model.text
+    assert model.calls == 1 and model.cancelled == 0
+
+
+def test_call_is_cancelled_once_every_caller_has_gone():
+    model = SlowModel(latency=0.5)
+    flight = SingleFlight('test_cancel_all')
+
+    async def main():
+        tasks = [asyncio.create_task(flight.do_async('prompt', lambda: model.generate_content_async('prompt')))
+                 for _ in range(3)]
+        await asyncio.sleep(0.01)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        # A new caller starts a fresh call rather than joining the cancelled one
+        return await flight.do_async('prompt', lambda: model.generate_content_async('prompt'))
+
+    assert asyncio.run(main()).text == model.text
+    assert model.cancelled == 1 and model.calls == 2
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_advisor_coalesces_identical_recommendation_requests(tmp_path):
+    pytest.importorskip('google.generativeai')
+    from climate_smart_advisor import ClimateSmartFarmingAdvisor
+    from pregenerated import FakeModel, PregeneratedStore
+    from response_cache import ResponseCache
+
+    advisor = ClimateSmartFarmingAdvisor(cache=ResponseCache('test_advisor', db_path=None),
+                                         pregenerated=PregeneratedStore(str(tmp_path / 'none.sqlite3')))
+    advisor.upstream.model = model = FakeModel(latency=0.3)
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        results = list(pool.map(lambda _: advisor.get_climate_smart_recommendations('Kedah', 'Rice', 'drought'),
+                                range(10)))
+
+    assert model.calls == 1
+    assert all(result['adaptation_strategies'] for result in results)
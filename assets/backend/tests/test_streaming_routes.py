@@ -0,0 +1,57 @@
+import json
+import asyncio
+from types import SimpleNamespace
+import pytest
+from fakes import SlowModel
+
+pytest.importorskip('google.generativeai')
+from climate_smart_advisor import ClimateSmartFarmingAdvisor
+from pregenerated import PregeneratedStore
+from response_cache import ResponseCache
+
+STRATEGY = {'name': 'Cover crops', 'description': 'Keep soil covered'}
+VALID = {'climate_conditions': ['Hot'], 'adaptation_strategies': [STRATEGY], 'mitigation_strategies': [STRATEGY]}
+ROUTES = [('/recommendations/stream', {'location': 'Kedah', 'crop_type': 'Rice'}),
+          ('/farming_calendar/stream', {'location': 'Kedah', 'crop_type': 'Rice'})]
+
+
+@pytest.fixture
+def failing_advisor(tmp_path):
+    advisor = ClimateSmartFarmingAdvisor(cache=ResponseCache('test_stream', db_path=None),
+                                         pregenerated=PregeneratedStore(str(tmp_path / 'none.sqlite3')))
+    advisor.upstream.model = SlowModel(latency=0, document=VALID, error=ConnectionError("upstream reset"))
+    return SimpleNamespace(get=lambda: advisor, ready=True, instance=advisor)
+
+
+def _ndjson(body):
+    return [json.loads(line) for line in body.splitlines() if line]
+
+
+@pytest.mark.parametrize('route, payload', ROUTES)
+def test_flask_stream_ends_with_an_error_event(monkeypatch, failing_advisor, route, payload):
+    import server
+
+    monkeypatch.setattr(server, 'advisor', failing_advisor)
+    client = server.app.test_client()
+    events = _ndjson(client.post(route, json=payload).get_data(as_text=True))
+    assert events[-1] == {'error': 'upstream reset', 'done': True}
+    assert not any(event.get('done') for event in events[:-1])
+    assert failing_advisor.instance.cache.stats()['stores'] == 0
+
+    body = client.post(route + '?format=sse', json=payload).get_data(as_text=True)
+    assert body.endswith('event: error\ndata: {"error": "upstream reset", "done": true}\n\n')
+
+
+@pytest.mark.parametrize('route, payload', ROUTES)
+def test_quart_stream_ends_with_an_error_event(monkeypatch, failing_advisor, route, payload):
+    import async_server
+
+    monkeypatch.setattr(async_server, 'advisor', failing_advisor)
+
+    async def post(path):
+        response = await async_server.app.test_client().post(path, json=payload)
+        return (await response.get_data()).decode()
+
+    events = _ndjson(asyncio.run(post(route)))
+    assert events[-1] == {'error': 'upstream reset', 'done': True}
+    assert asyncio.run(post(route + '?format=sse')).endswith('event: error\ndata: {"error": "upstream reset", "done": true}\n\n')
@@ -0,0 +1,28 @@
+import pytest
+from structured_output import StructuredOutputParser, StructuredOutputError, COMPLETE_OUTCOMES
+
+SCHEMA = {'type': 'object', 'required': ['items'], 'properties': {'items': {'type': 'array'}}}
+
+
+@pytest.mark.parametrize('text, outcome', [
+    ('{"items": [1, 2]}', 'direct'),
+    ('Here you go:\n```json\n{"items": [1, 2]}\n```', 'extracted'),
+    ('{"items": [1, 2,],}', 'repaired'),
+])
+def test_complete_documents(text, outcome):
+    value, actual = StructuredOutputParser('test_complete').parse(text, with_outcome=True)
+    assert value == {'items': [1, 2]}
+    assert actual == outcome and actual in COMPLETE_OUTCOMES
+
+
+def test_truncated_document_is_flagged():
+    parser = StructuredOutputParser('test_truncated', SCHEMA)
+    value, outcome = parser.parse('{"items": [1, 2, {"name": "cut sho', with_outcome=True)
+    assert value['items'][:2] == [1, 2]
+    assert outcome == 'truncated' and outcome not in COMPLETE_OUTCOMES
+    assert parser.stats()['truncated'] == 1
+
+
+def test_schema_failure_raises():
+    with pytest.raises(StructuredOutputError):
+        StructuredOutputParser('test_schema', SCHEMA).parse('{"other": 1}')
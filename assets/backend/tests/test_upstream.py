@@ -0,0 +1,107 @@
+import time
+import asyncio
+import threading
+import pytest
+import upstream
+from upstream import UpstreamClient, UpstreamTimeout
+from fakes import SlowModel
+
+
+_models = []
+
+
+@pytest.fixture(autouse=True)
+def settle():
+    # Sync calls abandoned at a deadline keep running and release their slot
+    # later; let them finish before another test swaps the semaphore
+    yield
+    while any(model.in_flight for model in _models):
+        time.sleep(0.01)
+    _models.clear()
+
+
+def _client(model, **kwargs):
+    _models.append(model)
+    kwargs.setdefault('retries', 0)
+    return UpstreamClient('test_upstream', model=model, **kwargs)
+
+
+def test_hedge_fires_after_delay_and_wins():
+    # The first request stalls; the hedge sent after 0.05s answers first
+    model = SlowModel(latency=[1.0, 0.01])
+    client = _client(model, hedge_after=0.05, deadline=2.0)
+    start = time.monotonic()
+    assert client.generate('prompt').text == model.text
+    assert time.monotonic() - start < 0.5
+    stats = client.stats()
+    assert (model.calls, stats['hedges'], stats['hedge_wins']) == (2, 1, 1)
+
+
+def test_no_hedge_when_first_answers_in_time():
+    model = SlowModel(latency=0.01)
+    client = _client(model, hedge_after=0.5)
+    client.generate('prompt')
+    assert (model.calls, client.stats()['hedges']) == (1, 0)
+
+
+def test_async_hedge_fires_and_cancels_the_loser():
+    model = SlowModel(latency=[1.0, 0.01])
+    client = _client(model, hedge_after=0.05, deadline=2.0)
+    assert asyncio.run(client.generate_async('prompt')).text == model.text
+    stats = client.stats()
+    assert (stats['hedges'], stats['hedge_wins'], model.cancelled) == (1, 1, 1)
+
+
+def test_deadline_expires():
+    model = SlowModel(latency=1.0)
+    client = _client(model, deadline=0.1, retries=2)
+    start = time.monotonic()
+    with pytest.raises(UpstreamTimeout):
+        client.generate('prompt')
+    assert time.monotonic() - start < 0.5
+    stats = client.stats()
+    assert (stats['timeouts'], stats['retries']) == (1, 0)
+
+
+def test_async_deadline_expires_and_cancels_the_call():
+    model = SlowModel(latency=1.0)
+    client = _client(model, deadline=0.1)
+    with pytest.raises(UpstreamTimeout):
+        asyncio.run(client.generate_async('prompt'))
+    assert client.stats()['timeouts'] == 1 and model.cancelled == 1
+
+
+def test_semaphore_bounds_concurrency(monkeypatch):
+    monkeypatch.setattr(upstream, '_slots', threading.BoundedSemaphore(2))
+    model = SlowModel(latency=0.1)
+    client = _client(model, deadline=5.0)
+    threads = [threading.Thread(target=client.generate, args=(f'prompt {i}',)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert model.calls == 6 and model.max_in_flight == 2
+    assert client.stats()['in_flight'] == 0
+
+
+def test_waiting_for_a_slot_counts_against_the_deadline(monkeypatch):
+    monkeypatch.setattr(upstream, '_slots', threading.BoundedSemaphore(1))
+    holder = threading.Thread(target=_client(SlowModel(latency=0.5), deadline=5.0).generate, args=('slow',))
+    holder.start()
+    time.sleep(0.05)
+    client = _client(SlowModel(latency=0.01), deadline=0.1)
+    with pytest.raises(UpstreamTimeout):
+        client.generate('prompt')
+    holder.join()
+
+
+def test_async_semaphore_bounds_concurrency(monkeypatch):
+    monkeypatch.setattr(upstream, 'MAX_IN_FLIGHT', 2)
+    model = SlowModel(latency=0.05)
+    client = _client(model, deadline=5.0)
+
+    async def main():
+        await asyncio.gather(*(client.generate_async(f'prompt {i}') for i in range(6)))
+
+    asyncio.run(main())
+    assert model.calls == 6 and model.max_in_flight == 2
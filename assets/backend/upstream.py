@@ -0,0 +1,347 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import weakref
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+# Model calls allowed in flight at once across every client in the process
+# (per event loop on the async server); callers beyond this queue for a
+# slot until their deadline
+MAX_IN_FLIGHT = int(os.environ.get('UPSTREAM_MAX_IN_FLIGHT', 16))
+
+# Seconds a caller waits for an answer, retries and hedges included, by
+# client name; UPSTREAM_DEADLINES="advisor=45,recipes=20" overrides them
+DEFAULT_DEADLINE = 30.0
+DEADLINES = {'advisor': 60.0, 'disease_info': 30.0, 'pest_info': 30.0, 'recipes': 30.0}
+DEADLINES.update({name.strip(): float(seconds) for name, _, seconds in
+                  (item.partition('=') for item in os.environ.get('UPSTREAM_DEADLINES', '').split(',') if item)})
+
+RETRIES = int(os.environ.get('UPSTREAM_RETRIES', 2))
+# First retry waits up to this long (full jitter), doubling per attempt
+BACKOFF_SECONDS = float(os.environ.get('UPSTREAM_BACKOFF_SECONDS', 0.5))
+
+# Send a duplicate request when the first hasn't answered after this many
+# seconds and a slot is free; unset disables hedging
+HEDGE_AFTER = float(os.environ['UPSTREAM_HEDGE_AFTER']) if os.environ.get('UPSTREAM_HEDGE_AFTER') else None
+
+# HTTP statuses (google.api_core errors carry them as .code) worth retrying
+RETRYABLE_CODES = (408, 429, 500, 502, 503, 504)
+
+_slots = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+_async_slots = weakref.WeakKeyDictionary()
+# Sync calls run here so a caller can give up at its deadline even if the
+# SDK call doesn't; a slot is always held first, so this never queues
+_executor = ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT, thread_name_prefix='upstream')
+
+# Shared model handles, by (model name, generation config)
+_models = {}
+_models_lock = threading.Lock()
+
+# Every client, by name, so stats can be reported in one place
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class UpstreamTimeout(TimeoutError):
+    """Raised when no answer arrived (or no slot freed up) before the caller's deadline."""
+
+
+def get_model(model_name: str, generation_config: dict = None):
+    """
+    A shared genai.GenerativeModel for this name and configuration
+    """
+    key = (model_name, json.dumps(generation_config, sort_keys=True))
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            import google.generativeai as genai
+            model = _models[key] = genai.GenerativeModel(model_name, generation_config=generation_config)
+        return model
+
+
+def is_retryable(error):
+    if isinstance(error, UpstreamTimeout):
+        return False
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return getattr(error, 'code', None) in RETRYABLE_CODES
+
+
+def _loop_slots():
+    loop = asyncio.get_running_loop()
+    slots = _async_slots.get(loop)
+    if slots is None:
+        slots = _async_slots[loop] = asyncio.Semaphore(MAX_IN_FLIGHT)
+    return slots
+
+
+class UpstreamClient:
+    """
+    Deadline-bound, concurrency-limited access to one model endpoint.
+
+    generate() gives up at the client's deadline, waits for an in-flight
+    slot, retries connection errors, timeouts and 429/5xx responses with
+    jittered exponential backoff, and (with hedge_after) sends a duplicate
+    request when the first is slow, taking whichever answers first.
+    stream() only limits concurrency, since a stream can't be retried once
+    output has been sent. Pass model= to use a stub instead of Gemini.
+    """
+
+    def __init__(self, name: str, model_name: str = 'gemini-1.5-pro', generation_config: dict = None,
+                 deadline: float = None, retries: int = RETRIES, backoff: float = BACKOFF_SECONDS,
+                 hedge_after: float = HEDGE_AFTER, model=None):
+        self.name = name
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.deadline = deadline if deadline is not None else DEADLINES.get(name, DEFAULT_DEADLINE)
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_after = hedge_after
+        self._model = model
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'attempts': 0, 'retries': 0, 'hedges': 0, 'hedge_wins': 0,
+                       'timeouts': 0, 'failures': 0, 'in_flight': 0}
+
+        with _clients_lock:
+            _clients[name] = self
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = get_model(self.model_name, self.generation_config)
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+
+    def _count(self, stat, amount=1):
+        with self._lock:
+            self._stats[stat] += amount
+
+    def _retry_delay(self, error, attempt, deadline_at):
+        """
+        Seconds to wait before the next attempt, or None if error should be raised
+        """
+        if attempt >= self.retries or not is_retryable(error):
+            return None
+        delay = random.uniform(0, self.backoff * 2 ** attempt)
+        if time.monotonic() + delay >= deadline_at:
+            return None
+        logger.warning(f"{self.name} upstream call failed ({error}); retrying in {delay:.2f}s")
+        return delay
+
+    # Synchronous calls
+
+    def generate(self, prompt, **kwargs):
+        """
+        The model's response to prompt; raises UpstreamTimeout at the deadline or the last error
+        """
+        self._count('calls')
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(prompt, kwargs, deadline_at)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline_at)
+                if delay is None:
+                    self._count('timeouts' if isinstance(e, UpstreamTimeout) else 'failures')
+                    raise
+            self._count('retries')
+            attempt += 1
+            time.sleep(delay)
+
+    def _submit(self, prompt, kwargs, deadline_at, blocking=True):
+        """
+        Start one request in the executor once a slot is free; None if non-blocking and none is
+        """
+        remaining = deadline_at - time.monotonic()
+        if not _slots.acquire(blocking, timeout=max(remaining, 0) if blocking else None):
+            if blocking:
+                raise UpstreamTimeout(f"{self.name}: no upstream slot free within {self.deadline}s")
+            return None
+        self._count('attempts')
+        self._count('in_flight')
+        try:
+            return _executor.submit(self._call, prompt, kwargs, remaining)
+        except Exception:
+            self._release()
+            raise
+
+    def _release(self):
+        self._count('in_flight', -1)
+        _slots.release()
+
+    def _call(self, prompt, kwargs, timeout):
+        try:
+            return self.model.generate_content(prompt, request_options={'timeout': timeout}, **kwargs)
+        finally:
+            self._release()
+
+    def _attempt(self, prompt, kwargs, deadline_at):
+        primary = self._submit(prompt, kwargs, deadline_at)
+        pending = {primary}
+        if self.hedge_after is not None:
+            done, _ = wait(pending, timeout=min(self.hedge_after, max(deadline_at - time.monotonic(), 0)))
+            if not done and time.monotonic() < deadline_at:
+                hedge = self._submit(prompt, kwargs, deadline_at, blocking=False)
+                if hedge is not None:
+                    self._count('hedges')
+                    pending.add(hedge)
+
+        error = None
+        while pending:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count('hedge_wins')
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+        # Calls still running finish in the background and free their slots
+        raise UpstreamTimeout(f"{self.name}: no upstream response within {self.deadline}s")
+
+    def stream(self, prompt, **kwargs):
+        """
+        Iterate a streamed response while holding an in-flight slot
+        """
+        if not _slots.acquire(timeout=self.deadline):
+            self._count('timeouts')
+            raise UpstreamTimeout(f"{self.name}: no upstream slot free within {self.deadline}s")
+        self._count('calls')
+        self._count('attempts')
+        self._count('in_flight')
+        try:
+            yield from self.model.generate_content(prompt, stream=True, request_options={'timeout': self.deadline},
+                                                   **kwargs)
+        finally:
+            self._release()
+
+    # Asynchronous calls, for the ASGI server
+
+    async def generate_async(self, prompt, **kwargs):
+        """
+        Async variant of generate
+        """
+        self._count('calls')
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                return await self._attempt_async(prompt, kwargs, deadline_at)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline_at)
+                if delay is None:
+                    self._count('timeouts' if isinstance(e, UpstreamTimeout) else 'failures')
+                    raise
+            self._count('retries')
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _call_async(self, prompt, kwargs, deadline_at, slots):
+        try:
+            self._count('attempts')
+            self._count('in_flight')
+            remaining = deadline_at - time.monotonic()
+            return await asyncio.wait_for(
+                self.model.generate_content_async(prompt, request_options={'timeout': remaining}, **kwargs),
+                remaining)
+        finally:
+            self._count('in_flight', -1)
+            slots.release()
+
+    async def _start_async(self, prompt, kwargs, deadline_at, blocking=True):
+        slots = _loop_slots()
+        if not blocking and slots.locked():
+            return None
+        try:
+            await asyncio.wait_for(slots.acquire(), max(deadline_at - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise UpstreamTimeout(f"{self.name}: no upstream slot free within {self.deadline}s")
+        return asyncio.ensure_future(self._call_async(prompt, kwargs, deadline_at, slots))
+
+    async def _attempt_async(self, prompt, kwargs, deadline_at):
+        primary = await self._start_async(prompt, kwargs, deadline_at)
+        pending = {primary}
+        try:
+            if self.hedge_after is not None:
+                done, _ = await asyncio.wait(pending, timeout=min(self.hedge_after, max(deadline_at - time.monotonic(), 0)))
+                if not done and time.monotonic() < deadline_at:
+                    hedge = await self._start_async(prompt, kwargs, deadline_at, blocking=False)
+                    if hedge is not None:
+                        self._count('hedges')
+                        pending.add(hedge)
+
+            error = None
+            while pending:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count('hedge_wins')
+                        return task.result()
+                    error = task.exception()
+            if isinstance(error, asyncio.TimeoutError):
+                error = None
+            if error is not None and not pending:
+                raise error
+            raise UpstreamTimeout(f"{self.name}: no upstream response within {self.deadline}s")
+        finally:
+            # Unlike threads, the losing or timed-out requests can be cancelled
+            for task in pending:
+                task.cancel()
+
+    async def stream_async(self, prompt, **kwargs):
+        """
+        Async variant of stream
+        """
+        slots = _loop_slots()
+        try:
+            await asyncio.wait_for(slots.acquire(), self.deadline)
+        except asyncio.TimeoutError:
+            self._count('timeouts')
+            raise UpstreamTimeout(f"{self.name}: no upstream slot free within {self.deadline}s")
+        self._count('calls')
+        self._count('attempts')
+        self._count('in_flight')
+        try:
+            response = await self.model.generate_content_async(prompt, stream=True,
+                                                               request_options={'timeout': self.deadline}, **kwargs)
+            async for chunk in response:
+                yield chunk
+        finally:
+            self._count('in_flight', -1)
+            slots.release()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['deadline_seconds'] = self.deadline
+        stats['hedge_after'] = self.hedge_after
+        return stats
+
+
+def all_stats():
+    """
+    Stats for every UpstreamClient created in this process, plus the shared slot limit
+    """
+    with _clients_lock:
+        clients = dict(_clients)
+    stats = {name: client.stats() for name, client in clients.items()}
+    stats['max_in_flight'] = MAX_IN_FLIGHT
+    return stats
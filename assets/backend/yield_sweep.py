@@ -0,0 +1,80 @@
+import io
+import numpy as np
+from feature_pipeline import NUMERIC_FIELDS
+
+# Upper bound on grid points evaluated by a single /predict/sweep request
+MAX_SWEEP_POINTS = 1000000
+
+# Output formats: a dense nested JSON array, a raw .npy array, or a compressed .npz with the axes
+SWEEP_FORMATS = ('json', 'npy', 'npz')
+
+
+def sweep_axis(field, spec):
+    """
+    Values of one sweep axis
+
+    spec is a number, a list of numbers, {"start", "stop", "num"} for num
+    evenly spaced values, or {"start", "stop", "step"}; both range forms
+    include stop.
+    """
+    try:
+        if isinstance(spec, dict):
+            start, stop = float(spec['start']), float(spec['stop'])
+            if 'num' in spec:
+                num = int(spec['num'])
+            else:
+                step = float(spec['step'])
+                if step <= 0:
+                    raise ValueError("step must be positive")
+                num = int(np.floor((stop - start) / step + 1e-9)) + 1
+            # Checked before allocating so a huge range can't exhaust memory
+            if num > MAX_SWEEP_POINTS:
+                raise ValueError(f"{num} values (max {MAX_SWEEP_POINTS})")
+            values = np.linspace(start, stop, num) if 'num' in spec else start + step * np.arange(max(num, 0))
+        elif isinstance(spec, list):
+            values = np.asarray(spec, dtype=np.float64)
+        else:
+            values = np.asarray([float(spec)])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid sweep values for {field}: {e}")
+
+    if values.ndim != 1 or len(values) == 0:
+        raise ValueError(f"Sweep values for {field} must be a non-empty list")
+    return values
+
+
+def parse_sweep(data):
+    """
+    Read the grid axes (in NUMERIC_FIELDS order) from a /predict/sweep request body
+    """
+    for field in ('Area', 'Item') + tuple(NUMERIC_FIELDS):
+        if field not in data:
+            raise ValueError(f"Missing required field: {field}")
+
+    axes = {field: sweep_axis(field, data[field]) for field in NUMERIC_FIELDS}
+    points = int(np.prod([len(values) for values in axes.values()]))
+    if points > MAX_SWEEP_POINTS:
+        raise ValueError(f"Too many grid points: {points} (max {MAX_SWEEP_POINTS})")
+    return axes
+
+
+def sweep_payload(grid, axes, output_format):
+    """
+    Encode a sweep result; returns (payload, mimetype) where payload is a dict for JSON, else bytes
+    """
+    if output_format == 'json':
+        return {
+            'dims': list(NUMERIC_FIELDS),
+            'axes': {field: values.tolist() for field, values in axes.items()},
+            'shape': list(grid.shape),
+            'yield': grid.tolist(),
+            'status': 'success'
+        }, 'application/json'
+
+    buffer = io.BytesIO()
+    if output_format == 'npy':
+        np.save(buffer, grid, allow_pickle=False)
+    else:
+        np.savez_compressed(buffer, **{'yield': grid, 'dims': np.asarray(NUMERIC_FIELDS)},
+                            **{f'axis_{field}': values for field, values in axes.items()})
+    return buffer.getvalue(), 'application/octet-stream'